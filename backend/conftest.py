@@ -0,0 +1,14 @@
+import pytest
+from django.core.cache import cache
+
+
+@pytest.fixture(autouse=True)
+def strict_query_budgets(settings):
+    # exceeding a budget fails the test
+    settings.QUERY_BUDGET_STRICT = True
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # the local memory cache would otherwise be shared between the tests
+    cache.clear()
@@ -1,9 +1,23 @@
-from typing import List, cast
+from typing import Any, Dict, List, Optional
 from django import forms
 from django.contrib import admin, messages
+from django.contrib.admin import helpers
 from django.contrib.postgres.aggregates import StringAgg
+from django.db.models import Count, Prefetch
 from django.db.models.query import QuerySet
-
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils.text import smart_split
+
+from registration.demand import CAPACITY_CACHE_TIMEOUT, PRIORITIES, capacity_overview
+from registration.duplicates import DEFAULT_MIN_SCORE, find_duplicates
+from registration.export import streaming_export
+from registration.mails import PLACEHOLDERS, MailTemplateError, Template
+from registration.pagination import KeysetPaginationMixin
+from registration.reassign import ReassignError, reassign
+from registration.rollover import RolloverError, clone_sessions, rollover
+from registration.text import normalize
 
 from registration.models import (
     Person,
@@ -19,6 +33,33 @@ from registration.models import (
 )
 
 
+class DisplayRelatedListFilter(admin.RelatedFieldListFilter):
+    """Reads the choices using for_display(), so their names don't need
+    a query per choice.
+    """
+
+    def field_choices(self, field, request, model_admin):
+        queryset = field.related_model._default_manager.for_display()
+        ordering = self.field_admin_ordering(field, request, model_admin)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return [(obj.pk, str(obj)) for obj in queryset]
+
+
+class ForDisplayMixin:
+    """Reads the choices of relations using for_display(), when the
+    related model supports it.
+    """
+
+    def get_field_queryset(self, db, db_field, request):
+        queryset = super().get_field_queryset(db, db_field, request)
+        if queryset is None:
+            queryset = db_field.remote_field.model._default_manager.using(db).all()
+        if hasattr(queryset, "for_display"):
+            return queryset.for_display()
+        return queryset
+
+
 class ExchangeSessionInline(admin.TabularInline):
     model = ExchangeSession
     show_change_link = True
@@ -29,6 +70,14 @@ class ExchangeSessionInline(admin.TabularInline):
     max_num = 0
     ordering = ["exchange__begin"]
 
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .for_display()
+            .annotate(_assigned_count=Count("assigned"))
+        )
+
 
 class DepartmentDescriptionInline(admin.TabularInline):
     model = DepartmentDescription
@@ -39,12 +88,13 @@ class DepartmentAdmin(admin.ModelAdmin):
     list_display = ["slug", "name"]
 
     inlines = [DepartmentDescriptionInline, ExchangeSessionInline]
-    filter_horizontal = ["contact_persons"]
+    autocomplete_fields = ["contact_persons"]
+    search_fields = ["slug", "description__name"]
 
     def get_queryset(self, request):
-        queryset = super().get_queryset(request)
+        queryset = super().get_queryset(request).for_display()
         queryset = queryset.annotate(
-            _name=StringAgg("description__name", " / "),
+            _name=StringAgg("description__name", " / ", default=""),
         ).order_by("_name")
         return queryset
 
@@ -55,65 +105,129 @@ class ExchangeDescriptionInline(admin.TabularInline):
 
 
 class ExchangeAdmin(admin.ModelAdmin):
+    actions = ["rollover_exchange"]
     inlines = [ExchangeDescriptionInline, ExchangeSessionInline]
     ordering = ["begin"]
     list_display = ["__str__", "active"]
 
+    @admin.action(description="Roll over to the next year")
+    def rollover_exchange(self, request, queryset):
+        for source in queryset:
+            try:
+                exchange, result = rollover(source)
+            except RolloverError as error:
+                messages.error(request, str(error))
+                continue
+
+            messages.success(
+                request,
+                f"Copied {source} to {exchange}: {result.sessions} sessions, "
+                f"{result.descriptions} descriptions and "
+                f"{result.organizers} organizers.",
+            )
+
 
 class ExchangeSessionDescriptionInline(admin.StackedInline):
     model = ExchangeSessionDescription
     max_num = 2
 
 
-class ExchangeSessionAdmin(admin.ModelAdmin):
+class ExchangeSessionAdmin(ForDisplayMixin, admin.ModelAdmin):
     actions = ["copy_exchange"]
     list_display = ["department", "titles", "subtitles", "exchange"]
-    list_filter = ["exchange", "department"]
+    list_filter = ["exchange", ("department", DisplayRelatedListFilter)]
     inlines = [ExchangeSessionDescriptionInline]
-    filter_horizontal = ["assigned", "organizers"]
+    autocomplete_fields = ["organizers"]
     readonly_fields = ["assigned"]
+    search_fields = ["description__title", "department__description__name"]
 
     def get_queryset(self, request):
-        queryset = super().get_queryset(request)
+        queryset = super().get_queryset(request).for_display()
         queryset = queryset.annotate(
-            _name=StringAgg("department__description__name", " / "),
+            _name=StringAgg("department__description__name", " / ", default=""),
         ).order_by("exchange", "_name")
         return queryset
 
     @admin.action(description="Copy to active exchange")
     def copy_exchange(self, request, queryset):
         exchange = Exchange.objects.get(active=True)
-        for obj in queryset:
-            session = cast(ExchangeSession, obj)
-            copy = ExchangeSession()
-            copy.exchange = exchange
-            copy.department = session.department
-            copy.participants_min = session.participants_min
-            copy.participants_max = session.participants_max
-            copy.session_count = session.session_count
-            copy.save()
-            copy.organizers.set(session.organizers.all())
-
-            for description in session.description.all():
-                description.pk = None
-                description.exchange = copy
-                description.save()
+        clone_sessions(queryset, exchange)
 
         messages.success(request, "Successfully copied to latest exchange!")
 
+    def get_urls(self):
+        return [
+            path(
+                "capacity/",
+                self.admin_site.admin_view(self.capacity_view),
+                name="registration_exchangesession_capacity",
+            ),
+        ] + super().get_urls()
+
+    def capacity_view(self, request):
+        exchange = Exchange.objects.filter(active=True).first()
+        if exchange is None:
+            messages.error(request, "There is no active exchange.")
+            return redirect("admin:registration_exchangesession_changelist")
+        rows = capacity_overview(exchange)
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": f"Capacity of {exchange}",
+            "priorities": PRIORITIES,
+            "rows": rows,
+            "refresh": CAPACITY_CACHE_TIMEOUT,
+        }
+        return TemplateResponse(
+            request, "admin/registration/exchangesession/capacity.html", context
+        )
+
+
+class MailForm(forms.ModelForm):
+    def clean(self):
+        cleaned_data = super().clean()
+        placeholders = PLACEHOLDERS.get(cleaned_data.get("type"))
+        for field in ["subject", "text"]:
+            try:
+                Template(cleaned_data.get(field, ""), placeholders)
+            except MailTemplateError as error:
+                self.add_error(field, str(error))
+
+        return cleaned_data
+
+    class Meta:
+        model = Mail
+        fields = "__all__"
+
 
 class MailAdmin(admin.ModelAdmin):
+    form = MailForm
     list_display = ["type", "language", "subject"]
     ordering = ["language", "type"]
 
 
 class PersonRegistrationsInline(admin.TabularInline):
     model = Registration
-    readonly_fields = ("session", "priority", "date_time")
+    # an editable exchange would query its choices for every registration
+    readonly_fields = ("session_name", "exchange", "priority", "date_time")
+    exclude = ["session"]
     extra = 0
     can_delete = False
     max_num = 0
     ordering = ["session__exchange__begin"]
+    # the person being shown, see PersonAdmin.get_inline_instances
+    person: Optional[Person] = None
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("exchange")
+
+    @admin.display(description="Session")
+    def session_name(self, registration: Registration) -> str:
+        if registration.session_id is None:
+            return "-"
+        if self.person is None:
+            return str(registration.session)
+        return self.person.participation.names[registration.session_id]
 
 
 class PersonMailInline(admin.TabularInline):
@@ -165,27 +279,53 @@ class PersonForm(forms.ModelForm):
         self.fields["main_mail"].initial = person.email
 
         # get and display all the sessions
-        self.fields["organizes"].initial = self.list_sessions(
-            ExchangeSession.objects.filter(organizers=person)
+        participation = person.participation
+        self.fields["organizes"].initial = participation.list_names(
+            participation.organizes
         )
-        self.fields["sessions"].initial = self.list_sessions(
-            ExchangeSession.objects.filter(assigned=person)
+        self.fields["sessions"].initial = participation.list_names(
+            participation.assigned
         )
 
-    def list_sessions(self, query_set: QuerySet[Person]) -> str:
-        return "\n".join(sorted(str(session) for session in query_set))
-
     class Meta:
         model = Person
         fields = "__all__"
 
 
-class PersonAdmin(admin.ModelAdmin):
+class ReassignForm(forms.Form):
+    session = forms.ModelChoiceField(queryset=ExchangeSession.objects.none())
+    queue_mails = forms.BooleanField(
+        required=False, initial=True, label="Add the assigned mails to the outbox"
+    )
+
+    def __init__(self, *args, sessions: List[ExchangeSession], **kwargs):
+        super().__init__(*args, **kwargs)
+        field = self.fields["session"]
+        field.queryset = ExchangeSession.objects.filter(
+            pk__in=[session.pk for session in sessions]
+        )
+        # the names are already read
+        field.choices = [("", field.empty_label)] + [
+            (session.pk, str(session)) for session in sessions
+        ]
+
+
+DUPLICATES_SHOWN = 200
+
+
+class PersonAdmin(KeysetPaginationMixin, ForDisplayMixin, admin.ModelAdmin):
     form = PersonForm
-    actions = ["merge_persons"]
+    actions = [
+        "merge_persons",
+        "merge_duplicate_clusters",
+        "move_to_session",
+        "export_registrations",
+    ]
     list_display = ["full_name", "get_affiliation"]
-    ordering = ["user__first_name", "user__last_name"]
-    filter_horizontal = ["departments"]
+    ordering = ["sort_name", "id"]
+    keyset = ordering
+    autocomplete_fields = ["user", "departments"]
+    search_fields = ["search_text"]
     fields = (
         "user",
         "given_names",
@@ -203,25 +343,218 @@ class PersonAdmin(admin.ModelAdmin):
 
     @admin.action(description="Merge person records")
     def merge_persons(self, request, queryset: QuerySet):
-        persons: List[Person] = list(queryset.all())
-        if len(persons) != 2:
-            messages.error(request, "Select two records!")
+        persons: List[Person] = list(queryset.select_related("user"))
+        if len(persons) < 2:
+            messages.error(request, "Select at least two records!")
             return
 
-        persons[0].move_to(persons[1])
+        person = Person.merge_records(persons)
 
         messages.success(
-            request, f"Successfully merged records for {persons[0].full_name}!"
+            request, f"Successfully merged records for {person.full_name}!"
+        )
+
+    @admin.action(description="Merge likely duplicates within selection")
+    def merge_duplicate_clusters(self, request, queryset: QuerySet):
+        if "apply" in request.POST:
+            # the clusters confirmed by the admin, limited to the selection
+            selected = set(queryset.values_list("pk", flat=True))
+            clusters: List[List[int]] = []
+            for value in request.POST.getlist("cluster"):
+                try:
+                    pks = [int(pk) for pk in value.split(",")]
+                except ValueError:
+                    continue
+                if len(pks) > 1 and selected.issuperset(pks):
+                    clusters.append(pks)
+            if not clusters:
+                messages.warning(request, "No clusters selected to merge.")
+                return None
+
+            persons = Person.objects.select_related("user").in_bulk(
+                [pk for pks in clusters for pk in pks]
+            )
+            for pks in clusters:
+                Person.merge_records(persons[pk] for pk in pks if pk in persons)
+
+            messages.success(
+                request,
+                f"Successfully merged {sum(len(pks) for pks in clusters)} "
+                f"records into {len(clusters)} persons!",
+            )
+            return None
+
+        duplicates = find_duplicates(queryset)
+        if not duplicates.clusters:
+            messages.warning(request, "No likely duplicates found in the selection.")
+            return None
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Merge likely duplicates",
+            "clusters": duplicates.clusters,
+            "skipped": duplicates.skipped,
+            "selected": queryset.values_list("pk", flat=True),
+            "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(
+            request, "admin/registration/person/merge_duplicates.html", context
+        )
+
+    @admin.action(description="Move to a session of the active exchange")
+    def move_to_session(self, request, queryset: QuerySet):
+        exchange = Exchange.objects.filter(active=True).first()
+        if exchange is None:
+            messages.error(request, "There is no active exchange.")
+            return None
+        sessions = list(
+            ExchangeSession.objects.for_display()
+            .filter(exchange=exchange)
+            .order_by("pk")
+        )
+        persons = list(queryset.order_by("sort_name"))
+
+        if "apply" in request.POST:
+            form = ReassignForm(request.POST, sessions=sessions)
+            if form.is_valid():
+                target = form.cleaned_data["session"]
+                try:
+                    result = reassign(
+                        [person.pk for person in persons],
+                        target,
+                        queue_mails=form.cleaned_data["queue_mails"],
+                    )
+                except ReassignError as error:
+                    form.add_error("session", str(error))
+                else:
+                    message = f"Moved {result.moved} persons to {target}"
+                    if result.unchanged:
+                        message += f", {result.unchanged} were already assigned"
+                    if result.mails:
+                        message += f"; added {result.mails} mails to the outbox"
+                    messages.success(request, message + ".")
+                    return None
+        else:
+            form = ReassignForm(sessions=sessions)
+
+        # the current assignments within the exchange
+        names = {session.pk: str(session) for session in sessions}
+        assigned: Dict[Any, List[str]] = {}
+        for person_pk, session_pk in ExchangeSession.assigned.through.objects.filter(
+            person__in=persons, exchangesession__exchange=exchange
+        ).values_list("person_id", "exchangesession_id"):
+            assigned.setdefault(person_pk, []).append(names[session_pk])
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": f"Move to a session of {exchange}",
+            "form": form,
+            "persons": [(person, assigned.get(person.pk, [])) for person in persons],
+            "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(
+            request, "admin/registration/person/reassign.html", context
+        )
+
+    @admin.action(description="Export their registrations as CSV")
+    def export_registrations(self, request, queryset: QuerySet):
+        return streaming_export(
+            Registration.objects.filter(requestor__in=queryset), "csv"
         )
 
     def has_add_permission(self, request, obj=None):
         return False
 
+    def get_inline_instances(self, request, obj=None):
+        inlines = super().get_inline_instances(request, obj)
+        for inline in inlines:
+            if isinstance(inline, PersonRegistrationsInline):
+                # shares the participation summary with the form
+                inline.person = obj
+        return inlines
+
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .prefetch_related(
+                Prefetch("departments", queryset=Department.objects.for_display())
+            )
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        # the search text is normalized and has a trigram index, which
+        # a case-sensitive LIKE can use; quoted phrases are kept together
+        for term in smart_split(search_term):
+            term = normalize(term)
+            if term:
+                queryset = queryset.filter(search_text__contains=term)
+        return queryset, False
+
+    def get_urls(self):
+        return [
+            path(
+                "duplicates/",
+                self.admin_site.admin_view(self.duplicates_view),
+                name="registration_person_duplicates",
+            ),
+        ] + super().get_urls()
+
+    def duplicates_view(self, request):
+        try:
+            min_score = float(request.GET.get("min_score", DEFAULT_MIN_SCORE))
+        except ValueError:
+            min_score = DEFAULT_MIN_SCORE
+
+        duplicates = find_duplicates(min_score=min_score)
+        clusters = duplicates.clusters
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Possible duplicate persons",
+            "min_score": min_score,
+            "cluster_count": len(clusters),
+            "clusters": clusters[:DUPLICATES_SHOWN],
+            "skipped": duplicates.skipped,
+        }
+        return TemplateResponse(
+            request, "admin/registration/person/duplicates.html", context
+        )
+
 
-class RegistrationAdmin(admin.ModelAdmin):
+class RegistrationAdmin(KeysetPaginationMixin, ForDisplayMixin, admin.ModelAdmin):
     list_display = ["requestor", "date_time", "exchange", "session", "priority", "date_time"]
-    ordering = ["date_time"]
-    list_filter = ["exchange", "session__department"]
+    ordering = ["date_time", "id"]
+    keyset = ordering
+    date_hierarchy = "date_time"
+    actions = ["export_csv", "export_jsonl"]
+    list_filter = ["exchange", ("session__department", DisplayRelatedListFilter)]
+    autocomplete_fields = ["requestor", "session"]
+    list_select_related = [
+        "requestor",
+        "exchange",
+        "session__exchange",
+        "session__department",
+    ]
+
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .prefetch_related(
+                "session__description", "session__department__description"
+            )
+        )
+
+    @admin.action(description="Export as CSV")
+    def export_csv(self, request, queryset):
+        return streaming_export(queryset, "csv")
+
+    @admin.action(description="Export as JSONL")
+    def export_jsonl(self, request, queryset):
+        return streaming_export(queryset, "jsonl")
 
 
 admin.site.register(Person, PersonAdmin)
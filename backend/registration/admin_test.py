@@ -0,0 +1,93 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from registration.admin import RegistrationAdmin
+from registration.factories import add_person, grow
+from registration.models import Mail, PersonMail, Registration
+from registration import pagination
+
+
+def count_queries(client, url: str) -> int:
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+    assert response.status_code == 200, url
+    return len(context.captured_queries)
+
+
+def urls(world):
+    return [
+        "/admin/registration/person/",
+        "/admin/registration/person/?q=person",
+        "/admin/registration/department/",
+        "/admin/registration/exchange/",
+        "/admin/registration/exchangesession/",
+        "/admin/registration/exchangesession/capacity/",
+        "/admin/registration/registration/",
+        "/admin/registration/mail/",
+        f"/admin/registration/person/{world['person'].pk}/change/",
+        f"/admin/registration/department/{world['department'].pk}/change/",
+        f"/admin/registration/exchange/{world['exchange'].pk}/change/",
+        f"/admin/registration/exchangesession/{world['session'].pk}/change/",
+        f"/admin/registration/registration/{Registration.objects.first().pk}/change/",
+        f"/admin/registration/mail/{Mail.objects.first().pk}/change/",
+    ]
+
+
+def test_admin_query_counts(world, admin_client):
+    grow(world, 2)
+    # fills the caches, e.g. of the content types
+    for url in urls(world):
+        count_queries(admin_client, url)
+    before = {url: count_queries(admin_client, url) for url in urls(world)}
+
+    grow(world, 5)
+    after = {url: count_queries(admin_client, url) for url in urls(world)}
+
+    assert after == before
+
+
+def test_keyset_pagination(world, admin_client, monkeypatch):
+    grow(world, 4)
+    monkeypatch.setattr(RegistrationAdmin, "list_per_page", 3)
+    # as if the table were huge
+    monkeypatch.setattr(pagination, "estimate_count", lambda queryset: 10**6)
+
+    shown = []
+    url = "/admin/registration/registration/"
+    while url:
+        response = admin_client.get(
+            url if url.startswith("/") else "/admin/registration/registration/" + url
+        )
+        assert response.status_code == 200
+        changelist = response.context["cl"]
+        assert changelist.estimated_count
+        shown += [registration.pk for registration in changelist.result_list]
+        url = changelist.next_url
+
+    assert shown == list(
+        Registration.objects.order_by("date_time", "id").values_list("pk", flat=True)
+    )
+
+
+def test_person_search(db, admin_client):
+    person = add_person("jose")
+    person.user.first_name = "José"
+    person.user.last_name = "Müller-Lüdenscheidt"
+    person.user.save()
+    PersonMail.objects.create(person=person, address="J.Muller@Example.org")
+    add_person("other")
+
+    def search(term: str):
+        response = admin_client.get("/admin/registration/person/", {"q": term})
+        assert response.status_code == 200
+        return [person.pk for person in response.context["cl"].result_list]
+
+    # accents, case and punctuation are ignored
+    assert search("jose") == [person.pk]
+    assert search("MULLER lüdenscheidt") == [person.pk]
+    # the words of a quoted phrase stay together
+    assert search('"muller ludenscheidt"') == [person.pk]
+    assert search('"ludenscheidt muller"') == []
+    # the alternative addresses are searched too
+    assert search("j.muller@example") == [person.pk]
+    assert search("jose other") == []
@@ -0,0 +1,514 @@
+"""The session catalogue of an exchange as a JSONL or CSV file.
+
+Each line (or row) describes a session: its department, capacity,
+organizers and the descriptions in each language. Importing the file
+validates all the lines first, compares them with the sessions in the
+database and only writes the differences, using bulk queries within
+one transaction.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import csv
+import json
+import re
+
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from registration.models import (
+    LANGUAGES,
+    Department,
+    Exchange,
+    ExchangeSession,
+    ExchangeSessionDescription,
+    Person,
+    PersonMail,
+    Registration,
+)
+
+FORMATS = ["jsonl", "csv"]
+
+LANGUAGE_CODES = [code for code, _ in LANGUAGES]
+SESSION_FIELDS = ["participants_min", "participants_max", "session_count"]
+DESCRIPTION_FIELDS = ["title", "subtitle", "intro", "program", "date", "location"]
+
+CSV_FIELDNAMES = (
+    ["id", "department"]
+    + SESSION_FIELDS
+    + ["organizers"]
+    + [
+        f"{name}_{language}"
+        for language in LANGUAGE_CODES
+        for name in DESCRIPTION_FIELDS
+    ]
+)
+
+
+class CatalogueError(ValueError):
+    def __init__(self, errors: List[str]):
+        super().__init__("\n".join(errors))
+        self.errors = errors
+
+
+class DeletesRegistrationsError(CatalogueError):
+    """The sessions to delete have registrations, which would be deleted"""
+
+
+@dataclass
+class Entry:
+    """A validated line of the catalogue"""
+
+    line: int
+    session_pk: Optional[int]
+    department_pk: int
+    values: Dict[str, int]
+    organizer_pks: Set[int]
+    descriptions: Dict[str, Dict[str, str]]
+
+
+@dataclass
+class CatalogueDiff:
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    # readable description of each change
+    changes: List[str] = field(default_factory=list)
+
+
+def export_catalogue(exchange: Exchange) -> Iterator[Dict[str, Any]]:
+    """The sessions of an exchange, in the format of a JSONL line"""
+    sessions = (
+        ExchangeSession.objects.filter(exchange=exchange)
+        .select_related("department")
+        .prefetch_related("description", "organizers__user")
+        .order_by("pk")
+    )
+    for session in sessions:
+        descriptions: Dict[str, Dict[str, str]] = {}
+        for description in sorted(session.description.all(), key=lambda d: d.pk):
+            descriptions.setdefault(
+                description.language,
+                {name: getattr(description, name) for name in DESCRIPTION_FIELDS},
+            )
+        yield {
+            "id": session.pk,
+            "department": session.department.slug,
+            **{name: getattr(session, name) for name in SESSION_FIELDS},
+            "organizers": sorted(person.email for person in session.organizers.all()),
+            "descriptions": descriptions,
+        }
+
+
+def write_catalogue(
+    filepath: str, format: str, records: Iterable[Dict[str, Any]]
+) -> None:
+    if format == "jsonl":
+        with open(filepath, mode="w", encoding="utf-8") as jsonl_file:
+            for record in records:
+                jsonl_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return
+
+    with open(filepath, mode="w", encoding="utf-8-sig", newline="") as csv_file:
+        csv_writer = csv.DictWriter(
+            csv_file, delimiter=";", fieldnames=CSV_FIELDNAMES
+        )
+        csv_writer.writeheader()
+        for record in records:
+            csv_writer.writerow(to_row(record))
+
+
+def read_catalogue(filepath: str, format: str) -> List[Dict[str, Any]]:
+    """Reads the lines of the catalogue. Empty lines and the header row
+    of a CSV file are read as empty records, which keeps the line numbers
+    in sync with the file.
+
+    Raises:
+        CatalogueError: listing the lines which aren't JSON objects
+    """
+    if format == "jsonl":
+        records: List[Dict[str, Any]] = []
+        errors: List[str] = []
+        with open(filepath, mode="r", encoding="utf-8-sig") as jsonl_file:
+            for line, text in enumerate(jsonl_file, 1):
+                record: Any = {}
+                if text.strip():
+                    try:
+                        record = json.loads(text)
+                    except json.JSONDecodeError as error:
+                        errors.append(f"line {line}: invalid JSON: {error.msg}")
+                    else:
+                        if not isinstance(record, dict):
+                            errors.append(f"line {line}: not a JSON object")
+                            record = {}
+                records.append(record)
+        if errors:
+            raise CatalogueError(errors)
+        return records
+
+    with open(filepath, mode="r", encoding="utf-8-sig", newline="") as csv_file:
+        return [{}] + [
+            from_row(row) for row in csv.DictReader(csv_file, delimiter=";")
+        ]
+
+
+def to_row(record: Dict[str, Any]) -> Dict[str, Any]:
+    row = {name: record[name] for name in ["id", "department"] + SESSION_FIELDS}
+    row["organizers"] = " ".join(record["organizers"])
+    for language, description in record["descriptions"].items():
+        for name in DESCRIPTION_FIELDS:
+            row[f"{name}_{language}"] = description[name]
+    return row
+
+
+def from_row(row: Dict[str, str]) -> Dict[str, Any]:
+    record: Dict[str, Any] = {
+        name: row.get(name, "") for name in ["id", "department"] + SESSION_FIELDS
+    }
+    record["organizers"] = (row.get("organizers") or "").replace(",", " ").split()
+    record["descriptions"] = {}
+    for language in LANGUAGE_CODES:
+        description = {
+            name: row.get(f"{name}_{language}") or "" for name in DESCRIPTION_FIELDS
+        }
+        if any(description.values()):
+            record["descriptions"][language] = description
+    return record
+
+
+def import_catalogue(
+    exchange: Exchange,
+    records: Iterable[Dict[str, Any]],
+    delete: bool = False,
+    dry_run: bool = False,
+    delete_registrations: bool = False,
+) -> CatalogueDiff:
+    """Updates the sessions of an exchange to match the catalogue.
+
+    Lines with the id of a session update that session, lines without an
+    id add a session. Nothing is written if any line is invalid.
+
+    Args:
+        exchange (Exchange): exchange of the sessions
+        records (Iterable[Dict[str, Any]]): the lines of the catalogue
+        delete (bool): remove the sessions which aren't in the catalogue
+        dry_run (bool): only report the differences
+        delete_registrations (bool): also remove sessions which have
+            registrations, deleting those
+
+    Raises:
+        CatalogueError: listing all the invalid lines
+        DeletesRegistrationsError: listing the registrations which would
+            be deleted
+
+    Returns:
+        CatalogueDiff: the differences with the database
+    """
+    records = list(records)
+    sessions = {
+        session.pk: session
+        for session in ExchangeSession.objects.filter(
+            exchange=exchange
+        ).prefetch_related("description")
+    }
+    through = ExchangeSession.organizers.through
+    # the pk of the through row, by session and person pk
+    organizers: Dict[int, Dict[int, int]] = {pk: {} for pk in sessions}
+    for pk, session_pk, person_pk in through.objects.filter(
+        exchangesession__in=list(sessions)
+    ).values_list("pk", "exchangesession_id", "person_id"):
+        organizers[session_pk][person_pk] = pk
+
+    entries = validate(records, sessions, *lookups(records))
+    diff = CatalogueDiff()
+
+    session_updates: List[ExchangeSession] = []
+    description_updates: List[ExchangeSessionDescription] = []
+    new_descriptions: List[ExchangeSessionDescription] = []
+    # the organizers to add as (session, person) pks, and the through
+    # rows to remove
+    added: Set[Tuple[int, int]] = set()
+    removed: List[int] = []
+
+    new_entries = [entry for entry in entries if entry.session_pk is None]
+    for entry in entries:
+        if entry.session_pk is None:
+            diff.created += 1
+            diff.changes.append(f"line {entry.line}: new session")
+            continue
+
+        session = sessions[entry.session_pk]
+        changes = []
+        fields = {"department_id": entry.department_pk, **entry.values}
+        for name, value in fields.items():
+            if getattr(session, name) != value:
+                changes.append(f"{name} {getattr(session, name)} -> {value}")
+                setattr(session, name, value)
+        if changes:
+            session_updates.append(session)
+
+        existing = {}
+        for description in sorted(session.description.all(), key=lambda d: d.pk):
+            existing.setdefault(description.language, description)
+        for language, values in entry.descriptions.items():
+            description = existing.get(language)
+            if description is None:
+                changes.append(f"new {language} description")
+                new_descriptions.append(
+                    ExchangeSessionDescription(
+                        exchange_id=session.pk, language=language, **values
+                    )
+                )
+                continue
+            changed = [
+                name
+                for name in DESCRIPTION_FIELDS
+                if getattr(description, name) != values[name]
+            ]
+            if changed:
+                changes.append(f"{language} {', '.join(changed)}")
+                for name in changed:
+                    setattr(description, name, values[name])
+                description_updates.append(description)
+
+        current = organizers[session.pk]
+        if entry.organizer_pks != current.keys():
+            changes.append("organizers")
+            added.update(
+                (session.pk, pk) for pk in entry.organizer_pks - current.keys()
+            )
+            removed.extend(
+                pk
+                for person_pk, pk in current.items()
+                if person_pk not in entry.organizer_pks
+            )
+
+        if changes:
+            diff.updated += 1
+            diff.changes.append(
+                f"line {entry.line}: session {session.pk}: {'; '.join(changes)}"
+            )
+        else:
+            diff.unchanged += 1
+
+    deleted = []
+    if delete:
+        listed = set(entry.session_pk for entry in entries)
+        deleted = [pk for pk in sessions if pk not in listed]
+        diff.deleted = len(deleted)
+        diff.changes.extend(f"session {pk}: deleted" for pk in deleted)
+        registrations = [
+            f"session {session_pk}: deletes the registration of {email} "
+            f"(priority {priority})"
+            for session_pk, email, priority in Registration.objects.filter(
+                session__in=deleted
+            )
+            .order_by("session", "pk")
+            .values_list("session", "requestor__user__email", "priority")
+        ]
+        diff.changes.extend(registrations)
+        if registrations and not delete_registrations and not dry_run:
+            raise DeletesRegistrationsError(registrations)
+
+    if dry_run:
+        return diff
+
+    with transaction.atomic():
+        created = ExchangeSession.objects.bulk_create(
+            [
+                ExchangeSession(
+                    exchange=exchange,
+                    department_id=entry.department_pk,
+                    **entry.values,
+                )
+                for entry in new_entries
+            ]
+        )
+        for entry, session in zip(new_entries, created):
+            new_descriptions.extend(
+                ExchangeSessionDescription(
+                    exchange_id=session.pk, language=language, **values
+                )
+                for language, values in entry.descriptions.items()
+            )
+            added.update((session.pk, pk) for pk in entry.organizer_pks)
+
+        ExchangeSession.objects.bulk_update(
+            session_updates, ["department_id"] + SESSION_FIELDS
+        )
+        ExchangeSessionDescription.objects.bulk_create(new_descriptions)
+        ExchangeSessionDescription.objects.bulk_update(
+            description_updates, DESCRIPTION_FIELDS
+        )
+        through.objects.filter(pk__in=removed).delete()
+        through.objects.bulk_create(
+            [
+                through(exchangesession_id=session_pk, person_id=person_pk)
+                for session_pk, person_pk in sorted(added)
+            ]
+        )
+        if deleted:
+            ExchangeSession.objects.filter(pk__in=deleted).delete()
+
+    return diff
+
+
+def lookups(records: List[Dict[str, Any]]) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """The departments by slug and persons by (lower case) email address
+    used in the catalogue.
+    """
+    # the invalid lines are reported by validate()
+    records = [record for record in records if isinstance(record, dict)]
+    slugs = set(str(record.get("department", "")) for record in records)
+    departments = dict(
+        Department.objects.filter(slug__in=slugs).values_list("slug", "pk")
+    )
+
+    emails = set(
+        str(email).lower()
+        for record in records
+        if isinstance(record.get("organizers"), list)
+        for email in record["organizers"]
+    )
+    persons = dict(
+        PersonMail.objects.annotate(lower=Lower("address"))
+        .filter(lower__in=emails)
+        .values_list("lower", "person_id")
+    )
+    persons.update(
+        Person.objects.annotate(lower=Lower("user__email"))
+        .filter(lower__in=emails)
+        .values_list("lower", "pk")
+    )
+    return departments, persons
+
+
+def to_int(value: Any) -> Optional[int]:
+    """The value of a JSON number or CSV field as an integer, None for
+    anything else, e.g. 1.9 or true.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and re.fullmatch(r"\s*[-+]?\d+\s*", value):
+        return int(value)
+    return None
+
+
+def validate_id(
+    record: Dict[str, Any],
+    sessions: Dict[int, ExchangeSession],
+    seen: Set[int],
+    problems: List[str],
+) -> Optional[int]:
+    if record.get("id") in (None, ""):
+        return None
+
+    session_pk = to_int(record["id"])
+    if session_pk is None:
+        problems.append(f"invalid id {record['id']}")
+    elif session_pk not in sessions:
+        problems.append(f"session {session_pk} is not in this exchange")
+    elif session_pk in seen:
+        problems.append(f"session {session_pk} is listed twice")
+    else:
+        seen.add(session_pk)
+    return session_pk
+
+
+def validate_values(record: Dict[str, Any], problems: List[str]) -> Dict[str, int]:
+    values = {}
+    for name in SESSION_FIELDS:
+        value = to_int(record.get(name))
+        if value is None or value < 0:
+            problems.append(f"invalid {name} {record.get(name)}")
+        else:
+            values[name] = value
+    if len(values) == len(SESSION_FIELDS) and (
+        values["participants_min"] > values["participants_max"]
+    ):
+        problems.append("participants_min is more than participants_max")
+    return values
+
+
+def validate_organizers(
+    record: Dict[str, Any], persons: Dict[str, int], problems: List[str]
+) -> Set[int]:
+    organizer_pks = set()
+    emails = record.get("organizers") or []
+    if not isinstance(emails, list):
+        problems.append(f"invalid organizers {emails}")
+        emails = []
+    for email in emails:
+        try:
+            organizer_pks.add(persons[str(email).lower()])
+        except KeyError:
+            problems.append(f"unknown organizer {email}")
+    return organizer_pks
+
+
+def validate_descriptions(
+    record: Dict[str, Any], problems: List[str]
+) -> Dict[str, Dict[str, str]]:
+    descriptions = {}
+    languages = record.get("descriptions") or {}
+    if not isinstance(languages, dict):
+        problems.append(f"invalid descriptions {languages}")
+        languages = {}
+    for language, description in languages.items():
+        if language not in LANGUAGE_CODES:
+            problems.append(f"unknown language {language}")
+            continue
+        if not isinstance(description, dict):
+            problems.append(f"invalid {language} description {description}")
+            continue
+        descriptions[language] = {
+            name: str(description.get(name) or "") for name in DESCRIPTION_FIELDS
+        }
+    return descriptions
+
+
+def validate(
+    records: List[Dict[str, Any]],
+    sessions: Dict[int, ExchangeSession],
+    departments: Dict[str, int],
+    persons: Dict[str, int],
+) -> List[Entry]:
+    entries: List[Entry] = []
+    errors: List[str] = []
+    seen: Set[int] = set()
+    for line, record in enumerate(records, 1):
+        if not record:
+            continue
+        if not isinstance(record, dict):
+            errors.append(f"line {line}: not an object")
+            continue
+
+        problems: List[str] = []
+        session_pk = validate_id(record, sessions, seen, problems)
+        department_pk = departments.get(str(record.get("department", "")))
+        if department_pk is None:
+            problems.append(f"unknown department {record.get('department')}")
+        values = validate_values(record, problems)
+        organizer_pks = validate_organizers(record, persons, problems)
+        descriptions = validate_descriptions(record, problems)
+
+        if problems:
+            errors.append(f"line {line}: {'; '.join(problems)}")
+        else:
+            entries.append(
+                Entry(
+                    line,
+                    session_pk,
+                    department_pk,
+                    values,
+                    organizer_pks,
+                    descriptions,
+                )
+            )
+
+    if errors:
+        raise CatalogueError(errors)
+    return entries
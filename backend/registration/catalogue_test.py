@@ -0,0 +1,176 @@
+import copy
+import datetime
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from registration.factories import add_department, add_person, add_session
+from registration.catalogue import (
+    CatalogueError,
+    DeletesRegistrationsError,
+    export_catalogue,
+    import_catalogue,
+    read_catalogue,
+    write_catalogue,
+)
+from registration.models import Exchange, ExchangeSession, Registration
+
+
+@pytest.fixture
+def exchange(db):
+    exchange = Exchange.objects.create(
+        begin=2023, end=2024, enrollment_deadline=datetime.date(2023, 1, 1), active=True
+    )
+    organizer = add_person("organizer")
+    for slug in ["history", "music", "philosophy"]:
+        session = add_session(exchange, add_department(slug))
+        session.organizers.add(organizer)
+    return exchange
+
+
+@pytest.mark.parametrize("format", ["jsonl", "csv"])
+def test_round_trip(exchange, tmp_path, format):
+    filepath = str(tmp_path / f"catalogue.{format}")
+    write_catalogue(filepath, format, export_catalogue(exchange))
+    records = read_catalogue(filepath, format)
+    # the header row of a CSV file is read as an empty record
+    assert len([record for record in records if record]) == 3
+
+    diff = import_catalogue(exchange, records)
+    assert (diff.created, diff.updated, diff.unchanged) == (0, 0, 3)
+
+
+def count_import(exchange: Exchange, records) -> int:
+    with CaptureQueriesContext(connection) as context:
+        import_catalogue(exchange, records)
+    return len(context.captured_queries)
+
+
+def change(record, organizer: str):
+    record = copy.deepcopy(record)
+    record["participants_max"] += 1
+    record["organizers"] = [organizer]
+    record["descriptions"]["nl"]["title"] += "!"
+    return record
+
+
+def test_import(exchange):
+    add_person("other")
+    records = [change(record, "OTHER@uu.nl") for record in export_catalogue(exchange)]
+    records += [dict(copy.deepcopy(record), id=None) for record in records]
+    queries = count_import(exchange, records)
+
+    sessions = ExchangeSession.objects.filter(exchange=exchange).prefetch_related(
+        "organizers__user", "description"
+    )
+    assert len(sessions) == 6
+    for session in sessions:
+        assert session.participants_max == 11
+        assert [person.email for person in session.organizers.all()] == ["other@uu.nl"]
+        assert sorted(d.title for d in session.description.all())[1].endswith("nl!")
+
+    # twice as many changes, as many queries
+    records = [
+        change(record, "organizer@uu.nl") for record in export_catalogue(exchange)
+    ]
+    records += [dict(copy.deepcopy(record), id=None) for record in records]
+    assert count_import(exchange, records) == queries
+
+
+def test_invalid(exchange):
+    records = list(export_catalogue(exchange))
+    records[0]["department"] = "unknown"
+    records[1]["participants_min"] = 20
+    records[2]["organizers"] = ["nobody@uu.nl"]
+
+    with pytest.raises(CatalogueError) as error:
+        import_catalogue(exchange, records)
+
+    assert len(error.value.errors) == 3
+    assert ExchangeSession.objects.filter(participants_min=20).count() == 0
+
+
+def test_invalid_types(exchange):
+    records = list(export_catalogue(exchange))
+    records[0]["descriptions"] = ["nl"]
+    records[1]["descriptions"]["nl"] = "title"
+    records[2]["organizers"] = "organizer@uu.nl"
+
+    with pytest.raises(CatalogueError) as error:
+        import_catalogue(exchange, records + [["not", "an", "object"]])
+
+    assert [message.split(":")[0] for message in error.value.errors] == [
+        "line 1",
+        "line 2",
+        "line 3",
+        "line 4",
+    ]
+
+
+def test_read_invalid(tmp_path):
+    filepath = tmp_path / "catalogue.jsonl"
+    filepath.write_text('{"id": 1}\n\n{"id": \n[1, 2]\n{}\n', encoding="utf-8")
+
+    with pytest.raises(CatalogueError) as error:
+        read_catalogue(str(filepath), "jsonl")
+
+    assert [message.split(":")[0] for message in error.value.errors] == [
+        "line 3",
+        "line 4",
+    ]
+
+
+def test_csv_line_numbers(exchange, tmp_path):
+    filepath = str(tmp_path / "catalogue.csv")
+    records = list(export_catalogue(exchange))
+    records[1]["department"] = "unknown"
+    write_catalogue(filepath, "csv", records)
+
+    with pytest.raises(CatalogueError) as error:
+        import_catalogue(exchange, read_catalogue(filepath, "csv"))
+
+    # the first line is the header
+    assert error.value.errors == ["line 3: unknown department unknown"]
+
+
+def test_invalid_numbers(exchange):
+    records = list(export_catalogue(exchange))
+    records[0]["id"] = records[0]["id"] + 0.9
+    records[1]["session_count"] = True
+    records[2]["participants_max"] = "10.5"
+
+    with pytest.raises(CatalogueError) as error:
+        import_catalogue(exchange, records)
+
+    assert error.value.errors == [
+        f"line 1: invalid id {records[0]['id']}",
+        "line 2: invalid session_count True",
+        "line 3: invalid participants_max 10.5",
+    ]
+
+
+def test_delete_registrations(exchange):
+    records = list(export_catalogue(exchange))
+    session = ExchangeSession.objects.get(pk=records[0]["id"])
+    person = add_person("requestor")
+    Registration.objects.create(
+        requestor=person,
+        session=session,
+        exchange=exchange,
+        priority=1,
+        date_time=datetime.datetime.now(datetime.timezone.utc),
+    )
+
+    diff = import_catalogue(exchange, records[1:], delete=True, dry_run=True)
+    assert diff.changes == [
+        f"session {session.pk}: deleted",
+        f"session {session.pk}: deletes the registration of requestor@uu.nl "
+        "(priority 1)",
+    ]
+    with pytest.raises(DeletesRegistrationsError):
+        import_catalogue(exchange, records[1:], delete=True)
+    assert ExchangeSession.objects.filter(pk=session.pk).exists()
+
+    import_catalogue(exchange, records[1:], delete=True, delete_registrations=True)
+    assert not Registration.objects.exists()
@@ -0,0 +1,24 @@
+import datetime
+
+import pytest
+
+from registration.factories import add_department, add_person, add_session
+from registration.models import Exchange, Mail
+
+
+@pytest.fixture
+def world(db):
+    exchange = Exchange.objects.create(
+        begin=2023, end=2024, enrollment_deadline=datetime.date(2023, 1, 1), active=True
+    )
+    department = add_department("history")
+    session = add_session(exchange, department)
+    person = add_person("person")
+    Mail.objects.create(type="assigned", language="nl", subject="Hoi", text="Hoi!")
+    return {
+        "exchange": exchange,
+        "department": department,
+        "session": session,
+        "person": person,
+        "count": 0,
+    }
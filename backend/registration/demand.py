@@ -0,0 +1,242 @@
+"""Demand (the registrations) versus the capacity of the sessions.
+
+The registrations are counted per session and priority by a single
+grouped query each time, so the counts are always current, whichever
+process added the registrations. The query only reads an index (see
+Registration.Meta). Counters updated by signals aren't used: they would
+miss the bulk and queryset changes, and would have to be shared by all
+the processes.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.core.cache import cache
+from django.db.models import Count, F
+
+from registration.models import Exchange, ExchangeSession, Registration
+
+# the first, second and third choice are reported separately
+PRIORITIES = [1, 2, 3]
+
+DEMAND_FIELDS = [
+    "exchange",
+    "session",
+    "name",
+    "first_choice",
+    "second_choice",
+    "third_choice",
+    "demand",
+    "capacity",
+    "assigned",
+    "fill_rate",
+    "acceptance_rate",
+    "oversubscribed",
+]
+
+# the capacity overview is refreshed constantly during the enrollment
+CAPACITY_CACHE_TIMEOUT = 30
+
+CAPACITY_EMPTY = "empty"
+CAPACITY_UNDER_MINIMUM = "under minimum"
+CAPACITY_OK = "ok"
+CAPACITY_FULL = "full"
+
+
+@dataclass
+class SessionCounts:
+    """The registrations and assignments of a session, versus its capacity.
+    Both the demand report and the capacity overview are derived from this.
+    """
+
+    session: ExchangeSession
+    name: str
+    # registrations by priority, with "other" for the lower priorities
+    priorities: Dict[Any, int]
+    assigned: int
+    # registrations which resulted in an assignment to this session
+    accepted: int
+
+    @property
+    def capacity(self) -> int:
+        return self.session.participants_max * self.session.session_count
+
+    @property
+    def demand(self) -> int:
+        return sum(self.priorities.values())
+
+    @property
+    def oversubscribed(self) -> bool:
+        """More participants chose this session first than it can take"""
+        return self.priorities[1] > self.capacity
+
+    @property
+    def status(self) -> str:
+        """How far the assignments fill the session"""
+        if self.assigned == 0:
+            return CAPACITY_EMPTY
+        elif self.assigned < self.session.participants_min:
+            return CAPACITY_UNDER_MINIMUM
+        elif self.assigned >= self.capacity:
+            return CAPACITY_FULL
+        return CAPACITY_OK
+
+
+def demand_counts(exchange: Exchange) -> Dict[Any, Dict[Any, int]]:
+    """The number of registrations per session and priority, counted
+    using a single grouped query.
+
+    Args:
+        exchange (Exchange): the exchange to count
+
+    Returns:
+        Dict[Any, Dict[Any, int]]: counts per priority, by session pk
+    """
+    counts: Dict[Any, Dict[Any, int]] = {
+        session_pk: dict.fromkeys(PRIORITIES + ["other"], 0)
+        for session_pk in ExchangeSession.objects.filter(
+            exchange=exchange
+        ).values_list("pk", flat=True)
+    }
+    for session_pk, priority, count in (
+        Registration.objects.filter(exchange=exchange, session__isnull=False)
+        .values("session", "priority")
+        .annotate(count=Count("id"))
+        .values_list("session", "priority", "count")
+    ):
+        if priority not in PRIORITIES:
+            priority = "other"
+        counts[session_pk][priority] += count
+
+    return counts
+
+
+def session_counts(exchange: Exchange) -> List[SessionCounts]:
+    """Counts the registrations and assignments of each session of an
+    exchange, using a grouped query per count.
+
+    Args:
+        exchange (Exchange): the exchange to count
+
+    Returns:
+        List[SessionCounts]: the counts per session, ordered by pk
+    """
+    counts = demand_counts(exchange)
+    assigned = dict(
+        ExchangeSession.assigned.through.objects.filter(
+            exchangesession__exchange=exchange
+        )
+        .values("exchangesession")
+        .annotate(count=Count("id"))
+        .values_list("exchangesession", "count")
+    )
+    accepted = dict(
+        Registration.objects.filter(
+            exchange=exchange, session__assigned=F("requestor")
+        )
+        .values("session")
+        .annotate(count=Count("id"))
+        .values_list("session", "count")
+    )
+
+    sessions = (
+        ExchangeSession.objects.filter(exchange=exchange)
+        .annotate(
+            _titles=StringAgg(
+                "description__title",
+                " / ",
+                distinct=True,
+                ordering="description__title",
+                default="",
+            )
+        )
+        .order_by("pk")
+    )
+    return [
+        SessionCounts(
+            session,
+            session._titles,
+            counts[session.pk],
+            assigned.get(session.pk, 0),
+            accepted.get(session.pk, 0),
+        )
+        for session in sessions
+    ]
+
+
+def demand_report(exchange: Optional[Exchange] = None) -> List[Dict[str, Any]]:
+    """Demand versus capacity per session of an exchange.
+
+    Args:
+        exchange (Exchange, optional): defaults to the active exchange
+
+    Returns:
+        List[Dict[str, Any]]: a row per session, see DEMAND_FIELDS
+    """
+    if exchange is None:
+        exchange = Exchange.objects.get(active=True)
+
+    return [
+        {
+            "exchange": str(exchange),
+            "session": counts.session.pk,
+            "name": counts.name,
+            "first_choice": counts.priorities[1],
+            "second_choice": counts.priorities[2],
+            "third_choice": counts.priorities[3],
+            "demand": counts.demand,
+            "capacity": counts.capacity,
+            "assigned": counts.assigned,
+            "fill_rate": rate(counts.assigned, counts.capacity),
+            "acceptance_rate": rate(counts.accepted, counts.demand),
+            "oversubscribed": counts.oversubscribed,
+        }
+        for counts in session_counts(exchange)
+    ]
+
+
+def capacity_overview(exchange: Optional[Exchange] = None) -> List[Dict[str, Any]]:
+    """Registrations per priority and the assigned participants versus the
+    minimum and maximum of each session. Cached briefly.
+
+    Args:
+        exchange (Exchange, optional): defaults to the active exchange
+
+    Returns:
+        List[Dict[str, Any]]: a row per session
+    """
+    if exchange is None:
+        exchange = Exchange.objects.get(active=True)
+
+    key = f"capacity:{exchange.pk}"
+    rows = cache.get(key)
+    if rows is not None:
+        return rows
+
+    rows = [
+        {
+            "session": counts.session.pk,
+            "name": counts.name,
+            "priorities": [counts.priorities[priority] for priority in PRIORITIES],
+            "registrations": counts.demand,
+            "assigned": counts.assigned,
+            "minimum": counts.session.participants_min,
+            "capacity": counts.capacity,
+            "status": counts.status,
+            "oversubscribed": counts.oversubscribed,
+        }
+        for counts in sorted(
+            session_counts(exchange),
+            key=lambda counts: (counts.name, counts.session.pk),
+        )
+    ]
+
+    cache.set(key, rows, timeout=CAPACITY_CACHE_TIMEOUT)
+    return rows
+
+
+def rate(count: int, total: int) -> Optional[float]:
+    if not total:
+        return None
+    return round(count / total, 3)
@@ -0,0 +1,54 @@
+import datetime
+
+from registration.demand import CAPACITY_FULL, capacity_overview, demand_report
+from registration.factories import add_person
+from registration.models import Registration
+
+
+def register(world, priority: int, session=None) -> Registration:
+    world["count"] += 1
+    return Registration.objects.create(
+        requestor=add_person(f"requestor{world['count']}"),
+        session=session or world["session"],
+        exchange=world["exchange"],
+        priority=priority,
+        date_time=datetime.datetime.now(datetime.timezone.utc),
+    )
+
+
+def test_demand_report(world):
+    for priority in [1, 1, 2, 3, 4]:
+        register(world, priority)
+    [row] = demand_report(world["exchange"])
+    assert (row["first_choice"], row["second_choice"], row["third_choice"]) == (
+        2,
+        1,
+        1,
+    )
+    assert row["demand"] == 5
+
+    # always current
+    register(world, 1).delete()
+    register(world, 2)
+    [row] = demand_report(world["exchange"])
+    assert (row["first_choice"], row["second_choice"], row["demand"]) == (2, 2, 6)
+
+
+def test_capacity_overview(world):
+    session = world["session"]
+    session.participants_max = 2
+    session.save()
+    for priority in [1, 1, 1, 2]:
+        register(world, priority)
+    session.assigned.add(
+        *[registration.requestor for registration in Registration.objects.all()[:2]]
+    )
+
+    [row] = capacity_overview(world["exchange"])
+    [report] = demand_report(world["exchange"])
+
+    assert row["priorities"] == [3, 1, 0]
+    assert (row["registrations"], row["assigned"], row["capacity"]) == (4, 2, 2)
+    assert row["status"] == CAPACITY_FULL
+    assert row["oversubscribed"] is report["oversubscribed"] is True
+    assert report["acceptance_rate"] == 0.5
@@ -0,0 +1,224 @@
+"""Finds person records which are likely to describe the same person.
+
+Comparing every person with every other person does not scale, so
+the records are first grouped in blocks sharing a cheap key (e.g. the
+normalized surname or the local part of an e-mail address). Only the
+records within the same block are scored against each other.
+"""
+
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from itertools import combinations
+from typing import Dict, List, Optional, Set, Tuple
+import re
+
+from django.db.models.query import QuerySet
+
+from registration.models import Person, PersonMail
+from registration.text import normalize
+
+DEFAULT_MIN_SCORE = 0.85
+
+# blocks larger than this are too unspecific to be useful (e.g.
+# everyone with the mail address info@...), these are reported instead
+MAX_BLOCK_SIZE = 50
+
+SURNAME_PREFIXES = ["van", "von", "de", "der", "den", "die", "het", "ten", "ter"]
+
+
+@dataclass
+class PersonRecord:
+    pk: int
+    name: str
+    surname: str
+    given_names: str
+    emails: List[str] = field(default_factory=list)
+
+    def __str__(self):
+        if self.emails:
+            return f"{self.name} <{self.emails[0]}>"
+        return self.name
+
+
+@dataclass
+class DuplicateCluster:
+    persons: List[PersonRecord]
+    score: float
+    reasons: List[str]
+
+    @property
+    def pks(self) -> List[int]:
+        return [person.pk for person in self.persons]
+
+
+@dataclass
+class Duplicates:
+    clusters: List[DuplicateCluster]
+    # the blocks which were too large to compare, with their size
+    skipped: Dict[str, int] = field(default_factory=dict)
+
+
+def normalize_surname(prefix: str, surname: str) -> str:
+    parts = normalize(f"{prefix} {surname}").split(" ")
+    while len(parts) > 1 and parts[0] in SURNAME_PREFIXES:
+        parts.pop(0)
+    return "".join(parts)
+
+
+def email_local_part(address: str) -> str:
+    local = address.lower().split("@", 1)[0]
+    # ignore sub-addressing such as j.jansen+wisselwerking@
+    local = local.split("+", 1)[0]
+    return re.sub(r"[\.\-_]", "", local)
+
+
+def blocking_keys(record: PersonRecord) -> Set[str]:
+    keys: Set[str] = set()
+    given = record.given_names.replace(" ", "")
+    if record.surname:
+        keys.add(f"surname:{record.surname}:{given[:1]}")
+        if given:
+            # catches typos later in the surname
+            keys.add(f"given:{given}:{record.surname[:3]}")
+    for address in record.emails:
+        local = email_local_part(address)
+        if local:
+            keys.add(f"email:{local}")
+    return keys
+
+
+def load_records(queryset: QuerySet) -> Dict[int, PersonRecord]:
+    records: Dict[int, PersonRecord] = {}
+    for pk, first_name, prefix, last_name, email, username in queryset.values_list(
+        "pk",
+        "user__first_name",
+        "prefix_surname",
+        "user__last_name",
+        "user__email",
+        "user__username",
+    ).iterator(chunk_size=5000):
+        given_names = normalize(first_name)
+        surname = normalize_surname(prefix, last_name)
+        name = " ".join(
+            part for part in [first_name, prefix, last_name] if part and not part.isspace()
+        )
+        records[pk] = PersonRecord(
+            pk,
+            name or username,
+            surname,
+            given_names,
+            [email.lower()] if email else [],
+        )
+
+    for person_id, address in PersonMail.objects.filter(
+        person__in=queryset
+    ).values_list("person_id", "address"):
+        try:
+            records[person_id].emails.append(address.lower())
+        except KeyError:
+            pass
+
+    return records
+
+
+def score_pair(a: PersonRecord, b: PersonRecord) -> Tuple[float, List[str]]:
+    reasons: List[str] = []
+    name_a = f"{a.given_names} {a.surname}"
+    name_b = f"{b.given_names} {b.surname}"
+    if name_a == name_b:
+        score = 1.0
+        reasons.append("same name")
+    else:
+        matcher = SequenceMatcher(None, name_a, name_b)
+        score = matcher.ratio() if matcher.quick_ratio() >= 0.5 else 0.0
+        if score >= 0.8:
+            reasons.append("similar name")
+
+    if set(a.emails) & set(b.emails):
+        return 1.0, reasons + ["same e-mail address"]
+
+    locals_a = set(email_local_part(address) for address in a.emails)
+    locals_b = set(email_local_part(address) for address in b.emails)
+    if locals_a & locals_b:
+        score = min(1.0, score + 0.2)
+        reasons.append("same e-mail local part")
+
+    return score, reasons
+
+
+def find_duplicates(
+    queryset: Optional[QuerySet] = None,
+    min_score: float = DEFAULT_MIN_SCORE,
+    max_block_size: int = MAX_BLOCK_SIZE,
+) -> Duplicates:
+    """Finds clusters of person records which are probably the same person.
+
+    Args:
+        queryset (QuerySet, optional): persons to consider, defaults to everyone
+        min_score (float, optional): minimal similarity (0-1) of two records
+        max_block_size (int, optional): larger blocks are skipped
+
+    Returns:
+        Duplicates: clusters, the most likely duplicates first, and the
+            blocks which were skipped
+    """
+    if queryset is None:
+        queryset = Person.objects.all()
+
+    records = load_records(queryset)
+
+    blocks: Dict[str, List[int]] = {}
+    for record in records.values():
+        for key in blocking_keys(record):
+            blocks.setdefault(key, []).append(record.pk)
+
+    # score each pair only once, even if it shares multiple blocks
+    scores: Dict[Tuple[int, int], Tuple[float, List[str]]] = {}
+    skipped: Dict[str, int] = {}
+    for key, pks in blocks.items():
+        if len(pks) > max_block_size:
+            skipped[key] = len(pks)
+            continue
+        for pair in combinations(sorted(pks), 2):
+            if pair not in scores:
+                scores[pair] = score_pair(records[pair[0]], records[pair[1]])
+
+    # union-find to merge the matching pairs into clusters
+    parents: Dict[int, int] = {}
+
+    def find(pk: int) -> int:
+        root = pk
+        while parents.get(root, root) != root:
+            root = parents[root]
+        while pk != root:
+            parents[pk], pk = root, parents.get(pk, pk)
+        return root
+
+    matches = [(pair, match) for pair, match in scores.items() if match[0] >= min_score]
+    for (a, b), _ in matches:
+        parents[find(b)] = find(a)
+
+    clusters: Dict[int, DuplicateCluster] = {}
+    for (a, _), (score, reasons) in matches:
+        root = find(a)
+        try:
+            cluster = clusters[root]
+            cluster.score = max(cluster.score, score)
+            cluster.reasons.extend(r for r in reasons if r not in cluster.reasons)
+        except KeyError:
+            clusters[root] = DuplicateCluster([], score, list(reasons))
+
+    members = set(pk for pair, _ in matches for pk in pair)
+    for pk in members:
+        clusters[find(pk)].persons.append(records[pk])
+
+    for cluster in clusters.values():
+        cluster.persons.sort(key=lambda person: person.pk)
+
+    return Duplicates(
+        sorted(
+            clusters.values(),
+            key=lambda cluster: (-cluster.score, -len(cluster.persons), cluster.pks[0]),
+        ),
+        dict(sorted(skipped.items(), key=lambda item: (-item[1], item[0]))),
+    )
@@ -0,0 +1,78 @@
+from registration.duplicates import (
+    PersonRecord,
+    blocking_keys,
+    email_local_part,
+    find_duplicates,
+    normalize_surname,
+    score_pair,
+)
+from registration.factories import add_person
+from registration.models import PersonMail
+
+
+def record(pk: int, given_names: str, surname: str, *emails: str) -> PersonRecord:
+    name = f"{given_names} {surname}"
+    return PersonRecord(pk, name, surname, given_names, list(emails))
+
+
+def test_blocking_keys():
+    assert normalize_surname("van der", "Berg") == "berg"
+    assert normalize_surname("", "De Vries") == "vries"
+    assert email_local_part("J.Jansen+wissel@uu.nl") == "jjansen"
+
+    assert blocking_keys(record(1, "jan", "jansen", "j.jansen@uu.nl")) == {
+        "surname:jansen:j",
+        "given:jan:jan",
+        "email:jjansen",
+    }
+
+
+def test_score_pair():
+    score, reasons = score_pair(record(1, "jan", "jansen"), record(2, "jan", "jansen"))
+    assert (score, reasons) == (1.0, ["same name"])
+
+    score, reasons = score_pair(
+        record(1, "jan", "jansen", "jan@uu.nl"),
+        record(2, "piet", "pietersen", "jan@uu.nl"),
+    )
+    assert score == 1.0
+    assert "same e-mail address" in reasons
+
+    score, _ = score_pair(record(1, "jan", "jansen"), record(2, "piet", "pietersen"))
+    assert score < 0.5
+
+
+def rename(person, first_name: str, last_name: str, email: str = ""):
+    person.user.first_name = first_name
+    person.user.last_name = last_name
+    person.user.email = email
+    person.user.save()
+    return person
+
+
+def test_find_duplicates(db):
+    jan = rename(add_person("jan1"), "Jan", "Jansen", "jan@uu.nl")
+    typo = rename(add_person("jan2"), "Jan", "Janssen")
+    # only linked through the alias of the first record
+    alias = rename(add_person("jan3"), "J.", "Smit", "jan.jansen@example.org")
+    PersonMail.objects.create(person=jan, address="jan.jansen@example.org")
+    rename(add_person("piet"), "Piet", "Pietersen", "piet@uu.nl")
+
+    duplicates = find_duplicates()
+
+    assert [cluster.pks for cluster in duplicates.clusters] == [
+        sorted([jan.pk, typo.pk, alias.pk])
+    ]
+    assert duplicates.skipped == {}
+
+
+def test_find_duplicates_skipped(db):
+    persons = [
+        rename(add_person(f"info{i}"), f"Name{i}", f"Other{i}", f"info@dept{i}.nl")
+        for i in range(4)
+    ]
+
+    duplicates = find_duplicates(max_block_size=3)
+
+    assert duplicates.clusters == []
+    assert duplicates.skipped == {"email:info": len(persons)}
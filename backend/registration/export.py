@@ -0,0 +1,118 @@
+"""Streams the registrations as CSV or JSONL.
+
+The rows are read in chunks using a server-side cursor and written to
+the response while reading, so the memory use doesn't depend on the
+number of registrations and the first bytes are sent right away.
+"""
+
+from typing import Any, Dict, Iterable, Iterator
+import csv
+import json
+
+from django.db.models import Prefetch, QuerySet
+from django.http import StreamingHttpResponse
+
+from registration.models import Department
+
+EXPORT_FORMATS = ["csv", "jsonl"]
+
+EXPORT_FIELDS = [
+    "exchange",
+    "date_time",
+    "priority",
+    "requestor",
+    "email",
+    "affiliation",
+    "session",
+    "titles",
+]
+
+CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/jsonl; charset=utf-8",
+}
+
+
+def export_rows(registrations: QuerySet) -> Iterator[Dict[str, Any]]:
+    """The registrations as rows with the EXPORT_FIELDS.
+
+    Args:
+        registrations (QuerySet): the registrations to export
+
+    Yields:
+        Dict[str, Any]: a row per registration
+    """
+    registrations = (
+        registrations.select_related(None)
+        .prefetch_related(None)
+        .select_related("requestor__user", "exchange", "session")
+        .prefetch_related(
+            Prefetch(
+                "requestor__departments", queryset=Department.objects.for_display()
+            ),
+            "session__description",
+        )
+        .order_by("date_time", "id")
+    )
+    # the prefetches are done per chunk
+    for registration in registrations.iterator(chunk_size=CHUNK_SIZE):
+        requestor = registration.requestor
+        session = registration.session
+        yield {
+            "exchange": str(registration.exchange),
+            "date_time": registration.date_time.isoformat(),
+            "priority": registration.priority,
+            "requestor": requestor.full_name,
+            "email": requestor.email,
+            "affiliation": requestor.get_affiliation(),
+            "session": registration.session_id,
+            "titles": session.titles if session is not None else None,
+        }
+
+
+class Echo:
+    """Returns what is written, so csv.writer can format a single row"""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def stream_csv(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    writer = csv.DictWriter(Echo(), fieldnames=EXPORT_FIELDS, delimiter=";")
+    # the byte order mark makes Excel read the file as UTF-8
+    yield "\ufeff" + writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_jsonl(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def streaming_export(
+    registrations: QuerySet, format: str, filename: str = "registrations"
+) -> StreamingHttpResponse:
+    """Responds with the registrations as a file download.
+
+    Args:
+        registrations (QuerySet): the registrations to export
+        format (str): one of EXPORT_FORMATS
+        filename (str): name of the file, without the extension
+
+    Returns:
+        StreamingHttpResponse: the response
+    """
+    rows = export_rows(registrations)
+    if format == "csv":
+        content = stream_csv(rows)
+    elif format == "jsonl":
+        content = stream_jsonl(rows)
+    else:
+        raise ValueError(f"Unknown format {format}")
+
+    response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[format])
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{format}"'
+    return response
@@ -0,0 +1,47 @@
+import csv
+import json
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from registration.factories import grow
+from registration.models import Registration
+
+
+def download(client, url: str, data=None):
+    with CaptureQueriesContext(connection) as context:
+        response = client.post(url, data) if data else client.get(url)
+        assert response.status_code == 200
+        assert response.streaming
+        content = b"".join(response.streaming_content).decode("utf-8")
+    return content, len(context.captured_queries)
+
+
+def test_export_csv(world, admin_client):
+    grow(world, 3)
+    content, queries = download(admin_client, "/api/export/registrations.csv")
+    rows = list(csv.DictReader(content.lstrip("\ufeff").splitlines(), delimiter=";"))
+    assert len(rows) == Registration.objects.count()
+    assert rows[0]["requestor"] == "person Test"
+    assert rows[0]["affiliation"].startswith("department1")
+
+    grow(world, 3)
+    assert download(admin_client, "/api/export/registrations.csv")[1] == queries
+
+
+def test_export_action(world, admin_client):
+    grow(world, 2)
+    pks = list(Registration.objects.values_list("pk", flat=True)[:3])
+    content, _ = download(
+        admin_client,
+        "/admin/registration/registration/",
+        {"action": "export_jsonl", "_selected_action": pks},
+    )
+    rows = [json.loads(line) for line in content.splitlines()]
+    assert len(rows) == 3
+    assert all(row["titles"] for row in rows)
+
+
+def test_export_unknown_format(world, admin_client):
+    response = admin_client.get("/api/export/registrations.xlsx")
+    assert response.status_code == 404
@@ -0,0 +1,81 @@
+"""Creates the objects used by the tests."""
+
+import datetime
+
+from django.contrib.auth.models import User
+
+from registration.models import (
+    Department,
+    DepartmentDescription,
+    Exchange,
+    ExchangeSession,
+    ExchangeSessionDescription,
+    Person,
+    PersonMail,
+    Registration,
+)
+
+
+def add_department(slug: str) -> Department:
+    department = Department.objects.create(slug=slug)
+    for language in ["nl", "en"]:
+        DepartmentDescription.objects.create(
+            department=department, name=f"{slug} {language}", language=language
+        )
+    return department
+
+
+def add_session(exchange: Exchange, department: Department) -> ExchangeSession:
+    session = ExchangeSession.objects.create(
+        exchange=exchange,
+        department=department,
+        participants_min=1,
+        participants_max=10,
+        session_count=1,
+    )
+    for language in ["nl", "en"]:
+        ExchangeSessionDescription.objects.create(
+            exchange=session,
+            title=f"{department.slug} {language}",
+            subtitle=language,
+            intro="",
+            program="",
+            language=language,
+            date="",
+            location="",
+        )
+    return session
+
+
+def add_person(name: str) -> Person:
+    user = User.objects.create(
+        username=name, first_name=name, last_name="Test", email=f"{name}@uu.nl"
+    )
+    return user.person
+
+
+def grow(world, count: int) -> None:
+    """Adds rows to every list and relation shown in the admin"""
+    for _ in range(count):
+        world["count"] += 1
+        i = world["count"]
+        department = add_department(f"department{i}")
+        session = add_session(world["exchange"], department)
+        other_session = add_session(world["exchange"], world["department"])
+        person = add_person(f"person{i}")
+        person.departments.add(department, world["department"])
+        PersonMail.objects.create(person=person, address=f"alias{i}@example.org")
+
+        session.assigned.add(world["person"], person)
+        world["session"].assigned.add(person)
+        other_session.organizers.add(world["person"])
+        world["department"].contact_persons.add(person)
+        world["person"].departments.add(department)
+        for priority, registered in enumerate([session, other_session], 1):
+            Registration.objects.create(
+                requestor=world["person"],
+                session=registered,
+                exchange=world["exchange"],
+                priority=priority,
+                date_time=datetime.datetime.now(datetime.timezone.utc),
+            )
@@ -0,0 +1,190 @@
+"""Renders the mails stored in the database.
+
+The {{placeholder}} templates are compiled to a format string when a
+mail is first needed, and cached per (type, language) together with the
+names of the team. Compiling reports the placeholders which aren't known
+for the type of mail. The cache entries expire after MAIL_CACHE_TIMEOUT,
+so the changes made in another process are picked up; in this process
+they are dropped right away.
+"""
+
+from typing import Dict, Iterable, Optional, Tuple
+import logging
+import re
+
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from registration.models import LANGUAGES, Mail, Person
+
+DEFAULT_LANGUAGE = "nl"
+
+PLACEHOLDER = re.compile(r"{{(\w+)}}")
+
+# the placeholders which can be used for each type of mail
+PLACEHOLDERS: Dict[str, Tuple[str, ...]] = {
+    "confirm_registration": ("given_names", "team"),
+    "assigned": ("given_names", "assigned", "team"),
+    "overview_assigned": (
+        "choice",
+        "organizers",
+        "count",
+        "choice_assignments",
+        "team",
+    ),
+    "no_participants": (
+        "choice",
+        "organizers",
+        "count",
+        "choice_assignments",
+        "team",
+    ),
+}
+
+MAIL_CACHE_TIMEOUT = 60
+
+TEAM_CACHE_KEY = "mail:team"
+
+logger = logging.getLogger(__name__)
+
+
+class MailTemplateError(ValueError):
+    pass
+
+
+class Placeholders(dict):
+    """Leaves the placeholders without a value as they are"""
+
+    def __missing__(self, name: str) -> str:
+        return f"{{{{{name}}}}}"
+
+
+class Template:
+    """A {{placeholder}} template compiled to a format string. The known
+    placeholders are only checked when given, e.g. when editing a mail.
+    """
+
+    def __init__(self, text: str, placeholders: Optional[Iterable[str]] = None):
+        parts = PLACEHOLDER.split(text)
+        # the odd parts are the placeholder names
+        self.placeholders = set(parts[1::2])
+        if placeholders is not None:
+            unknown = self.placeholders - set(placeholders)
+            if unknown:
+                raise MailTemplateError(
+                    "Unknown placeholder(s): "
+                    + ", ".join(f"{{{{{name}}}}}" for name in sorted(unknown))
+                )
+
+        self.format = "".join(
+            "{" + part + "}"
+            if i % 2
+            else part.replace("{", "{{").replace("}", "}}")
+            for i, part in enumerate(parts)
+        )
+
+    def render(self, data: Dict[str, str]) -> str:
+        return self.format.format_map(Placeholders(data))
+
+
+class CompiledMail:
+    def __init__(self, mail: Mail):
+        """Compiles the subject and text of a mail.
+
+        Raises:
+            MailTemplateError: for placeholders unknown for the type of mail
+        """
+        self.type = mail.type
+        self.language = mail.language
+        placeholders = PLACEHOLDERS.get(mail.type)
+        try:
+            self.subject = Template(mail.subject, placeholders)
+            self.text = Template(mail.text, placeholders)
+        except MailTemplateError as error:
+            raise MailTemplateError(f"{mail.type} mail ({mail.language}): {error}")
+
+    def render(self, data: Dict[str, str]) -> Tuple[str, str]:
+        """Renders the subject and text of this mail.
+
+        Args:
+            data (Dict[str, str]): value for each placeholder
+
+        Returns:
+            Tuple[str, str]: subject and text
+        """
+        return self.subject.render(data), self.text.render(data)
+
+
+def mail_key(type: str, language: str) -> str:
+    return f"mail:{type}:{language}"
+
+
+def get_mail(type: str, language: str) -> CompiledMail:
+    """Gets a compiled mail; falls back to the default language, which
+    is logged as a warning.
+
+    Args:
+        type (str): type of mail, see Mail.MAIL_TYPES
+        language (str): preferred language
+
+    Raises:
+        Mail.DoesNotExist: neither in the language nor in the default
+        MailTemplateError: for placeholders unknown for the type of mail
+
+    Returns:
+        CompiledMail: the mail
+    """
+    language = language or DEFAULT_LANGUAGE
+    key = mail_key(type, language)
+    mail = cache.get(key)
+    if mail is None:
+        mails = {
+            mail.language: mail
+            for mail in Mail.objects.filter(
+                type=type, language__in=[language, DEFAULT_LANGUAGE]
+            )
+        }
+        if language not in mails:
+            if DEFAULT_LANGUAGE not in mails:
+                raise Mail.DoesNotExist(f"No {type} mail for {language}")
+            logger.warning(
+                "No %s mail for %s, using %s instead", type, language, DEFAULT_LANGUAGE
+            )
+        mail = CompiledMail(mails.get(language) or mails[DEFAULT_LANGUAGE])
+        cache.set(key, mail, timeout=MAIL_CACHE_TIMEOUT)
+
+    return mail
+
+
+def get_team_str() -> str:
+    team = cache.get(TEAM_CACHE_KEY)
+    if team is None:
+        group = Group.objects.get(name="Team")
+        persons = (
+            Person.objects.select_related("user")
+            .filter(user__groups=group)
+            .order_by("sort_name")
+        )
+        team = ", ".join(person.full_name for person in persons)
+        cache.set(TEAM_CACHE_KEY, team, timeout=MAIL_CACHE_TIMEOUT)
+
+    return team
+
+
+@receiver(post_save, sender=Mail)
+@receiver(post_delete, sender=Mail)
+def mail_changed(sender, instance: Mail, **kwargs):
+    # the other languages might fall back to this mail
+    cache.delete_many([mail_key(instance.type, language) for language, _ in LANGUAGES])
+
+
+@receiver(post_save, sender=Person)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(m2m_changed, sender=User.groups.through)
+def team_changed(sender, **kwargs):
+    cache.delete(TEAM_CACHE_KEY)
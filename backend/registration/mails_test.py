@@ -0,0 +1,43 @@
+import pytest
+
+from registration.mails import MailTemplateError, Template, get_mail
+from registration.models import Mail
+
+
+def test_template():
+    template = Template("Dear {{given_names}}, {{unknown}} {not a placeholder}")
+
+    assert template.render({"given_names": "Jan"}) == (
+        "Dear Jan, {{unknown}} {not a placeholder}"
+    )
+    with pytest.raises(MailTemplateError):
+        Template("{{unknown}}", ["given_names"])
+
+
+def test_get_mail(db, caplog):
+    Mail.objects.create(
+        type="assigned", language="nl", subject="{{unknown}}", text="Hoi {{assigned}}"
+    )
+    confirm = Mail.objects.create(
+        type="confirm_registration",
+        language="nl",
+        subject="Bevestiging",
+        text="Hoi {{given_names}}",
+    )
+
+    # falls back to the default language
+    mail = get_mail("confirm_registration", "en")
+    assert mail.render({"given_names": "Jan"}) == ("Bevestiging", "Hoi Jan")
+    assert "No confirm_registration mail for en" in caplog.text
+    # reported when compiling, before rendering any mail
+    with pytest.raises(MailTemplateError, match="{{unknown}}"):
+        get_mail("assigned", "nl")
+
+    confirm.text = "Hallo {{given_names}}"
+    confirm.save()
+    assert get_mail("confirm_registration", "en").render({"given_names": "Jan"}) == (
+        "Bevestiging",
+        "Hallo Jan",
+    )
+    with pytest.raises(Mail.DoesNotExist):
+        get_mail("no_participants", "nl")
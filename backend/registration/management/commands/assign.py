@@ -1,7 +1,14 @@
 from typing import Any, Dict, List, Set
 from django.core.management.base import BaseCommand
 
-from registration.models import Exchange, ExchangeSession, Person, Registration
+from registration.models import (
+    Exchange,
+    ExchangeSession,
+    Participation,
+    Person,
+    Registration,
+)
+from wisselwerking.instrumentation import instrument
 
 
 class Command(BaseCommand):
@@ -16,6 +23,11 @@ class Command(BaseCommand):
     session_counts: Dict[any, int] = {}
 
     def handle(self, *args, **options):
+        # update the statistics once the assignment is done
+        with instrument("command:assign"), Participation.objects.deferred():
+            self.assign()
+
+    def assign(self):
         self.exchange = Exchange.objects.get(active=True)
 
         # clear all current assignments
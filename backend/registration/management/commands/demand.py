@@ -0,0 +1,33 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from registration.demand import DEMAND_FIELDS, demand_report
+from registration.models import Exchange
+from wisselwerking.instrumentation import instrument
+
+
+class Command(BaseCommand):
+    help = "Reports the demand versus the capacity of the sessions"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--exchange",
+            type=int,
+            default=None,
+            help="Begin year of the exchange, defaults to the active exchange",
+        )
+
+    @instrument("command:demand")
+    def handle(self, *args, **options):
+        if options["exchange"] is None:
+            exchange = Exchange.objects.get(active=True)
+        else:
+            try:
+                exchange = Exchange.objects.get(begin=options["exchange"])
+            except Exchange.DoesNotExist:
+                raise CommandError(f"Exchange {options['exchange']} does not exist")
+
+        writer = csv.DictWriter(self.stdout, fieldnames=DEMAND_FIELDS, delimiter=";")
+        writer.writeheader()
+        writer.writerows(demand_report(exchange))
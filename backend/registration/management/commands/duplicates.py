@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from registration.duplicates import DEFAULT_MIN_SCORE, find_duplicates
+from wisselwerking.instrumentation import instrument
+
+
+class Command(BaseCommand):
+    help = "Lists person records which are likely to be duplicates"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-score",
+            type=float,
+            default=DEFAULT_MIN_SCORE,
+            help="Minimal similarity (0-1) of two records",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=None, help="Maximum number of clusters"
+        )
+
+    @instrument("command:duplicates")
+    def handle(self, *args, **options):
+        duplicates = find_duplicates(min_score=options["min_score"])
+        clusters = duplicates.clusters
+        if options["limit"] is not None:
+            clusters = clusters[: options["limit"]]
+
+        for cluster in clusters:
+            self.stdout.write(f"{cluster.score:.2f} ({'; '.join(cluster.reasons)})")
+            for person in cluster.persons:
+                self.stdout.write(f" - {person} (pk={person.pk})")
+
+        self.stdout.write(f"Clusters: {len(clusters)}")
+        for key, size in duplicates.skipped.items():
+            self.stderr.write(f"Skipped block {key} of {size} records")
@@ -1,21 +1,21 @@
 import csv
 import pathlib
-from typing import Dict, List, Tuple
-from django.contrib.auth.models import User, Group
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Set, Tuple
 from django.core.management.base import BaseCommand, CommandError
 import os
 import datetime
+import shutil
+import tempfile
 
+from registration.mails import DEFAULT_LANGUAGE, CompiledMail, get_mail, get_team_str
 from registration.models import (
     Exchange,
     ExchangeSession,
     ExchangeSessionDescription,
-    Mail,
     Person,
-    get_team_str,
 )
-
-DEFAULT_LANGUAGE = "nl"
+from wisselwerking.instrumentation import instrument
 
 ENROLLMENT_ADD = "_fd_Add"
 ENROLLMENT_MAIL = "e_mailadres"
@@ -24,12 +24,90 @@ ENROLLMENT_MAIL_SUBJECT = "onderwerp"
 ENROLLMENT_MAIL_CONTENT = "bericht"
 
 
+class Lookup:
+    """Everything needed to enrich a file, loaded using a few bulk queries"""
+
+    persons: Dict[str, Person]
+    exchanges: Dict[int, Exchange]
+    # key is (person pk, exchange pk), the sessions ordered by pk
+    assigned: Dict[Tuple[Any, Any], List[Any]]
+    # key is (session pk, language)
+    titles: Dict[Tuple[Any, str], str]
+
+    def __init__(self, emails: Set[str], years: Set[int]):
+        self.persons = {
+            person.email.lower(): person
+            for person in Person.objects.select_related("user").filter(
+                user__email__in=emails
+            )
+        }
+        for email in emails:
+            if email not in self.persons:
+                raise CommandError(
+                    f"User {email} does not exist. Import the file first."
+                )
+
+        self.exchanges = {
+            exchange.begin: exchange
+            for exchange in Exchange.objects.filter(begin__in=years)
+        }
+        for year in years:
+            if year not in self.exchanges:
+                raise CommandError(
+                    f"Exchange {year}-{year + 1} does not exist. Import the file first."
+                )
+
+        assignments = ExchangeSession.assigned.through.objects.filter(
+            person__in=self.persons.values(),
+            exchangesession__exchange__in=self.exchanges.values(),
+        ).order_by("exchangesession_id").values_list(
+            "person_id", "exchangesession__exchange_id", "exchangesession_id"
+        )
+        self.assigned = {}
+        for person_id, exchange_id, session_id in assignments:
+            self.assigned.setdefault((person_id, exchange_id), []).append(session_id)
+
+        self.titles = {}
+        for session_id, language, title in (
+            ExchangeSessionDescription.objects.filter(
+                exchange_id__in=set(
+                    session_id
+                    for sessions in self.assigned.values()
+                    for session_id in sessions
+                )
+            )
+            .order_by("-pk")
+            .values_list("exchange_id", "language", "title")
+        ):
+            self.titles[(session_id, language)] = title
+
+    def get_sessions(self, person: Person, exchange: Exchange) -> List[Any]:
+        try:
+            return self.assigned[(person.pk, exchange.pk)]
+        except KeyError:
+            raise ExchangeSession.DoesNotExist(
+                f"{person} is not assigned to a session in {exchange}"
+            )
+
+    def get_title(self, session_id: Any, language: str) -> str:
+        try:
+            return self.titles[(session_id, language or DEFAULT_LANGUAGE)]
+        except KeyError:
+            try:
+                return self.titles[(session_id, DEFAULT_LANGUAGE)]
+            except KeyError:
+                raise ExchangeSessionDescription.DoesNotExist(
+                    f"No description for session {session_id}"
+                )
+
+
 class Command(BaseCommand):
     help = "Enriches data of an existing enrollments"
 
     def add_arguments(self, parser):
         parser.add_argument("files", nargs="+", type=str)
 
+    @instrument("command:enrich")
     def handle(self, *args, **options):
         project_root = pathlib.Path(
             __file__
@@ -40,115 +118,115 @@ class Command(BaseCommand):
             if not os.path.isfile(filepath):
                 raise CommandError(f"File {filepath} does not exist")
 
-            enriched, fieldnames = self.enrich_data(filepath)
-            self.write_data(filepath, fieldnames, enriched)
+            lookup = self.preload(filepath)
+            self.write_data(filepath, lookup)
 
-    def enrich_data(self, filepath: str) -> Tuple[List[List[str]], List[str]]:
-        output: List[Dict[str, str]] = []
-        team = get_team_str()
+    def read_rows(self, filepath: str) -> Iterator[Dict[str, str]]:
         with open(filepath, mode="r", encoding="utf-8-sig") as csv_file:
             csv_reader = csv.DictReader(csv_file, delimiter=";")
+            yield from csv_reader
 
-            for row in csv_reader:
-                email = row[ENROLLMENT_MAIL].lower()
-
-                try:
-                    user = User.objects.get(email=email)
-                except User.DoesNotExist:
-                    raise CommandError(
-                        f"User {email} does not exist. Import the file first."
-                    )
-
-                try:
-                    person = Person.objects.get(user=user)
-                except Person.DoesNotExist:
-                    raise CommandError(
-                        f"Person {email} does not exist. Import the file first."
-                    )
-
-                add = None
-                for format in [
-                    "%d-%m-%Y %H:%M",
-                    "%d-%m-%Y, %H:%M",
-                    "%d-%m-%y %H:%M",
-                    "%d-%m-%Y",
-                    "%d-%m-%y",
-                ]:
-                    try:
-                        add = datetime.datetime.strptime(
-                            row[ENROLLMENT_ADD], format
-                        ).astimezone()
-                    except ValueError:
-                        continue
-                    break
-                if add is None:
-                    raise ValueError(f"Could not parse {row[ENROLLMENT_ADD]}")
-
-                try:
-                    exchange = Exchange.objects.get(begin=add.year)
-                except Exchange.DoesNotExist:
-                    raise CommandError(
-                        f"Exchange {add.year}-{add.year + 1} does not exist. Import the file first."
-                    )
-
-                assigned = ExchangeSession.objects.get(
-                    assigned=person, exchange=exchange
-                )
-                try:
-                    mail = Mail.objects.get(
-                        type="assigned", language=person.language or DEFAULT_LANGUAGE
-                    )
-                except Mail.DoesNotExist:
-                    mail = Mail.objects.get(type="assigned", language=DEFAULT_LANGUAGE)
-                try:
-                    title = ExchangeSessionDescription.objects.get(
-                        exchange=assigned, language=person.language or DEFAULT_LANGUAGE
-                    ).title
-                except ExchangeSessionDescription.DoesNotExist:
-                    title = ExchangeSessionDescription.objects.get(
-                        exchange=assigned, language=DEFAULT_LANGUAGE
-                    ).title
-
-                row[ENROLLMENT_ASSIGNED] = title
-                row[ENROLLMENT_MAIL_SUBJECT], row[ENROLLMENT_MAIL_CONTENT] = (
-                    self.prepare_mail(person, mail, title, team)
+    def read_fieldnames(self, filepath: str) -> List[str]:
+        with open(filepath, mode="r", encoding="utf-8-sig") as csv_file:
+            return list(csv.DictReader(csv_file, delimiter=";").fieldnames)
+
+    def preload(self, filepath: str) -> Lookup:
+        enrollments: Counter[Tuple[str, int]] = Counter()
+        for row in self.read_rows(filepath):
+            enrollments[
+                (row[ENROLLMENT_MAIL].lower(), parse_add(row[ENROLLMENT_ADD]).year)
+            ] += 1
+
+        # the rows are all enriched, with the same assignment
+        for (email, year), count in enrollments.items():
+            if count > 1:
+                self.stderr.write(
+                    f"{email} enrolled {count} times for {year}-{year + 1}"
                 )
-                output.append(row)
 
-            return output, list(csv_reader.fieldnames) + [
-                ENROLLMENT_ASSIGNED,
-                ENROLLMENT_MAIL_SUBJECT,
-                ENROLLMENT_MAIL_CONTENT,
-            ]
+        lookup = Lookup(
+            set(email for email, _ in enrollments), set(year for _, year in enrollments)
+        )
+        # all their sessions are listed
+        for email, year in enrollments:
+            exchange = lookup.exchanges[year]
+            sessions = lookup.assigned.get((lookup.persons[email].pk, exchange.pk), [])
+            if len(sessions) > 1:
+                self.stderr.write(
+                    f"{email} is assigned to {len(sessions)} sessions in {exchange}"
+                )
+        return lookup
 
-    def write_data(
-        self, filepath: str, fieldnames: List[str], enriched: List[Dict[str, str]]
-    ) -> None:
+    def enrich_data(self, filepath: str, lookup: Lookup) -> Iterator[Dict[str, str]]:
+        team = get_team_str()
+        for row in self.read_rows(filepath):
+            person = lookup.persons[row[ENROLLMENT_MAIL].lower()]
+            exchange = lookup.exchanges[parse_add(row[ENROLLMENT_ADD]).year]
+
+            mail = get_mail("assigned", person.language)
+            title = ", ".join(
+                lookup.get_title(session_id, person.language)
+                for session_id in lookup.get_sessions(person, exchange)
+            )
+
+            row[ENROLLMENT_ASSIGNED] = title
+            row[ENROLLMENT_MAIL_SUBJECT], row[ENROLLMENT_MAIL_CONTENT] = (
+                self.prepare_mail(person, mail, title, team)
+            )
+            yield row
+
+    def write_data(self, filepath: str, lookup: Lookup) -> None:
         target_filepath, extension = os.path.splitext(filepath)
         target_filepath += "_out" + extension
 
-        with open(target_filepath, mode="w", encoding="utf-8-sig") as csv_file:
-            csv_writer = csv.DictWriter(csv_file, delimiter=";", fieldnames=fieldnames)
-            csv_writer.writeheader()
-            csv_writer.writerows(enriched)
+        fieldnames = self.read_fieldnames(filepath) + [
+            ENROLLMENT_ASSIGNED,
+            ENROLLMENT_MAIL_SUBJECT,
+            ENROLLMENT_MAIL_CONTENT,
+        ]
+
+        # written to a temporary file first, so a failure doesn't leave a
+        # partial output file
+        handle, temp_filepath = tempfile.mkstemp(
+            suffix=extension, dir=os.path.dirname(target_filepath)
+        )
+        try:
+            with open(handle, mode="w", encoding="utf-8-sig") as csv_file:
+                csv_writer = csv.DictWriter(
+                    csv_file, delimiter=";", fieldnames=fieldnames
+                )
+                csv_writer.writeheader()
+                for row in self.enrich_data(filepath, lookup):
+                    csv_writer.writerow(row)
+            # mkstemp() only allows the owner to read the file
+            shutil.copymode(filepath, temp_filepath)
+            os.replace(temp_filepath, target_filepath)
+        except BaseException:
+            os.remove(temp_filepath)
+            raise
 
     def prepare_mail(
-        self, person: Person, mail: Mail, assigned: str, team: str
+        self, person: Person, mail: CompiledMail, assigned: str, team: str
     ) -> Tuple[str, str]:
         data = {
             "given_names": person.given_names.strip(),
             "assigned": assigned,
             "team": team,
         }
-        return self.enrich_mail(mail.subject, data), self.enrich_mail(mail.text, data)
-
-    def enrich_mail(self, text: str, data: Dict[str, str]) -> str:
-        for key, value in data.items():
-            text = text.replace(f"{{{{{key}}}}}", value)
-
-        return text
-
-    def get_team_str(self) -> str:
-        team = Group.objects.get(name="Team")
-        persons = Person.objects.filter(user__groups=team).order_by("user__first_name")
-        return ", ".join(person.full_name for person in persons)
+        return mail.render(data)
+
+
+def parse_add(value: str) -> datetime.datetime:
+    for format in [
+        "%d-%m-%Y %H:%M",
+        "%d-%m-%Y, %H:%M",
+        "%d-%m-%y %H:%M",
+        "%d-%m-%Y",
+        "%d-%m-%y",
+    ]:
+        try:
+            return datetime.datetime.strptime(value, format).astimezone()
+        except ValueError:
+            continue
+
+    raise ValueError(f"Could not parse {value}")
@@ -0,0 +1,55 @@
+import os
+import pathlib
+
+from django.core.management.base import BaseCommand, CommandError
+
+from registration.catalogue import FORMATS, export_catalogue, write_catalogue
+from registration.models import Exchange
+from wisselwerking.instrumentation import instrument
+
+
+class Command(BaseCommand):
+    help = "Exports the sessions of an exchange as a JSONL or CSV catalogue"
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", type=str)
+        parser.add_argument(
+            "--exchange",
+            type=int,
+            default=None,
+            help="Begin year of the exchange, defaults to the active exchange",
+        )
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            default=None,
+            help="Defaults to the extension of the file",
+        )
+
+    @instrument("command:export_catalogue")
+    def handle(self, *args, **options):
+        project_root = pathlib.Path(
+            __file__
+        ).parent.parent.parent.parent.parent.resolve()
+        filepath = os.path.join(project_root, options["file"])
+
+        exchange = get_exchange(options["exchange"])
+        format = get_format(filepath, options["format"])
+        write_catalogue(filepath, format, export_catalogue(exchange))
+
+
+def get_exchange(begin) -> Exchange:
+    if begin is None:
+        return Exchange.objects.get(active=True)
+    try:
+        return Exchange.objects.get(begin=begin)
+    except Exchange.DoesNotExist:
+        raise CommandError(f"Exchange {begin} does not exist")
+
+
+def get_format(filepath: str, format) -> str:
+    if format is None:
+        format = os.path.splitext(filepath)[1].lstrip(".").lower()
+    if format not in FORMATS:
+        raise CommandError(f"Unknown format {format}, use one of {', '.join(FORMATS)}")
+    return format
@@ -11,11 +11,13 @@ from registration.models import (
     Exchange,
     ExchangeSession,
     Department,
+    Participation,
     Person,
     PersonMail,
     Registration,
     unique_username,
 )
+from wisselwerking.instrumentation import instrument
 
 ENROLLMENT_ADD = "_fd_Add"
 ENROLLMENT_FIRSTNAME = "voornaam"
@@ -45,6 +47,7 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("files", nargs="+", type=str)
 
+    @instrument("command:import")
     def handle(self, *args, **options):
         project_root = pathlib.Path(
             __file__
@@ -65,12 +68,14 @@ class Command(BaseCommand):
             for name in names:
                 dept_lookup[name] = department
 
-        for filename in options["files"]:
-            filepath = os.path.join(project_root, filename)
-            if not os.path.isfile(filepath):
-                raise CommandError(f"File {filepath} does not exist")
+        # refreshes the participations once, after importing everything
+        with Participation.objects.deferred():
+            for filename in options["files"]:
+                filepath = os.path.join(project_root, filename)
+                if not os.path.isfile(filepath):
+                    raise CommandError(f"File {filepath} does not exist")
 
-            read_history_year(filepath)
+                read_history_year(filepath)
 
 
 def read_history_year(filepath: str):
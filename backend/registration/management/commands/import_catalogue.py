@@ -0,0 +1,83 @@
+import os
+import pathlib
+
+from django.core.management.base import BaseCommand, CommandError
+
+from registration.catalogue import (
+    FORMATS,
+    CatalogueError,
+    DeletesRegistrationsError,
+    import_catalogue,
+    read_catalogue,
+)
+from registration.management.commands.export_catalogue import get_exchange, get_format
+from wisselwerking.instrumentation import instrument
+
+
+class Command(BaseCommand):
+    help = "Updates the sessions of an exchange from a JSONL or CSV catalogue"
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", type=str)
+        parser.add_argument(
+            "--exchange",
+            type=int,
+            default=None,
+            help="Begin year of the exchange, defaults to the active exchange",
+        )
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            default=None,
+            help="Defaults to the extension of the file",
+        )
+        parser.add_argument(
+            "--delete",
+            action="store_true",
+            help="Delete the sessions missing in the file",
+        )
+        parser.add_argument(
+            "--delete-registrations",
+            action="store_true",
+            help="Confirm deleting the registrations of the deleted sessions",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list the differences",
+        )
+
+    def handle(self, *args, **options):
+        project_root = pathlib.Path(
+            __file__
+        ).parent.parent.parent.parent.parent.resolve()
+        filepath = os.path.join(project_root, options["file"])
+        if not os.path.isfile(filepath):
+            raise CommandError(f"File {filepath} does not exist")
+
+        exchange = get_exchange(options["exchange"])
+        format = get_format(filepath, options["format"])
+        try:
+            with instrument("command:import_catalogue"):
+                diff = import_catalogue(
+                    exchange,
+                    read_catalogue(filepath, format),
+                    delete=options["delete"],
+                    dry_run=options["dry_run"],
+                    delete_registrations=options["delete_registrations"],
+                )
+        except DeletesRegistrationsError as error:
+            raise CommandError(
+                f"Nothing imported:\n{error}\n"
+                "Use --delete-registrations to delete these registrations"
+            )
+        except CatalogueError as error:
+            raise CommandError(f"Nothing imported:\n{error}")
+
+        for change in diff.changes:
+            self.stdout.write(change)
+        self.stdout.write(
+            f"Sessions: {diff.created} new, {diff.updated} changed, "
+            f"{diff.deleted} deleted, {diff.unchanged} unchanged"
+            + (" (dry run, nothing saved)" if options["dry_run"] else "")
+        )
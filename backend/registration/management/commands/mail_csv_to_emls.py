@@ -3,6 +3,8 @@ import pathlib
 from django.core.management.base import BaseCommand, CommandError
 import os
 
+from registration.outbox import build_message, write_emls
+
 RECEIVERS = "ontvangers"
 MAIL_SUBJECT = "onderwerp"
 MAIL_CONTENT = "bericht"
@@ -26,28 +28,12 @@ class Command(BaseCommand):
 
             with open(filepath, encoding="utf-8-sig") as csvfile:
                 reader = csv.DictReader(csvfile, delimiter=";")
-                i = 0
-                for row in reader:
-                    mail = create_mail(
-                        row[MAIL_SUBJECT], row[RECEIVERS], row[MAIL_CONTENT]
-                    )
-
-                    with open(
-                        f"{filepath}_{i}.eml", mode="w", encoding="utf-8-sig", newline='\r\n'
-                    ) as mailfile:
-                        mailfile.write(mail)
-
-                    i += 1
-
-
-def create_mail(subject, to, content):
-    return f"""Content-Type: text/plain; charset="utf-8"
-Content-Transfer-Encoding: quoted-printable
-MIME-Version: 1.0
-To: {to}
-From: wisselwerking.gw@uu.nl
-Subject: {subject}
-X-Unsent: 1
-
-{content.strip()}
-"""
+                write_emls(
+                    filepath,
+                    (
+                        build_message(
+                            row[RECEIVERS], row[MAIL_SUBJECT], row[MAIL_CONTENT]
+                        )
+                        for row in reader
+                    ),
+                )
@@ -1,23 +1,28 @@
+from concurrent.futures import ProcessPoolExecutor
 import csv
+import functools
+import itertools
+import multiprocessing
 import pathlib
-from typing import Dict, List, Tuple
-from django.contrib.auth.models import Group
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Prefetch, QuerySet
 import os
 
+from registration.mails import DEFAULT_LANGUAGE, CompiledMail, get_mail, get_team_str
+from registration.outbox import OUTPUT_FORMATS, build_message, write_mbox, write_zip
 from registration.models import (
     Exchange,
     ExchangeSession,
-    Mail,
     Person,
-    get_team_str,
 )
-
-DEFAULT_LANGUAGE = "nl"
+from wisselwerking.instrumentation import instrument
 
 RECEIVERS = "ontvangers"
 MAIL_SUBJECT = "onderwerp"
 MAIL_CONTENT = "bericht"
+FIELDNAMES = [RECEIVERS, MAIL_SUBJECT, MAIL_CONTENT]
 
 MAIL_TYPE = "overview_assigned"
 CONJUNCT = {"en": " and ", "nl": " en "}
@@ -28,7 +33,9 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("files", nargs=1, type=str)
+        add_output_arguments(parser)
 
+    @instrument("command:organizers_mail")
     def handle(self, *args, **options):
         project_root = pathlib.Path(
             __file__
@@ -39,38 +46,28 @@ class Command(BaseCommand):
             if os.path.isfile(filepath):
                 raise CommandError(f"File {filepath} already exists!")
 
-            output, fieldnames = self.mail_info()
-            write_data(filepath, fieldnames, output)
+            output = generate_mails(session_mails, options["processes"])
+            write_output(filepath, options["format"], output)
 
-    def mail_info(self) -> Tuple[List[List[str]], List[str]]:
-        output: List[Dict[str, str]] = []
+    def mail_info(self, session_pks: List[Any]) -> Iterator[Dict[str, str]]:
         team = get_team_str()
 
-        exchange = Exchange.objects.get(active=True)
-        for session in ExchangeSession.objects.filter(exchange=exchange):
-            organizers: List[Person] = list(
-                session.organizers.all().order_by("user__first_name")
-            )
-            assigned: List[Person] = list(
-                session.assigned.all().order_by("user__first_name")
-            )
+        for session in mail_sessions(session_pks):
+            organizers: List[Person] = list(session.organizers.all())
+            assigned: List[Person] = list(session.assigned.all())
 
             mail = self.get_mail(organizers)
             mail_subject, mail_content = self.prepare_mail(
                 mail, session, organizers, assigned, team
             )
-            output.append(
-                {
-                    RECEIVERS: ", ".join(
-                        format_mail_person(organizer) for organizer in organizers
-                    )
-                    or session.department.email,
-                    MAIL_SUBJECT: mail_subject,
-                    MAIL_CONTENT: mail_content,
-                }
-            )
-
-        return output, [RECEIVERS, MAIL_SUBJECT, MAIL_CONTENT]
+            yield {
+                RECEIVERS: ", ".join(
+                    format_mail_person(organizer) for organizer in organizers
+                )
+                or session.department.email,
+                MAIL_SUBJECT: mail_subject,
+                MAIL_CONTENT: mail_content,
+            }
 
     def format_assigned(self, assigned: List[Person], mark_english: bool) -> str:
         output: List[str] = []
@@ -79,21 +76,18 @@ class Command(BaseCommand):
 
         return "\n".join(output)
 
-    def get_mail(self, organizers: List[Person]) -> Mail:
+    def get_mail(self, organizers: List[Person]) -> CompiledMail:
         language = DEFAULT_LANGUAGE
         for organizer in organizers:
             if organizer.language == "en":
                 language = "en"
                 break
 
-        try:
-            return Mail.objects.get(type=MAIL_TYPE, language=language)
-        except Mail.DoesNotExist:
-            return Mail.objects.get(type=MAIL_TYPE, language=DEFAULT_LANGUAGE)
+        return get_mail(MAIL_TYPE, language)
 
     def prepare_mail(
         self,
-        mail: Mail,
+        mail: CompiledMail,
         session: ExchangeSession,
         organizers: List[Person],
         assigned: List[Person],
@@ -117,7 +111,93 @@ class Command(BaseCommand):
             "choice_assignments": choice_assignments,
             "team": team,
         }
-        return enrich_mail(mail.subject, data), enrich_mail(mail.text, data)
+        return mail.render(data)
+
+
+def session_mails(session_pks: List[Any]) -> Iterator[Dict[str, str]]:
+    return Command().mail_info(session_pks)
+
+
+def add_output_arguments(parser) -> None:
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Divide the sessions over this many processes",
+    )
+    parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="csv",
+        help="Write a CSV file, or the messages in an mbox file or zip archive",
+    )
+
+
+def mail_sessions(session_pks: List[Any]) -> QuerySet:
+    """The sessions with everything needed to write their mails: the
+    descriptions, organizers and assigned persons are fetched in bulk.
+
+    Args:
+        session_pks (List[Any]): the sessions to fetch
+
+    Returns:
+        QuerySet: the sessions ordered by pk
+    """
+    persons = Person.objects.select_related("user").order_by("sort_name")
+    return (
+        ExchangeSession.objects.for_display()
+        .filter(pk__in=session_pks)
+        .prefetch_related(
+            Prefetch("organizers", queryset=persons),
+            Prefetch("assigned", queryset=persons),
+        )
+        .order_by("pk")
+    )
+
+
+def generate_mails(
+    session_mails: Callable[[List[Any]], Iterable[Dict[str, str]]], processes: int
+) -> Iterable[Dict[str, str]]:
+    """Generates the mails for the sessions of the active exchange. When
+    using multiple processes, each process generates the mails of a
+    consecutive shard of sessions.
+
+    Args:
+        session_mails (Callable[[List[Any]], Iterable[Dict[str, str]]]): module
+            level function generating the mails of the given sessions
+        processes (int): number of processes to use
+
+    Returns:
+        Iterable[Dict[str, str]]: the mails, ordered by session
+    """
+    exchange = Exchange.objects.get(active=True)
+    session_pks = list(
+        ExchangeSession.objects.filter(exchange=exchange)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+    if processes <= 1 or len(session_pks) <= 1:
+        return session_mails(session_pks)
+
+    size = -(-len(session_pks) // processes)
+    shards = [
+        session_pks[i:i + size] for i in range(0, len(session_pks), size)
+    ]
+
+    # the forked processes shouldn't share the connections of this one
+    connections.close_all()
+    with ProcessPoolExecutor(
+        len(shards), mp_context=multiprocessing.get_context("fork")
+    ) as executor:
+        shard_mails = executor.map(functools.partial(collect, session_mails), shards)
+        return list(itertools.chain.from_iterable(shard_mails))
+
+
+def collect(
+    session_mails: Callable[[List[Any]], Iterable[Dict[str, str]]],
+    session_pks: List[Any],
+) -> List[Dict[str, str]]:
+    return list(session_mails(session_pks))
 
 
 def conjunct(language: str, items: List[str]) -> str:
@@ -132,7 +212,7 @@ def format_mail_person(person: Person) -> str:
 
 
 def write_data(
-    filepath: str, fieldnames: List[str], enriched: List[Dict[str, str]]
+    filepath: str, fieldnames: List[str], enriched: Iterable[Dict[str, str]]
 ) -> None:
     with open(filepath, mode="w", encoding="utf-8-sig") as csv_file:
         csv_writer = csv.DictWriter(csv_file, delimiter=";", fieldnames=fieldnames)
@@ -140,14 +220,16 @@ def write_data(
         csv_writer.writerows(enriched)
 
 
-def enrich_mail(text: str, data: Dict[str, str]) -> str:
-    for key, value in data.items():
-        text = text.replace(f"{{{{{key}}}}}", value)
-
-    return text
-
+def write_output(filepath: str, format: str, mails: Iterable[Dict[str, str]]) -> None:
+    if format == "csv":
+        write_data(filepath, FIELDNAMES, mails)
+        return
 
-def get_team_str() -> str:
-    team = Group.objects.get(name="Team")
-    persons = Person.objects.filter(user__groups=team).order_by("user__first_name")
-    return ", ".join(person.full_name for person in persons)
+    messages = (
+        build_message(mail[RECEIVERS], mail[MAIL_SUBJECT], mail[MAIL_CONTENT])
+        for mail in mails
+    )
+    if format == "mbox":
+        write_mbox(filepath, messages)
+    else:
+        write_zip(filepath, messages)
@@ -1,22 +1,21 @@
 import pathlib
-from typing import Dict, List, Tuple
+from typing import Any, Dict, Iterator, List, Tuple
 from django.core.management.base import BaseCommand, CommandError
 import os
 
 from .organizers_mail import (
-    enrich_mail,
+    add_output_arguments,
     format_mail_person,
-    write_data,
+    generate_mails,
+    mail_sessions,
+    write_output,
 )
+from registration.mails import CompiledMail, get_mail, get_team_str
 from registration.models import (
-    Exchange,
     ExchangeSession,
-    Mail,
     Person,
-    get_team_str,
 )
-
-DEFAULT_LANGUAGE = "nl"
+from wisselwerking.instrumentation import instrument
 
 RECEIVERS = "ontvangers"
 MAIL_SUBJECT = "onderwerp"
@@ -31,7 +30,9 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("files", nargs=1, type=str)
+        add_output_arguments(parser)
 
+    @instrument("command:participants_mail")
     def handle(self, *args, **options):
         project_root = pathlib.Path(
             __file__
@@ -42,37 +43,27 @@ class Command(BaseCommand):
             if os.path.isfile(filepath):
                 raise CommandError(f"File {filepath} already exists!")
 
-            output, fieldnames = self.mail_info()
-            write_data(filepath, fieldnames, output)
+            output = generate_mails(session_mails, options["processes"])
+            write_output(filepath, options["format"], output)
 
-    def mail_info(self) -> Tuple[List[List[str]], List[str]]:
-        output: List[Dict[str, str]] = []
+    def mail_info(self, session_pks: List[Any]) -> Iterator[Dict[str, str]]:
         team = get_team_str()
 
-        exchange = Exchange.objects.get(active=True)
-        for session in ExchangeSession.objects.filter(exchange=exchange):
-            assigned: List[Person] = list(
-                session.assigned.all().order_by("user__first_name")
-            )
-
-            for participant in assigned:
-                mail = Mail.objects.get(type=MAIL_TYPE, language=participant.language)
+        for session in mail_sessions(session_pks):
+            for participant in session.assigned.all():
+                mail = get_mail(MAIL_TYPE, participant.language)
                 mail_subject, mail_content = self.prepare_mail(
                     mail, session, participant, team
                 )
-                output.append(
-                    {
-                        RECEIVERS: format_mail_person(participant),
-                        MAIL_SUBJECT: mail_subject,
-                        MAIL_CONTENT: mail_content,
-                    }
-                )
-
-        return output, [RECEIVERS, MAIL_SUBJECT, MAIL_CONTENT]
+                yield {
+                    RECEIVERS: format_mail_person(participant),
+                    MAIL_SUBJECT: mail_subject,
+                    MAIL_CONTENT: mail_content,
+                }
 
     def prepare_mail(
         self,
-        mail: Mail,
+        mail: CompiledMail,
         session: ExchangeSession,
         participant: Person,
         team: str,
@@ -82,4 +73,8 @@ class Command(BaseCommand):
             "assigned": session.get_name_by_lang(participant.language),
             "team": team,
         }
-        return enrich_mail(mail.subject, data), enrich_mail(mail.text, data)
+        return mail.render(data)
+
+
+def session_mails(session_pks: List[Any]) -> Iterator[Dict[str, str]]:
+    return Command().mail_info(session_pks)
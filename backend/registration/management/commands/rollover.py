@@ -0,0 +1,71 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from registration.models import Exchange
+from registration.rollover import RolloverError, rollover
+from wisselwerking.instrumentation import instrument
+
+
+class Command(BaseCommand):
+    help = "Copies an exchange with all its sessions to a next year"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--exchange",
+            type=int,
+            default=None,
+            help="Begin year of the exchange to copy, defaults to the active exchange",
+        )
+        parser.add_argument(
+            "--years", type=int, default=1, help="Number of years to move forward"
+        )
+        parser.add_argument(
+            "--enrollment-deadline",
+            type=datetime.date.fromisoformat,
+            default=None,
+            help="YYYY-MM-DD, defaults to the deadline of the copied exchange",
+        )
+        parser.add_argument(
+            "--shift-dates",
+            action="store_true",
+            help="Move the years mentioned in the descriptions",
+        )
+        parser.add_argument(
+            "--capacity-factor",
+            type=float,
+            default=1.0,
+            help="Multiplies the maximum number of participants of each session",
+        )
+        parser.add_argument(
+            "--activate",
+            action="store_true",
+            help="Make the new exchange the active one",
+        )
+
+    def handle(self, *args, **options):
+        if options["exchange"] is None:
+            source = Exchange.objects.get(active=True)
+        else:
+            try:
+                source = Exchange.objects.get(begin=options["exchange"])
+            except Exchange.DoesNotExist:
+                raise CommandError(f"Exchange {options['exchange']} does not exist")
+
+        try:
+            with instrument("command:rollover"):
+                exchange, result = rollover(
+                    source,
+                    years=options["years"],
+                    enrollment_deadline=options["enrollment_deadline"],
+                    shift_dates=options["shift_dates"],
+                    capacity_factor=options["capacity_factor"],
+                    activate=options["activate"],
+                )
+        except RolloverError as error:
+            raise CommandError(str(error))
+
+        self.stdout.write(
+            f"Created {exchange}: {result.sessions} sessions, "
+            f"{result.descriptions} descriptions and {result.organizers} organizers"
+        )
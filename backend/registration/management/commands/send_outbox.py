@@ -0,0 +1,65 @@
+import pathlib
+from django.core.management.base import BaseCommand, CommandError
+import os
+
+from registration.outbox import OutboxSender, Progress, read_messages
+
+
+class Command(BaseCommand):
+    help = "Sends the mails in a directory of .eml files, an mbox file or a zip archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument("outbox", type=str)
+        parser.add_argument(
+            "--threads", type=int, default=4, help="Number of SMTP connections"
+        )
+        parser.add_argument(
+            "--batch",
+            type=int,
+            default=50,
+            help="Number of messages to send before reconnecting",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=0,
+            help="Maximum number of messages per second, 0 for no limit",
+        )
+        parser.add_argument(
+            "--progress",
+            type=str,
+            help="File listing the sent messages, defaults to <outbox>.sent",
+        )
+
+    def handle(self, *args, **options):
+        project_root = pathlib.Path(
+            __file__
+        ).parent.parent.parent.parent.parent.resolve()
+
+        outbox = os.path.join(project_root, options["outbox"])
+        if not os.path.exists(outbox):
+            raise CommandError(f"Outbox {outbox} does not exist!")
+
+        progress = Progress(
+            os.path.join(project_root, options["progress"] or outbox + ".sent")
+        )
+        try:
+            sender = OutboxSender(
+                progress,
+                threads=options["threads"],
+                batch=options["batch"],
+                rate=options["rate"],
+            )
+            result = sender.send(read_messages(outbox))
+        finally:
+            progress.close()
+
+        for key, error in result.failed:
+            self.stderr.write(f"Could not send {key}: {error}")
+
+        self.stdout.write(
+            f"Sent {result.sent}, skipped {result.skipped} already sent, "
+            f"failed {len(result.failed)}"
+        )
+        if result.failed:
+            raise CommandError("Not all the mails were sent; run again to retry")
@@ -0,0 +1,62 @@
+from io import StringIO
+import stat
+
+import pytest
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+
+from registration.factories import add_department, add_person, add_session
+from registration.models import ExchangeSession
+
+
+def write_enrollments(path, *emails: str) -> str:
+    path.write_text(
+        "_fd_Add;e_mailadres\n"
+        + "".join(f"01-01-2023 10:00;{email}\n" for email in emails),
+        encoding="utf-8-sig",
+    )
+    return str(path)
+
+
+def test_enrich(world, tmp_path):
+    Group.objects.create(name="Team")
+    world["session"].assigned.add(world["person"])
+    filepath = write_enrollments(tmp_path / "enrollments.csv", *["person@uu.nl"] * 2)
+    stderr = StringIO()
+
+    call_command("enrich", filepath, stderr=stderr)
+
+    assert "person@uu.nl enrolled 2 times for 2023-2024" in stderr.getvalue()
+    rows = (tmp_path / "enrollments_out.csv").read_text("utf-8-sig").splitlines()
+    assert len(rows) == 3
+    assert rows[1].startswith("01-01-2023 10:00;person@uu.nl;history nl;Hoi;Hoi!")
+
+
+def test_enrich_failure(world, tmp_path):
+    Group.objects.create(name="Team")
+    add_person("unassigned")
+    filepath = write_enrollments(tmp_path / "enrollments.csv", "unassigned@uu.nl")
+
+    with pytest.raises(ExchangeSession.DoesNotExist):
+        call_command("enrich", filepath, stderr=StringIO())
+
+    assert [path.name for path in tmp_path.iterdir()] == ["enrollments.csv"]
+
+
+def test_enrich_several_sessions(world, tmp_path):
+    Group.objects.create(name="Team")
+    music = add_session(world["exchange"], add_department("music"))
+    world["session"].assigned.add(world["person"])
+    music.assigned.add(world["person"])
+    path = tmp_path / "enrollments.csv"
+    filepath = write_enrollments(path, "person@uu.nl")
+    path.chmod(0o644)
+    stderr = StringIO()
+
+    call_command("enrich", filepath, stderr=stderr)
+
+    assert "person@uu.nl is assigned to 2 sessions in 2023-2024" in stderr.getvalue()
+    output = tmp_path / "enrollments_out.csv"
+    rows = output.read_text("utf-8-sig").splitlines()
+    assert rows[1].startswith("01-01-2023 10:00;person@uu.nl;history nl, music nl;")
+    assert stat.S_IMODE(output.stat().st_mode) == 0o644
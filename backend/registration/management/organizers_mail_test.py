@@ -0,0 +1,46 @@
+from django.contrib.auth.models import Group
+
+from registration.factories import add_department, add_person, add_session
+from registration.management.commands import organizers_mail, participants_mail
+from registration.models import Mail
+
+
+def test_session_mails(world, django_assert_num_queries):
+    Group.objects.create(name="Team").user_set.add(world["person"].user)
+    Mail.objects.create(
+        type="overview_assigned",
+        language="nl",
+        subject="{{choice}}",
+        text="Beste {{organizers}}, {{count}} deelnemers:\n{{choice_assignments}}",
+    )
+    sessions = [
+        world["session"],
+        add_session(world["exchange"], add_department("music")),
+    ]
+    for i, session in enumerate(sessions):
+        session.organizers.add(add_person(f"organizer{i}"), add_person(f"other{i}"))
+        session.assigned.add(add_person(f"participant{i}"))
+    session_pks = [session.pk for session in sessions]
+
+    # the team (2), a mail of each type (2) and for each command the
+    # sessions with their descriptions, organizers and participants (5)
+    with django_assert_num_queries(14):
+        mails = list(organizers_mail.session_mails(session_pks))
+        mails += list(participants_mail.session_mails(session_pks))
+
+    assert mails[0] == {
+        organizers_mail.RECEIVERS: "organizer0 Test <organizer0@uu.nl>, "
+        "other0 Test <other0@uu.nl>",
+        organizers_mail.MAIL_SUBJECT: "history nl nl",
+        organizers_mail.MAIL_CONTENT: "Beste organizer0 en other0, 1 deelnemers:\n"
+        " - participant0 Test <participant0@uu.nl>",
+    }
+    assert mails[1][organizers_mail.MAIL_SUBJECT] == "music nl nl"
+    assert mails[2:] == [
+        {
+            participants_mail.RECEIVERS: f"participant{i} Test <participant{i}@uu.nl>",
+            participants_mail.MAIL_SUBJECT: "Hoi",
+            participants_mail.MAIL_CONTENT: "Hoi!",
+        }
+        for i in range(2)
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.14 on 2026-10-19 12:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registration', '0004_alter_registration_notes_alter_registration_reason'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Participation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('affiliation', models.CharField(blank=True)),
+                ('choice', models.CharField(blank=True)),
+                ('exchange', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='registration.exchange')),
+                ('person', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participations', to='registration.person')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='registration.exchangesession')),
+            ],
+            options={
+                'unique_together': {('person', 'session')},
+            },
+        ),
+    ]
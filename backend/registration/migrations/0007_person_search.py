@@ -0,0 +1,78 @@
+# Generated by Django 4.2.14 on 2026-10-19 16:20
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+from registration.text import normalize
+
+BATCH_SIZE = 1000
+
+
+def fill_names(apps, schema_editor):
+    # same as Person.refresh_names(), which isn't available on the
+    # historical model
+    Person = apps.get_model("registration", "Person")
+    PersonMail = apps.get_model("registration", "PersonMail")
+
+    aliases = {}
+    for person_id, address in PersonMail.objects.values_list("person_id", "address"):
+        aliases.setdefault(person_id, []).append(address)
+
+    persons = []
+    for person in Person.objects.select_related("user").iterator():
+        user = person.user
+        name = " ".join(
+            x
+            for x in [user.first_name, person.prefix_surname, user.last_name]
+            if x and not x.isspace()
+        )
+        if not name:
+            name = user.username
+        person.full_name = name
+        person.sort_name = normalize(f"{user.first_name} {user.last_name}") or name
+        person.search_text = " ".join(
+            normalize(text)
+            for text in [name, user.email, *aliases.get(person.pk, [])]
+            if text
+        )
+        persons.append(person)
+
+    Person.objects.bulk_update(
+        persons, ["full_name", "sort_name", "search_text"], batch_size=BATCH_SIZE
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registration', '0005_participation'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='person',
+            name='full_name',
+            field=models.CharField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='search_text',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='sort_name',
+            field=models.CharField(blank=True, editable=False),
+        ),
+        migrations.RunPython(fill_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['sort_name', 'id'], name='person_sort_name'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_text'], name='person_search_text', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.14 on 2026-10-19 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registration', '0007_person_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='registration',
+            index=models.Index(fields=['date_time', 'id'], name='registration_date_time'),
+        ),
+    ]
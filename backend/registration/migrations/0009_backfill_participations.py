@@ -0,0 +1,92 @@
+from django.db import migrations
+
+# a copy of registration.models.PARTICIPATION_SQL at the time of this
+# migration, without the conditions of a partial refresh
+PARTICIPATION_SQL = """
+WITH department_names AS (
+    SELECT department_id, string_agg(DISTINCT name, ' / ' ORDER BY name) AS name
+    FROM (
+        SELECT department_id, name COLLATE "C" AS name
+        FROM registration_departmentdescription
+    ) dd
+    GROUP BY department_id
+),
+affiliations AS (
+    SELECT
+        pd.person_id,
+        string_agg(
+            COALESCE(dn.name, 'UNKNOWN DEPARTMENT'), ', ' ORDER BY d.slug
+        ) AS name
+    FROM registration_person_departments pd
+    JOIN registration_department d ON d.id = pd.department_id
+    LEFT JOIN department_names dn ON dn.department_id = d.id
+    GROUP BY pd.person_id
+)
+INSERT INTO registration_participation
+    (person_id, session_id, exchange_id, affiliation, choice)
+SELECT
+    a.person_id,
+    s.id,
+    s.exchange_id,
+    concat_ws(', ', af.name, NULLIF(p.other_affiliation, '')),
+    COALESCE(
+        (
+            SELECT CASE
+                WHEN sd.subtitle <> '' THEN sd.title || ' ' || sd.subtitle
+                ELSE sd.title
+            END
+            FROM registration_exchangesessiondescription sd
+            WHERE sd.exchange_id = s.id
+                AND sd.language = %s
+                AND (sd.title <> '' OR sd.subtitle <> '')
+            ORDER BY sd.id
+            LIMIT 1
+        ),
+        CASE
+            WHEN sn.subtitles <> '' THEN concat(
+                e.begin, '-', e."end", ' ', sn.titles, ' (', sn.subtitles, ')'
+            )
+            WHEN sn.titles <> '' THEN concat(e.begin, '-', e."end", ' ', sn.titles)
+            ELSE concat(
+                e.begin, '-', e."end", ' ', COALESCE(dn.name, 'UNKNOWN DEPARTMENT')
+            )
+        END
+    )
+FROM registration_exchangesession_assigned a
+JOIN registration_person p ON p.id = a.person_id
+JOIN registration_exchangesession s ON s.id = a.exchangesession_id
+JOIN registration_exchange e ON e.id = s.exchange_id
+LEFT JOIN department_names dn ON dn.department_id = s.department_id
+LEFT JOIN affiliations af ON af.person_id = a.person_id
+-- the titles and subtitles of ExchangeSession
+LEFT JOIN LATERAL (
+    SELECT
+        string_agg(DISTINCT sd.title, ' / ' ORDER BY sd.title) AS titles,
+        string_agg(DISTINCT sd.subtitle, ' / ' ORDER BY sd.subtitle) AS subtitles
+    FROM (
+        SELECT title COLLATE "C" AS title, subtitle COLLATE "C" AS subtitle
+        FROM registration_exchangesessiondescription
+        WHERE exchange_id = s.id
+    ) sd
+) sn ON TRUE
+"""
+
+# the language used for the names in the statistics
+STATISTICS_LANGUAGE = "nl"
+
+
+def backfill(apps, schema_editor):
+    Participation = apps.get_model("registration", "Participation")
+    Participation.objects.using(schema_editor.connection.alias).all().delete()
+    schema_editor.execute(PARTICIPATION_SQL, [STATISTICS_LANGUAGE])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registration', '0008_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.14 on 2026-10-19 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registration', '0009_backfill_participations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatisticsVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.14 on 2026-10-19 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registration', '0010_statisticsversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='registration',
+            index=models.Index(fields=['exchange', 'session', 'priority'], name='registration_demand'),
+        ),
+    ]
@@ -1,13 +1,25 @@
-from typing import List, Optional, Set
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from django.contrib import admin
-from django.contrib.auth.models import User, Group
-from django.db import models, transaction
+from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.db import connections, models, transaction
+from django.contrib.postgres.aggregates import StringAgg
+from django.db.models import Exists, F, OuterRef, Q, prefetch_related_objects
+from django.db.models.functions import Cast, Collate
 from django.dispatch import receiver
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import pre_save, post_delete, post_save
+from django.utils.functional import cached_property
 import re
+import threading
+
+from registration.text import normalize
 
 LANGUAGES = [("en", "English"), ("nl", "Dutch")]
 
+UNKNOWN_DEPARTMENT = "UNKNOWN DEPARTMENT"
+
 
 # APPLICATION: REGISTRATION
 def unique_username(first_name: str, prefix: str, last_name: str) -> str:
@@ -29,12 +41,6 @@ def unique_username(first_name: str, prefix: str, last_name: str) -> str:
         except User.DoesNotExist:
             return candidate
 
-def get_team_str() -> str:
-    team = Group.objects.get(name="Team")
-    persons = Person.objects.filter(user__groups=team).order_by("user__first_name")
-    return ", ".join(person.full_name for person in persons)
-
-
 class Mail(models.Model):
     MAIL_TYPES = [
         # sent when someone filled in the registration form
@@ -67,20 +73,13 @@ class Person(models.Model):
     def surnames(self):
         return self.user.last_name
 
-    @property
-    def full_name(self):
-        name = " ".join(
-            filter(
-                lambda x: x and not x.isspace(),
-                [self.given_names, self.prefix_surname, self.surnames],
-            )
-        )
-        if not name or name.isspace():
-            return self.user.username
-        return name
-
     prefix_surname = models.CharField(blank=True)
 
+    # stored to sort and search on, see refresh_names()
+    full_name = models.CharField(blank=True, editable=False)
+    sort_name = models.CharField(blank=True, editable=False)
+    search_text = models.TextField(blank=True, editable=False)
+
     url = models.URLField(blank=True)
     language = models.CharField(choices=LANGUAGES)
     external = models.BooleanField(default=False)
@@ -97,7 +96,6 @@ class Person(models.Model):
             departments.append(self.other_affiliation)
         return ", ".join(departments)
 
-    @transaction.atomic
     def move_to(self, target: "Person"):
         """Moves this person record to another person record. Deletes
         this objects afterwards
@@ -105,81 +103,264 @@ class Person(models.Model):
         Args:
             target (Person): the target to move to
         """
-        if target.pk > self.pk:
-            # always move to the oldest record
-            return target.move_to(self)
+        Person.merge_records([self, target])
 
-        emails: Set[str] = set()
-        emails.add(target.email)
-        emails.add(self.email)
+    @staticmethod
+    def merge_records(persons: Iterable["Person"]) -> "Person":
+        """Merges person records describing the same person. The oldest
+        record is kept, the others are deleted.
 
-        for pm in PersonMail.objects.filter(person=target):
-            emails.add(pm.address)
+        Args:
+            persons (Iterable[Person]): the records to merge
 
-        for pm in PersonMail.objects.filter(person=self):
-            if pm.address not in emails:
-                emails.add(pm.address)
-                pm.person = target
-            else:
-                pm.delete()
+        Returns:
+            Person: the remaining record
+        """
+        persons = sorted(persons, key=lambda person: person.pk)
+        # always move to the oldest record
+        target = persons[0]
+        target.merge(persons[1:])
+        return target
 
-        # prefer @uu.nl
+    @transaction.atomic
+    def merge(self, duplicates: Iterable["Person"]):
+        """Folds duplicate person records into this record using set-based
+        updates. Deletes the duplicates afterwards. The names are taken
+        from the newest record.
+
+        Args:
+            duplicates (Iterable[Person]): the records to merge into this one
+        """
+        duplicate_pks = set(person.pk for person in duplicates) - set([self.pk])
+        if not duplicate_pks:
+            return
+
+        duplicates = list(
+            Person.objects.select_related("user")
+            .filter(pk__in=duplicate_pks)
+            .order_by("pk")
+        )
+        records = [self] + duplicates
+        newest = max(records, key=lambda person: person.pk)
+
+        # collect the addresses; newest first
+        emails: List[str] = []
+        aliases: Dict[int, List[str]] = {}
+        for person_id, address in PersonMail.objects.filter(
+            person_id__in=[person.pk for person in records]
+        ).values_list("person_id", "address"):
+            aliases.setdefault(person_id, []).append(address)
+        for person in sorted(records, key=lambda person: person.pk, reverse=True):
+            for email in [person.email] + aliases.get(person.pk, []):
+                if email and email not in emails:
+                    emails.append(email)
+
+        # prefer newest @uu.nl
         for email in emails:
             if email.endswith("@uu.nl"):
-                target.user.email = email
+                self.user.email = email
+                break
+
+        # self is the oldest record, the newest information is leading
+        self.user.first_name = newest.user.first_name
+        self.user.last_name = newest.user.last_name
+        self.prefix_surname = newest.prefix_surname
+
+        for person in duplicates:
+            if person.user.last_login is not None and (
+                self.user.last_login is None
+                or person.user.last_login > self.user.last_login
+            ):
+                self.user.last_login = person.user.last_login
+
+            if person.user.date_joined < self.user.date_joined:
+                self.user.date_joined = person.user.date_joined
+
+        other_affiliations: List[str] = []
+        for person in records:
+            affiliation = person.other_affiliation.strip()
+            if affiliation and affiliation not in other_affiliations:
+                other_affiliations.append(affiliation)
+        self.other_affiliation = " ".join(other_affiliations)
+
+        Registration.objects.filter(requestor_id__in=duplicate_pks).update(
+            requestor=self
+        )
 
-        # prefer newest @uu.nl
-        if self.user.email.endswith("@uu.nl"):
-            target.user.email = self.user.email
+        for through, person_field, other_field in [
+            (ExchangeSession.assigned.through, "person_id", "exchangesession_id"),
+            (ExchangeSession.organizers.through, "person_id", "exchangesession_id"),
+            (Department.contact_persons.through, "person_id", "department_id"),
+            (Person.departments.through, "person_id", "department_id"),
+        ]:
+            others = set(
+                through.objects.filter(
+                    **{f"{person_field}__in": duplicate_pks}
+                ).values_list(other_field, flat=True)
+            )
+            through.objects.bulk_create(
+                [
+                    through(**{person_field: self.pk, other_field: other})
+                    for other in others
+                ],
+                ignore_conflicts=True,
+            )
 
-        for email in emails:
-            if target.email != email:
-                try:
-                    PersonMail.objects.get(person=target, address=email)
-                except PersonMail.DoesNotExist:
-                    pm = PersonMail()
-                    pm.person = target
-                    pm.address = email
-                    pm.save()
-
-        # self is the newest information
-        target.user.first_name = self.user.first_name
-        target.user.last_name = self.user.last_name
-        target.prefix_surname = self.prefix_surname
-
-        if (
-            target.user.last_login is not None
-            and self.user.last_login is not None
-            and self.user.last_login > target.user.last_login
+        PersonMail.objects.filter(person_id__in=duplicate_pks).update(person=self)
+        PersonMail.objects.filter(address=self.user.email).delete()
+        PersonMail.objects.bulk_create(
+            [
+                PersonMail(person=self, address=email)
+                for email in emails
+                if email != self.user.email
+            ],
+            ignore_conflicts=True,
+        )
+
+        # keep the snapshots of the participations in past exchanges
+        sessions = set(
+            Participation.objects.filter(person=self).values_list(
+                "session_id", flat=True
+            )
+        )
+        moved = []
+        for pk, session_pk in (
+            Participation.objects.filter(person_id__in=duplicate_pks)
+            .order_by("pk")
+            .values_list("pk", "session_id")
         ):
-            target.user.last_login = self.user.last_login
+            if session_pk not in sessions:
+                sessions.add(session_pk)
+                moved.append(pk)
+        Participation.objects.filter(pk__in=moved).update(person=self)
+
+        # deleting the users also deletes their person records
+        User.objects.filter(person__pk__in=duplicate_pks).delete()
+        self.user.save()
+        self.save()
+
+        # the through tables were changed directly, without m2m signals
+        Participation.objects.refresh(persons=[self.pk])
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        person = super().from_db(db, field_names, values)
+        # the participations follow changes of the affiliation
+        person._loaded_affiliation = person.__dict__.get("other_affiliation")
+        return person
 
-        target.departments.aadd(self.departments.all())
-        target.other_affiliation = " ".join(
-            set([target.other_affiliation, self.other_affiliation])
-        ).strip()
+    def __str__(self):
+        return self.full_name
 
-        if self.user.date_joined < target.user.date_joined:
-            target.user.date_joined = self.user.date_joined
+    @cached_property
+    def participation(self) -> "ParticipationSummary":
+        """The sessions this person organizes, is assigned to or registered
+        for, with their names. Read using a single query.
+        """
+        organizes = ExchangeSession.organizers.through.objects.filter(
+            exchangesession=OuterRef("pk"), person=self
+        )
+        assigned = ExchangeSession.assigned.through.objects.filter(
+            exchangesession=OuterRef("pk"), person=self
+        )
+        registered = Registration.objects.filter(
+            session=OuterRef("pk"), requestor=self
+        )
+        rows = (
+            ExchangeSession.objects.annotate(
+                _organizes=Exists(organizes), _assigned=Exists(assigned)
+            )
+            .filter(Q(_organizes=True) | Q(_assigned=True) | Exists(registered))
+            .annotate(
+                _titles=sorted_names("description__title"),
+                _subtitles=sorted_names("description__subtitle"),
+                _department=sorted_names("department__description__name"),
+            )
+            .values_list(
+                "pk",
+                "exchange__begin",
+                "exchange__end",
+                "_titles",
+                "_subtitles",
+                "_department",
+                "_organizes",
+                "_assigned",
+            )
+        )
+
+        summary = ParticipationSummary({}, [], [])
+        for pk, begin, end, titles, subtitles, department, organizer, member in rows:
+            summary.names[pk] = session_name(
+                f"{begin}-{end}", titles, subtitles, department or UNKNOWN_DEPARTMENT
+            )
+            if organizer:
+                summary.organizes.append(pk)
+            if member:
+                summary.assigned.append(pk)
+
+        return summary
+
+    def save(self, *args, **kwargs):
+        # the addresses are only read when the names need to be refreshed
+        if not self.names_current():
+            self.refresh_names()
+        super().save(*args, **kwargs)
+
+    def compute_names(self) -> Tuple[str, str, List[str]]:
+        """The full name, the sort name and the search text of the user,
+        without the alternative addresses.
+        """
+        name = " ".join(
+            filter(
+                lambda x: x and not x.isspace(),
+                [self.given_names, self.prefix_surname, self.surnames],
+            )
+        )
+        if not name or name.isspace():
+            name = self.user.username
 
-        Registration.objects.filter(requestor=self).update(requestor=target)
+        sort_name = normalize(f"{self.given_names} {self.surnames}") or name
+        return name, sort_name, [normalize(text) for text in [name, self.email] if text]
 
-        for department in Department.objects.filter(contact_persons=self):
-            department.contact_persons.add(target.pk)
+    def names_current(self) -> bool:
+        """Whether the stored names match the user; the alternative
+        addresses are kept up to date when they change.
+        """
+        name, sort_name, search = self.compute_names()
+        return (
+            self.full_name == name
+            and self.sort_name == sort_name
+            and f"{self.search_text} ".startswith(f"{' '.join(search)} ")
+        )
 
-        for session in ExchangeSession.objects.filter(assigned=self):
-            session.assigned.add(target.pk)
+    def refresh_names(self, aliases: Optional[Iterable[str]] = None) -> None:
+        """Computes the stored names and the normalized search text from
+        the user and the alternative addresses.
 
-        for session in ExchangeSession.objects.filter(organizers=self):
-            session.organizers.add(target.pk)
+        Args:
+            aliases (Iterable[str], optional): the alternative addresses;
+                read from the database when not given
+        """
+        if aliases is None:
+            aliases = (
+                PersonMail.objects.filter(person=self).values_list("address", flat=True)
+                if self.pk
+                else []
+            )
 
-        self.user.delete()
-        self.delete()
-        target.user.save()
-        target.save()
+        self.full_name, self.sort_name, search = self.compute_names()
+        self.search_text = " ".join(
+            search + [normalize(text) for text in aliases if text]
+        )
 
-    def __str__(self):
-        return self.full_name
+    def save_names(self) -> None:
+        """Stores the names without going through save()"""
+        self.refresh_names()
+        Person.objects.filter(pk=self.pk).update(
+            full_name=self.full_name,
+            sort_name=self.sort_name,
+            search_text=self.search_text,
+        )
 
     @staticmethod
     def get_by_email(email: str) -> Optional["Person"]:
@@ -195,6 +376,16 @@ class Person(models.Model):
         except PersonMail.DoesNotExist:
             return None
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["sort_name", "id"], name="person_sort_name"),
+            GinIndex(
+                fields=["search_text"],
+                name="person_search_text",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ]
+
 
 class PersonMail(models.Model):
     """Defines an alternative email address"""
@@ -211,6 +402,32 @@ class PersonMail(models.Model):
         super().save(*args, **kwargs)
 
 
+def by_language(instance: models.Model) -> Dict[str, List[Any]]:
+    """The descriptions of the instance by language. These are prefetched
+    on first use, unless they already were, so they are read once.
+    """
+    prefetch_related_objects([instance], "description")
+    languages: Dict[str, List[Any]] = {}
+    for description in instance.description.all():
+        languages.setdefault(description.language, []).append(description)
+    return languages
+
+
+def forget_descriptions(description: models.Model, field: str) -> None:
+    """Drops the descriptions prefetched on the instance described, when
+    this is loaded, so it shows the saved or deleted description.
+    """
+    if description._meta.get_field(field).is_cached(description):
+        instance = getattr(description, field)
+        getattr(instance, "_prefetched_objects_cache", {}).pop("description", None)
+
+
+class DepartmentQuerySet(models.QuerySet):
+    def for_display(self) -> "DepartmentQuerySet":
+        """Departments with their descriptions, to show their names"""
+        return self.prefetch_related("description")
+
+
 class Department(models.Model):
     slug = models.SlugField(blank=False, unique=True)
     email = models.EmailField(
@@ -221,6 +438,12 @@ class Department(models.Model):
 
     avatar = models.FileField(blank=True)
 
+    objects = DepartmentQuerySet.as_manager()
+
+    @property
+    def descriptions(self) -> Dict[str, List["DepartmentDescription"]]:
+        return by_language(self)
+
     @property
     @admin.display(
         ordering="_name",
@@ -228,10 +451,12 @@ class Department(models.Model):
         boolean=False,
     )
     def name(self):
-        descriptions = set(d.name for d in self.description.all())
+        descriptions = set(
+            d.name for items in self.descriptions.values() for d in items
+        )
         if not descriptions:
-            return "UNKNOWN DEPARTMENT"
-        return " / ".join(descriptions)
+            return UNKNOWN_DEPARTMENT
+        return " / ".join(sorted(descriptions))
 
     def __str__(self):
         return self.name
@@ -248,6 +473,14 @@ class DepartmentDescription(models.Model):
     description = models.TextField(blank=True)
     language = models.CharField(choices=LANGUAGES)
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        forget_descriptions(self, "department")
+
+    def delete(self, *args, **kwargs):
+        forget_descriptions(self, "department")
+        return super().delete(*args, **kwargs)
+
 
 class Exchange(models.Model):
     begin = models.IntegerField(unique=True)
@@ -268,6 +501,16 @@ class ExchangeDescription(models.Model):
     language = models.CharField(choices=LANGUAGES)
 
 
+class ExchangeSessionQuerySet(models.QuerySet):
+    def for_display(self) -> "ExchangeSessionQuerySet":
+        """Sessions with everything needed to show their names: the
+        exchange, the department and their descriptions.
+        """
+        return self.select_related("exchange", "department").prefetch_related(
+            "description", "department__description"
+        )
+
+
 class ExchangeSession(models.Model):
     exchange = models.ForeignKey(Exchange, on_delete=models.CASCADE)
     department = models.ForeignKey(Department, on_delete=models.CASCADE)
@@ -284,42 +527,75 @@ class ExchangeSession(models.Model):
         Person, blank=True, related_name="exchange_organizers"
     )
 
+    objects = ExchangeSessionQuerySet.as_manager()
+
     @property
     def assigned_count(self):
+        # use the annotated count when available
+        if hasattr(self, "_assigned_count"):
+            return self._assigned_count
         return self.assigned.count()
 
+    @property
+    def descriptions(self) -> Dict[str, List["ExchangeSessionDescription"]]:
+        return by_language(self)
+
     @property
     def titles(self):
-        titles = set(d.title for d in self.description.all())
+        titles = set(d.title for items in self.descriptions.values() for d in items)
         if not titles:
             return None
-        return " / ".join(titles)
+        return " / ".join(sorted(titles))
 
     @property
     def subtitles(self):
-        subtitles = set(d.subtitle for d in self.description.all())
+        subtitles = set(
+            d.subtitle for items in self.descriptions.values() for d in items
+        )
         if not subtitles:
             return None
-        return " / ".join(subtitles)
+        return " / ".join(sorted(subtitles))
 
     def get_name_by_lang(self, language):
-        for description in self.description.all():
-            d: ExchangeSessionDescription = description
-            if d.language == language:
-                if d.subtitle:
-                    return f"{d.title} {d.subtitle}"
-                if d.title:
-                    return d.title
+        for d in self.descriptions.get(language, []):
+            if d.subtitle:
+                return f"{d.title} {d.subtitle}"
+            if d.title:
+                return d.title
 
         return self.__str__()
 
     def __str__(self):
-        if self.subtitles:
-            return f"{self.exchange} {self.titles} ({self.subtitles})"
-        elif self.titles:
-            return f"{self.exchange} {self.titles}"
-        else:
-            return f"{self.exchange} {self.department}"
+        return session_name(self.exchange, self.titles, self.subtitles, self.department)
+
+
+def sorted_names(field: str) -> StringAgg:
+    """Joins the distinct values like the names in Python: sorted by code
+    point, as the C collation does.
+    """
+    # as text: string_agg() casts a varchar argument, but not the ordering
+    value = Collate(Cast(field, models.TextField()), "C")
+    return StringAgg(value, " / ", distinct=True, ordering=value, default="")
+
+
+def session_name(exchange: Any, titles: str, subtitles: str, department: Any) -> str:
+    if subtitles:
+        return f"{exchange} {titles} ({subtitles})"
+    elif titles:
+        return f"{exchange} {titles}"
+    else:
+        return f"{exchange} {department}"
+
+
+@dataclass
+class ParticipationSummary:
+    # name of each session, by pk
+    names: Dict[Any, str]
+    organizes: List[Any]
+    assigned: List[Any]
+
+    def list_names(self, session_pks: Iterable[Any]) -> str:
+        return "\n".join(sorted(self.names[pk] for pk in session_pks))
 
 
 class ExchangeSessionDescription(models.Model):
@@ -334,6 +610,14 @@ class ExchangeSessionDescription(models.Model):
     date = models.CharField()
     location = models.CharField()
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        forget_descriptions(self, "exchange")
+
+    def delete(self, *args, **kwargs):
+        forget_descriptions(self, "exchange")
+        return super().delete(*args, **kwargs)
+
 
 class Registration(models.Model):
     requestor = models.ForeignKey(Person, on_delete=models.CASCADE)
@@ -354,7 +638,6 @@ class Registration(models.Model):
     notes = models.TextField(blank=True)
     reason = models.CharField(blank=True)
 
-
     def save(self, *args, **kwargs):
         if self.session:
             # make sure these are the same
@@ -362,6 +645,265 @@ class Registration(models.Model):
 
         super().save(*args, **kwargs)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["date_time", "id"], name="registration_date_time"),
+            # counting the demand, see demand_counts()
+            models.Index(
+                fields=["exchange", "session", "priority"],
+                name="registration_demand",
+            ),
+        ]
+
+
+# the language used for the names in the statistics
+STATISTICS_LANGUAGE = "nl"
+
+# One row per assignment; the names mirror Person.get_affiliation() and
+# ExchangeSession.get_name_by_lang(), falling back to session_name(). The
+# names are sorted by code point (COLLATE "C"), like sorted() does.
+PARTICIPATION_SQL = """
+WITH department_names AS (
+    SELECT department_id, string_agg(DISTINCT name, ' / ' ORDER BY name) AS name
+    FROM (
+        SELECT department_id, name COLLATE "C" AS name
+        FROM registration_departmentdescription
+    ) dd
+    GROUP BY department_id
+),
+affiliations AS (
+    SELECT
+        pd.person_id,
+        string_agg(
+            COALESCE(dn.name, 'UNKNOWN DEPARTMENT'), ', ' ORDER BY d.slug
+        ) AS name
+    FROM registration_person_departments pd
+    JOIN registration_department d ON d.id = pd.department_id
+    LEFT JOIN department_names dn ON dn.department_id = d.id
+    GROUP BY pd.person_id
+)
+INSERT INTO registration_participation
+    (person_id, session_id, exchange_id, affiliation, choice)
+SELECT
+    a.person_id,
+    s.id,
+    s.exchange_id,
+    concat_ws(', ', af.name, NULLIF(p.other_affiliation, '')),
+    COALESCE(
+        (
+            SELECT CASE
+                WHEN sd.subtitle <> '' THEN sd.title || ' ' || sd.subtitle
+                ELSE sd.title
+            END
+            FROM registration_exchangesessiondescription sd
+            WHERE sd.exchange_id = s.id
+                AND sd.language = %(language)s
+                AND (sd.title <> '' OR sd.subtitle <> '')
+            ORDER BY sd.id
+            LIMIT 1
+        ),
+        CASE
+            WHEN sn.subtitles <> '' THEN concat(
+                e.begin, '-', e."end", ' ', sn.titles, ' (', sn.subtitles, ')'
+            )
+            WHEN sn.titles <> '' THEN concat(e.begin, '-', e."end", ' ', sn.titles)
+            ELSE concat(
+                e.begin, '-', e."end", ' ', COALESCE(dn.name, 'UNKNOWN DEPARTMENT')
+            )
+        END
+    )
+FROM registration_exchangesession_assigned a
+JOIN registration_person p ON p.id = a.person_id
+JOIN registration_exchangesession s ON s.id = a.exchangesession_id
+JOIN registration_exchange e ON e.id = s.exchange_id
+LEFT JOIN department_names dn ON dn.department_id = s.department_id
+LEFT JOIN affiliations af ON af.person_id = a.person_id
+-- the titles and subtitles of ExchangeSession
+LEFT JOIN LATERAL (
+    SELECT
+        string_agg(DISTINCT sd.title, ' / ' ORDER BY sd.title) AS titles,
+        string_agg(DISTINCT sd.subtitle, ' / ' ORDER BY sd.subtitle) AS subtitles
+    FROM (
+        SELECT title COLLATE "C" AS title, subtitle COLLATE "C" AS subtitle
+        FROM registration_exchangesessiondescription
+        WHERE exchange_id = s.id
+    ) sd
+) sn ON TRUE
+WHERE {condition}
+ON CONFLICT (person_id, session_id) DO UPDATE SET
+    exchange_id = EXCLUDED.exchange_id,
+    affiliation = EXCLUDED.affiliation,
+    choice = EXCLUDED.choice
+WHERE {update}
+"""
+
+# the rows of past exchanges keep their snapshot, unless rebuilt
+ACTIVE_EXCHANGE_SQL = """
+registration_participation.exchange_id IN (
+    SELECT id FROM registration_exchange WHERE active
+)
+"""
+
+_deferred_refresh = threading.local()
+
+
+class ParticipationManager(models.Manager):
+    def refresh(
+        self,
+        sessions: Optional[Iterable[Any]] = None,
+        persons: Optional[Iterable[Any]] = None,
+        exchanges: Optional[Iterable[Any]] = None,
+    ) -> None:
+        """Recomputes the participation rows from the assignments. Without
+        any arguments everything is recomputed. Otherwise the rows of the
+        given sessions, persons or exchanges are added or removed to match
+        the assignments, but only those of the active exchange are updated:
+        the others keep the affiliation and name of their snapshot.
+
+        Args:
+            sessions (Iterable, optional): pks of the sessions to refresh
+            persons (Iterable, optional): pks of the persons to refresh
+            exchanges (Iterable, optional): pks of the exchanges to refresh
+        """
+        filters = {
+            "session_id": sessions,
+            "person_id": persons,
+            "exchange_id": exchanges,
+        }
+        filters = {key: set(pks) for key, pks in filters.items() if pks is not None}
+
+        pending = getattr(_deferred_refresh, "pending", None)
+        if pending is not None:
+            if not filters:
+                pending["all"] = True
+            for key, pks in filters.items():
+                pending[key] |= pks
+            return
+
+        columns = {
+            "session_id": "s.id",
+            "person_id": "a.person_id",
+            "exchange_id": "s.exchange_id",
+        }
+        params: Dict[str, Any] = {"language": STATISTICS_LANGUAGE}
+        conditions: List[str] = []
+        for key, pks in filters.items():
+            params[key] = list(pks)
+            conditions.append(f"{columns[key]} = ANY(%({key})s)")
+
+        queryset = self.all()
+        if filters:
+            query = Q()
+            for key, pks in filters.items():
+                query |= Q(**{f"{key}__in": pks})
+            queryset = queryset.filter(query)
+        # the rows of the assignments which no longer exist
+        assigned = ExchangeSession.assigned.through.objects.filter(
+            exchangesession=OuterRef("session"), person=OuterRef("person")
+        )
+
+        with transaction.atomic(using=self.db):
+            queryset.filter(~Exists(assigned)).delete()
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(
+                    PARTICIPATION_SQL.format(
+                        condition=" OR ".join(conditions) or "TRUE",
+                        update=ACTIVE_EXCHANGE_SQL if filters else "TRUE",
+                    ),
+                    params,
+                )
+            StatisticsVersion.bump(using=self.db)
+
+    @contextmanager
+    def deferred(self):
+        """Postpones all refreshes within this block to a single refresh
+        at the end of it, e.g. while assigning all the participants.
+        """
+        if getattr(_deferred_refresh, "pending", None) is not None:
+            # already deferred by an outer block
+            yield
+            return
+
+        _deferred_refresh.pending = pending = {
+            "all": False,
+            "session_id": set(),
+            "person_id": set(),
+            "exchange_id": set(),
+        }
+        try:
+            yield
+        except BaseException:
+            _deferred_refresh.pending = None
+            # the changes made before the error might still be saved: by
+            # autocommit, or when the surrounding transaction commits
+            if connections[self.db].in_atomic_block:
+                transaction.on_commit(
+                    lambda: self.refresh_pending(pending), using=self.db
+                )
+            else:
+                self.refresh_pending(pending)
+            raise
+
+        _deferred_refresh.pending = None
+        self.refresh_pending(pending)
+
+    def refresh_pending(self, pending: Dict[str, Any]) -> None:
+        if pending["all"]:
+            self.refresh()
+        elif pending["session_id"] or pending["person_id"] or pending["exchange_id"]:
+            self.refresh(
+                sessions=pending["session_id"],
+                persons=pending["person_id"],
+                exchanges=pending["exchange_id"],
+            )
+
+
+class Participation(models.Model):
+    """Precomputed assignment of a person to a session, which is used for
+    the statistics. The rows are refreshed when the assignments change.
+    The affiliation and session name are a snapshot: those of the active
+    exchange also follow changes of the departments, the descriptions and
+    the other affiliation, those of past exchanges keep what they were
+    when the exchange was active.
+    """
+
+    person = models.ForeignKey(
+        Person, on_delete=models.CASCADE, related_name="participations"
+    )
+    session = models.ForeignKey(ExchangeSession, on_delete=models.CASCADE)
+    exchange = models.ForeignKey(Exchange, on_delete=models.CASCADE)
+    affiliation = models.CharField(blank=True)
+    choice = models.CharField(blank=True)
+
+    objects = ParticipationManager()
+
+    class Meta:
+        unique_together = ["person", "session"]
+
+
+class StatisticsVersion(models.Model):
+    """Changes with the data of the statistics; part of the key of their
+    cached results. Stored in the database, so all the processes share
+    it. There is at most one row.
+    """
+
+    version = models.IntegerField(default=0)
+
+    @staticmethod
+    def current() -> int:
+        return (
+            StatisticsVersion.objects.values_list("version", flat=True).first() or 0
+        )
+
+    @staticmethod
+    def bump(using: str = "default") -> None:
+        if not StatisticsVersion.objects.using(using).update(
+            version=F("version") + 1
+        ):
+            StatisticsVersion.objects.using(using).bulk_create(
+                [StatisticsVersion(pk=1, version=1)], ignore_conflicts=True
+            )
+
 
 @receiver(pre_save, sender=Department)
 def to_lower_slug(sender, instance: Department, **kwargs):
@@ -395,8 +937,23 @@ def add_person(sender, instance: User, **kwargs):
     """Add a person for every user"""
 
     try:
-        Person.objects.get(user=instance)
+        person = Person.objects.get(user=instance)
     except Person.DoesNotExist:
         person = Person()
         person.user = instance
         person.save()
+    else:
+        # the names might have changed
+        person.user = instance
+        if not person.names_current():
+            person.save_names()
+
+
+@receiver(post_save, sender=PersonMail)
+@receiver(post_delete, sender=PersonMail)
+def alias_changed(sender, instance: PersonMail, **kwargs):
+    person = (
+        Person.objects.select_related("user").filter(pk=instance.person_id).first()
+    )
+    if person is not None:
+        person.save_names()
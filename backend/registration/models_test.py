@@ -0,0 +1,192 @@
+import datetime
+
+from django.contrib.auth.models import User
+
+from registration.factories import add_department, add_person, add_session, grow
+from registration.models import (
+    ExchangeSession,
+    Participation,
+    Person,
+    PersonMail,
+    Registration,
+)
+
+
+def test_merge_records(world):
+    session = world["session"]
+    other = add_session(world["exchange"], add_department("music"))
+    oldest = add_person("oldest")
+    newest = add_person("newest")
+    PersonMail.objects.create(person=newest, address="alias@example.org")
+    registration = Registration.objects.create(
+        requestor=newest,
+        session=other,
+        exchange=world["exchange"],
+        priority=1,
+        date_time=datetime.datetime.now(datetime.timezone.utc),
+    )
+    # both assigned to the same session
+    session.assigned.add(oldest, newest)
+    other.assigned.add(newest)
+    other.organizers.add(newest)
+    newest.departments.add(world["department"])
+
+    person = Person.merge_records([newest, oldest])
+
+    assert person.pk == oldest.pk
+    assert not Person.objects.filter(pk=newest.pk).exists()
+    assert not User.objects.filter(username="newest").exists()
+
+    person = Person.objects.get(pk=oldest.pk)
+    registration.refresh_from_db()
+    assert registration.requestor == person
+    assert list(session.assigned.all()) == [person]
+    assert list(other.assigned.all()) == [person]
+    assert list(other.organizers.all()) == [person]
+    assert list(person.departments.all()) == [world["department"]]
+
+    # the newest @uu.nl address is kept, the others become aliases
+    assert person.email == "newest@uu.nl"
+    assert set(person.personmail_set.values_list("address", flat=True)) == {
+        "alias@example.org",
+        "oldest@uu.nl",
+    }
+
+
+def test_merge_duplicate_clusters_action(db, admin_client):
+    persons = []
+    for name in ["jan1", "jan2", "piet1", "piet2"]:
+        person = add_person(name)
+        person.user.first_name = name[:-1]
+        person.user.save()
+        persons.append(person)
+    data = {
+        "action": "merge_duplicate_clusters",
+        "_selected_action": [person.pk for person in persons],
+    }
+
+    # nothing is merged before confirming
+    response = admin_client.post("/admin/registration/person/", data)
+    assert response.status_code == 200
+    assert [cluster.pks for cluster in response.context["clusters"]] == [
+        [persons[0].pk, persons[1].pk],
+        [persons[2].pk, persons[3].pk],
+    ]
+    pks = [person.pk for person in persons]
+    assert Person.objects.filter(pk__in=pks).count() == 4
+
+    # only merges the checked clusters
+    response = admin_client.post(
+        "/admin/registration/person/",
+        {**data, "apply": "Merge", "cluster": f"{persons[0].pk},{persons[1].pk}"},
+    )
+    assert response.status_code == 302
+    assert set(Person.objects.filter(pk__in=pks).values_list("pk", flat=True)) == {
+        persons[0].pk,
+        persons[2].pk,
+        persons[3].pk,
+    }
+
+
+def participations():
+    return set(
+        Participation.objects.values_list(
+            "person", "session", "exchange", "affiliation", "choice"
+        )
+    )
+
+
+def test_refresh_participations(world):
+    grow(world, 3)
+    person = world["person"]
+    # changed without any signals
+    Person.objects.filter(pk=person.pk).update(other_affiliation="Elsewhere")
+    world["session"].assigned.through.objects.create(
+        exchangesession=world["session"], person=person
+    )
+
+    Participation.objects.refresh(persons=[person.pk])
+    refreshed = participations()
+    Participation.objects.refresh()
+
+    assert refreshed == participations()
+    assert (person.pk, world["session"].pk) in {row[:2] for row in refreshed}
+
+
+def test_refresh_participations_deferred(world):
+    person = add_person("deferred")
+
+    with Participation.objects.deferred():
+        world["session"].assigned.add(person)
+        person.departments.add(world["department"])
+        assert not Participation.objects.filter(person=person).exists()
+
+    assert Participation.objects.filter(person=person).get().affiliation == (
+        "history en / history nl"
+    )
+
+
+def test_descriptions_saved(world):
+    session = world["session"]
+    department = world["department"]
+    assert session.get_name_by_lang("en") == "history en en"
+    assert department.name == "history en / history nl"
+
+    description = session.description.get(language="en")
+    description.subtitle = ""
+    description.save()
+    assert session.get_name_by_lang("en") == "history en"
+
+    session.description.filter(language="en").get().delete()
+    assert session.get_name_by_lang("en") == str(session)
+
+    department.description.get(language="nl").delete()
+    assert department.name == "history en"
+
+
+def test_person_save_names(world, django_assert_num_queries):
+    PersonMail.objects.create(person=world["person"], address="alias@example.org")
+    person = Person.objects.select_related("user").get(pk=world["person"].pk)
+
+    # unchanged names: only the update
+    with django_assert_num_queries(1):
+        person.save()
+
+    person.prefix_surname = "van"
+    # reads the alternative addresses
+    with django_assert_num_queries(2):
+        person.save()
+    assert person.full_name == "person van Test"
+    assert person.search_text == "person van test person uu nl alias example org"
+
+
+def test_participation(world, django_assert_num_queries):
+    person = world["person"]
+    organizes = world["session"]
+    assigned = add_session(world["exchange"], add_department("music"))
+    registered = add_session(world["exchange"], add_department("physics"))
+    add_session(world["exchange"], add_department("sports"))
+    organizes.organizers.add(person)
+    assigned.assigned.add(person)
+    Registration.objects.create(
+        requestor=person,
+        session=registered,
+        exchange=world["exchange"],
+        priority=1,
+        date_time=datetime.datetime.now(datetime.timezone.utc),
+    )
+    # sorted by code point, like the names in Python
+    assigned.description.filter(language="nl").update(title="Zoo")
+    assigned.description.filter(language="en").update(title="Ábc")
+
+    with django_assert_num_queries(1):
+        participation = person.participation
+
+    sessions = [organizes, assigned, registered]
+    assert participation.names == {
+        session.pk: str(ExchangeSession.objects.get(pk=session.pk))
+        for session in sessions
+    }
+    assert participation.names[assigned.pk] == "2023-2024 Zoo / Ábc (en / nl)"
+    assert participation.organizes == [organizes.pk]
+    assert participation.assigned == [assigned.pk]
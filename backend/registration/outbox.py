@@ -0,0 +1,297 @@
+"""Writes the generated mails as MIME messages and sends them.
+
+The messages can be written as separate .eml files, or streamed into a
+single mbox file or zip archive. The X-Unsent header makes mail clients
+open them as drafts. The same files can be sent over SMTP, keeping track
+of the messages which have been delivered.
+"""
+
+from dataclasses import dataclass, field
+from email import policy
+from email.message import EmailMessage
+from email.parser import BytesParser
+from email.utils import make_msgid
+from typing import Callable, Iterable, Iterator, List, Optional, Set, Tuple
+import hashlib
+import mailbox
+import os
+import queue
+import smtplib
+import threading
+import time
+import zipfile
+
+from django.conf import settings
+
+SENDER = "wisselwerking.gw@uu.nl"
+MESSAGE_ID_DOMAIN = "wisselwerking.gw.uu.nl"
+
+OUTPUT_FORMATS = ["csv", "mbox", "zip"]
+
+
+def build_message(to: str, subject: str, content: str) -> EmailMessage:
+    """Builds a plain text message, encoded as quoted-printable UTF-8.
+
+    Args:
+        to (str): receivers, e.g. "Name <address>, Other <address>"
+        subject (str): subject of the mail
+        content (str): text of the mail
+
+    Returns:
+        EmailMessage: the message
+    """
+    message = EmailMessage(policy=policy.SMTP)
+    message["From"] = SENDER
+    message["To"] = to
+    message["Subject"] = subject
+    message["Message-ID"] = make_msgid(domain=MESSAGE_ID_DOMAIN)
+    message["X-Unsent"] = "1"
+    message.set_content(content.strip(), charset="utf-8", cte="quoted-printable")
+    return message
+
+
+def write_emls(filepath: str, messages: Iterable[EmailMessage]) -> None:
+    """Writes each message to {filepath}_{i}.eml"""
+    for i, message in enumerate(messages):
+        with open(f"{filepath}_{i}.eml", mode="wb") as mail_file:
+            mail_file.write(message.as_bytes())
+
+
+def write_mbox(filepath: str, messages: Iterable[EmailMessage]) -> None:
+    box = mailbox.mbox(filepath, create=True)
+    box.lock()
+    try:
+        for message in messages:
+            box.add(message)
+        box.flush()
+    finally:
+        box.unlock()
+        box.close()
+
+
+def write_zip(filepath: str, messages: Iterable[EmailMessage]) -> None:
+    with zipfile.ZipFile(
+        filepath, mode="w", compression=zipfile.ZIP_DEFLATED
+    ) as archive:
+        for i, message in enumerate(messages):
+            archive.writestr(f"{i:05}.eml", message.as_bytes())
+
+
+def read_messages(path: str) -> Iterator[EmailMessage]:
+    """Reads the messages from a directory of .eml files, an mbox file or
+    a zip archive.
+
+    Args:
+        path (str): the outbox to read
+
+    Yields:
+        EmailMessage: the messages, in the order they were written
+    """
+    parser = BytesParser(_class=EmailMessage, policy=policy.SMTP)
+    if os.path.isdir(path):
+        for filename in sorted(os.listdir(path)):
+            if filename.endswith(".eml"):
+                with open(os.path.join(path, filename), mode="rb") as mail_file:
+                    yield parser.parse(mail_file)
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for filename in sorted(archive.namelist()):
+                if filename.endswith(".eml"):
+                    yield parser.parsebytes(archive.read(filename))
+    else:
+        box = mailbox.mbox(path, create=False)
+        try:
+            for key in box.iterkeys():
+                yield parser.parsebytes(box.get_bytes(key))
+        finally:
+            box.close()
+
+
+def message_key(message: EmailMessage) -> str:
+    """Identifies a message when tracking the progress"""
+    message_id = message["Message-ID"]
+    if message_id:
+        return str(message_id).strip()
+    return hashlib.sha256(message.as_bytes()).hexdigest()
+
+
+def smtp_connection() -> smtplib.SMTP:
+    """Opens a connection using the EMAIL_* settings"""
+    if settings.EMAIL_USE_SSL:
+        connection = smtplib.SMTP_SSL(
+            settings.EMAIL_HOST, settings.EMAIL_PORT, timeout=settings.EMAIL_TIMEOUT
+        )
+    else:
+        connection = smtplib.SMTP(
+            settings.EMAIL_HOST, settings.EMAIL_PORT, timeout=settings.EMAIL_TIMEOUT
+        )
+        if settings.EMAIL_USE_TLS:
+            connection.starttls()
+    if settings.EMAIL_HOST_USER:
+        connection.login(settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD)
+    return connection
+
+
+class RateLimiter:
+    """Token bucket shared by all the connections"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self.rate:
+            return
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class Progress:
+    """The keys of the delivered messages. Each key is appended to the
+    file as soon as the server accepted the message, so sending again
+    after a crash skips them.
+    """
+
+    def __init__(self, filepath: str):
+        self.sent: Set[str] = set()
+        if os.path.isfile(filepath):
+            with open(filepath, encoding="utf-8") as progress_file:
+                self.sent = set(line.strip() for line in progress_file if line.strip())
+        self.file = open(filepath, mode="a", encoding="utf-8")
+        self.lock = threading.Lock()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.sent
+
+    def add(self, key: str) -> None:
+        with self.lock:
+            self.sent.add(key)
+            self.file.write(key + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        self.file.close()
+
+
+@dataclass
+class SendResult:
+    sent: int = 0
+    skipped: int = 0
+    failed: List[Tuple[str, str]] = field(default_factory=list)
+
+
+class OutboxSender:
+    """Sends messages using a pool of threads, each keeping its own SMTP
+    connection open for a batch of messages.
+
+    Args:
+        progress (Progress): tracks the delivered messages
+        threads (int): number of concurrent connections
+        batch (int): messages to send before reconnecting
+        rate (float): maximum messages per second; 0 for no limit
+        connect (Callable[[], smtplib.SMTP]): opens a connection
+    """
+
+    def __init__(
+        self,
+        progress: Progress,
+        threads: int = 4,
+        batch: int = 50,
+        rate: float = 0,
+        connect: Callable[[], smtplib.SMTP] = smtp_connection,
+    ):
+        self.progress = progress
+        self.threads = max(threads, 1)
+        self.batch = max(batch, 1)
+        self.limiter = RateLimiter(rate)
+        self.connect = connect
+        self.result = SendResult()
+        self.lock = threading.Lock()
+
+    def send(self, messages: Iterable[EmailMessage]) -> SendResult:
+        pending: "queue.Queue[Optional[Tuple[str, EmailMessage]]]" = queue.Queue(
+            maxsize=self.threads * self.batch
+        )
+        workers = [
+            threading.Thread(target=self.work, args=(pending,), daemon=True)
+            for _ in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+
+        try:
+            for message in messages:
+                key = message_key(message)
+                if key in self.progress:
+                    self.result.skipped += 1
+                    continue
+                # only drafts should be marked as unsent
+                del message["X-Unsent"]
+                pending.put((key, message))
+        finally:
+            for _ in workers:
+                pending.put(None)
+            for worker in workers:
+                worker.join()
+
+        return self.result
+
+    def work(self, pending: "queue.Queue[Optional[Tuple[str, EmailMessage]]]"):
+        connection: Optional[smtplib.SMTP] = None
+        count = 0
+        while True:
+            item = pending.get()
+            if item is None:
+                break
+
+            key, message = item
+            self.limiter.wait()
+            try:
+                try:
+                    if connection is None:
+                        connection = self.connect()
+                    connection.send_message(message)
+                except smtplib.SMTPServerDisconnected:
+                    # the server might have closed an idle connection
+                    connection = self.connect()
+                    connection.send_message(message)
+                self.progress.add(key)
+            except Exception as error:
+                # any error only fails this message: a stopped worker would
+                # leave the queue full, blocking the sender
+                with self.lock:
+                    self.result.failed.append((key, str(error)))
+                if not isinstance(error, smtplib.SMTPRecipientsRefused):
+                    connection = close(connection)
+                    count = 0
+                continue
+
+            with self.lock:
+                self.result.sent += 1
+
+            count += 1
+            if count >= self.batch:
+                connection = close(connection)
+                count = 0
+
+        close(connection)
+
+
+def close(connection: Optional[smtplib.SMTP]) -> None:
+    if connection is not None:
+        try:
+            connection.quit()
+        except Exception:
+            connection.close()
@@ -0,0 +1,128 @@
+from email import message_from_bytes, policy
+import mailbox
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from registration.outbox import (
+    MESSAGE_ID_DOMAIN,
+    SENDER,
+    OutboxSender,
+    Progress,
+    build_message,
+    write_mbox,
+    write_zip,
+)
+
+
+class Handler:
+    def __init__(self, refuse=()):
+        self.received = []
+        self.refuse = set(refuse)
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refuse:
+            return "550 mailbox unavailable"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received.append(envelope)
+        return "250 Message accepted for delivery"
+
+
+@pytest.fixture
+def smtp_server(settings):
+    aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+
+    def start(refuse=()):
+        handler = Handler(refuse)
+        controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1")
+        controller.start()
+        servers.append(controller)
+        settings.EMAIL_HOST = controller.hostname
+        settings.EMAIL_PORT = controller.port
+        return handler
+
+    servers = []
+    yield start
+    for controller in servers:
+        controller.stop()
+
+
+def messages(count):
+    return [
+        build_message(f"Persoon {i} <p{i}@example.org>", f"Onderwerp {i}", "Hé!")
+        for i in range(count)
+    ]
+
+
+def test_build_message():
+    message = build_message(
+        "Zoë de Vries <zoe@example.org>", "Geëxporteerd", "Beste Zoë,\n\nHé!\n"
+    )
+    data = message.as_bytes()
+
+    assert b"\r\n" in data
+    assert all(byte < 128 for byte in data)
+    assert message["From"] == SENDER
+    assert message["X-Unsent"] == "1"
+    assert message["Message-ID"].endswith(f"@{MESSAGE_ID_DOMAIN}>")
+    assert message["Content-Transfer-Encoding"] == "quoted-printable"
+    assert message.get_content_charset() == "utf-8"
+
+    parsed = message_from_bytes(data, policy=policy.default)
+    assert parsed["To"] == "Zoë de Vries <zoe@example.org>"
+    assert parsed["Subject"] == "Geëxporteerd"
+    assert parsed.get_content().splitlines() == ["Beste Zoë,", "", "Hé!"]
+
+
+@pytest.mark.parametrize("write", [write_mbox, write_zip])
+def test_send_outbox(smtp_server, tmp_path, write):
+    handler = smtp_server()
+    outbox = tmp_path / "outbox"
+    write(str(outbox), messages(25))
+
+    call_command("send_outbox", str(outbox), threads=3, batch=4)
+
+    assert len(handler.received) == 25
+    assert sorted(envelope.rcpt_tos[0] for envelope in handler.received) == sorted(
+        f"p{i}@example.org" for i in range(25)
+    )
+    assert all(b"X-Unsent" not in envelope.content for envelope in handler.received)
+
+    # nothing is sent twice
+    call_command("send_outbox", str(outbox), threads=3, batch=4)
+    assert len(handler.received) == 25
+
+
+def test_send_outbox_resume(smtp_server, tmp_path):
+    handler = smtp_server(refuse={"p3@example.org"})
+    outbox = tmp_path / "outbox.mbox"
+    write_mbox(str(outbox), messages(5))
+
+    with pytest.raises(CommandError):
+        call_command("send_outbox", str(outbox), threads=1)
+    assert len(handler.received) == 4
+
+    handler.refuse.clear()
+    call_command("send_outbox", str(outbox), threads=1)
+    assert len(handler.received) == 5
+    assert handler.received[-1].rcpt_tos == ["p3@example.org"]
+    assert len(mailbox.mbox(str(outbox))) == 5
+
+
+def test_send_unexpected_error(tmp_path):
+    def connect():
+        raise ValueError("unexpected")
+
+    progress = Progress(str(tmp_path / "progress"))
+    sender = OutboxSender(progress, threads=2, batch=1, connect=connect)
+
+    # more messages than fit in the queue
+    result = sender.send(messages(10))
+    progress.close()
+
+    assert result.sent == 0
+    assert len(result.failed) == 10
@@ -0,0 +1,178 @@
+"""Pagination of the admin lists which keep growing every year.
+
+Counting all the rows is replaced by the planner's estimate once that
+estimate is large, and the next page is read from where the previous
+page ended (keyset pagination) instead of skipping all the rows before
+it using an OFFSET.
+"""
+
+from typing import Any, List, Optional, Sequence
+import base64
+import binascii
+import json
+
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.db import connections
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.utils.functional import cached_property
+
+# below this estimate the rows are counted exactly
+ESTIMATE_THRESHOLD = 10000
+
+CURSOR_VAR = "after"
+
+
+def estimate_count(queryset: QuerySet) -> int:
+    """The number of rows the Postgres planner expects the query to return.
+
+    Args:
+        queryset (QuerySet): the query to estimate
+
+    Returns:
+        int: estimated number of rows
+    """
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Uses the planner's estimate for the count, when it is above the
+    threshold: the exact number doesn't matter for that many rows.
+    """
+
+    threshold = ESTIMATE_THRESHOLD
+
+    @cached_property
+    def estimate(self) -> int:
+        return estimate_count(self.object_list)
+
+    @property
+    def estimated(self) -> bool:
+        return self.estimate >= self.threshold
+
+    @cached_property
+    def count(self) -> int:
+        if self.estimated:
+            return self.estimate
+        return super().count
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    # str() keeps the microseconds, unlike DjangoJSONEncoder
+    text = json.dumps(list(values), default=str)
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, binascii.Error):
+        raise IncorrectLookupParameters(f"Invalid cursor {cursor}")
+    if not isinstance(values, list):
+        raise IncorrectLookupParameters(f"Invalid cursor {cursor}")
+    return values
+
+
+def after(keyset: Sequence[str], values: Sequence[Any]) -> Q:
+    """Matches the rows after the given values in the (ascending) keyset
+    ordering, e.g. for (a, b): a > x OR (a = x AND b > y). The condition
+    on the first field is repeated separately, so an index on the keyset
+    can be used for a range scan.
+    """
+    condition = Q(**{f"{keyset[-1]}__gt": values[-1]})
+    for name, value in zip(reversed(keyset[:-1]), reversed(values[:-1])):
+        condition = Q(**{f"{name}__gt": value}) | (Q(**{name: value}) & condition)
+    return Q(**{f"{keyset[0]}__gte": values[0]}) & condition
+
+
+class KeysetChangeList(ChangeList):
+    """Pages through the list using ?after=<cursor> when it is ordered by
+    the keyset of the model admin. Other orderings and the page numbers
+    still use an OFFSET.
+    """
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    @property
+    def keyset(self) -> List[str]:
+        return list(self.model_admin.keyset)
+
+    @cached_property
+    def keyset_ordered(self) -> bool:
+        # the ordering of the model admin can be repeated at the end
+        return list(dict.fromkeys(self.queryset.query.order_by)) == self.keyset
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.estimated_count = getattr(self.paginator, "estimated", False)
+        self.next_url: Optional[str] = None
+        self.first_url: Optional[str] = None
+        if not self.keyset_ordered or not self.multi_page or self.show_all:
+            return
+
+        cursor = self.params.get(CURSOR_VAR)
+        if cursor is not None:
+            values = self.to_python(decode_cursor(cursor))
+            self.result_list = self.queryset.filter(after(self.keyset, values))[
+                : self.list_per_page
+            ]
+            self.first_url = self.get_query_string(remove=[CURSOR_VAR, PAGE_VAR])
+        elif self.page_num > 1:
+            self.first_url = self.get_query_string(remove=[CURSOR_VAR, PAGE_VAR])
+
+        self.result_list = list(self.result_list)
+        if len(self.result_list) == self.list_per_page:
+            last = self.result_list[-1]
+            self.next_url = self.get_query_string(
+                {
+                    CURSOR_VAR: encode_cursor(
+                        [
+                            getattr(last, self.opts.get_field(name).attname)
+                            for name in self.keyset
+                        ]
+                    )
+                },
+                remove=[PAGE_VAR],
+            )
+
+    def to_python(self, values: List[Any]) -> List[Any]:
+        if len(values) != len(self.keyset):
+            raise IncorrectLookupParameters(f"Invalid cursor {values}")
+        try:
+            return [
+                self.opts.get_field(name).to_python(value)
+                for name, value in zip(self.keyset, values)
+            ]
+        except ValidationError as error:
+            raise IncorrectLookupParameters(error)
+
+
+class KeysetPaginationMixin:
+    """Pagination for large lists: estimated counts and keyset pagination
+    on the fields listed in keyset, which should also be the (unique)
+    ordering of the admin.
+    """
+
+    keyset: Sequence[str] = ["id"]
+    paginator = EstimatedCountPaginator
+    # don't count the unfiltered rows either
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
@@ -0,0 +1,126 @@
+"""Moves participants to another session of the same exchange.
+
+The capacity is checked and the assignments are changed using a few
+set-based queries on the through table, within one transaction which
+locks the target session. The "assigned" mails of the moved persons are
+appended to the outbox once the change is committed.
+"""
+
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from typing import Any, Iterable, List, Set
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import transaction
+from django.db.models import Count, Q
+
+from registration.mails import get_mail, get_team_str
+from registration.models import ExchangeSession, Participation, Person
+from registration.outbox import build_message, write_mbox
+
+MAIL_TYPE = "assigned"
+
+
+class ReassignError(ValueError):
+    pass
+
+
+@dataclass
+class ReassignResult:
+    moved: int = 0
+    # already assigned to the target session
+    unchanged: int = 0
+    # the sessions the persons were moved from
+    sources: Set[Any] = field(default_factory=set)
+    mails: int = 0
+
+
+def outbox_path() -> str:
+    return getattr(settings, "OUTBOX_PATH", "outbox.mbox")
+
+
+def reassign(
+    person_pks: Iterable[Any], target: ExchangeSession, queue_mails: bool = True
+) -> ReassignResult:
+    """Assigns the persons to the target session, removing their other
+    assignments within the same exchange.
+
+    Args:
+        person_pks (Iterable[Any]): the persons to move
+        target (ExchangeSession): session to move them to
+        queue_mails (bool): append an "assigned" mail for each moved person
+            to the outbox
+
+    Raises:
+        ReassignError: when the target session doesn't have enough room
+
+    Returns:
+        ReassignResult: what was changed
+    """
+    person_pks = set(person_pks)
+    through = ExchangeSession.assigned.through
+    result = ReassignResult()
+
+    with transaction.atomic():
+        # concurrent moves to this session wait for this one
+        target = ExchangeSession.objects.select_for_update().get(pk=target.pk)
+        assigned = through.objects.filter(exchangesession=target).aggregate(
+            total=Count("id"),
+            present=ArrayAgg("person_id", filter=Q(person_id__in=person_pks)),
+        )
+        present = set(assigned["present"] or [])
+        moving = person_pks - present
+        capacity = target.participants_max * target.session_count
+        if assigned["total"] + len(moving) > capacity:
+            raise ReassignError(
+                f"{target} has room for {max(capacity - assigned['total'], 0)} "
+                f"more participants, not {len(moving)}"
+            )
+
+        others = through.objects.filter(
+            person_id__in=person_pks, exchangesession__exchange_id=target.exchange_id
+        ).exclude(exchangesession=target)
+        result.sources = set(others.values_list("exchangesession_id", flat=True))
+        others.delete()
+        through.objects.bulk_create(
+            [
+                through(exchangesession_id=target.pk, person_id=person_pk)
+                for person_pk in sorted(moving)
+            ]
+        )
+        Participation.objects.refresh(persons=person_pks)
+
+        result.moved = len(moving)
+        result.unchanged = len(present)
+        if queue_mails and moving:
+            messages = assigned_mails(target, moving)
+            result.mails = len(messages)
+            transaction.on_commit(lambda: write_mbox(outbox_path(), messages))
+
+    return result
+
+
+def assigned_mails(
+    session: ExchangeSession, person_pks: Iterable[Any]
+) -> List[EmailMessage]:
+    session = ExchangeSession.objects.for_display().get(pk=session.pk)
+    team = get_team_str()
+    messages = []
+    for person in (
+        Person.objects.select_related("user")
+        .filter(pk__in=person_pks)
+        .order_by("sort_name")
+    ):
+        mail = get_mail(MAIL_TYPE, person.language)
+        subject, text = mail.render(
+            {
+                "given_names": person.given_names,
+                "assigned": session.get_name_by_lang(person.language),
+                "team": team,
+            }
+        )
+        messages.append(
+            build_message(f"{person.full_name} <{person.email}>", subject, text)
+        )
+    return messages
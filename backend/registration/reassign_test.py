@@ -0,0 +1,90 @@
+import mailbox
+
+import pytest
+from django.contrib.auth.models import Group
+
+from registration.factories import add_department, add_person, add_session
+from registration.models import Participation
+from registration.reassign import ReassignError, reassign
+
+
+@pytest.fixture
+def outbox(world, tmp_path, settings):
+    Group.objects.create(name="Team")
+    settings.OUTBOX_PATH = str(tmp_path / "outbox.mbox")
+    return settings.OUTBOX_PATH
+
+
+def test_reassign(world, outbox, django_capture_on_commit_callbacks):
+    source = world["session"]
+    target = add_session(world["exchange"], add_department("music"))
+    persons = [add_person(f"person{i}") for i in range(3)]
+    source.assigned.add(*persons[:2])
+    target.assigned.add(persons[2])
+
+    with django_capture_on_commit_callbacks(execute=True):
+        result = reassign([person.pk for person in persons], target)
+
+    assert (result.moved, result.unchanged, result.mails) == (2, 1, 2)
+    assert result.sources == {source.pk}
+    assert set(target.assigned.all()) == set(persons)
+    assert not source.assigned.exists()
+    assert set(
+        Participation.objects.filter(session=target).values_list("person", flat=True)
+    ) == set(person.pk for person in persons)
+
+    box = mailbox.mbox(outbox)
+    assert sorted(message["To"] for message in box) == [
+        "person0 Test <person0@uu.nl>",
+        "person1 Test <person1@uu.nl>",
+    ]
+
+
+def test_reassign_capacity(world, outbox):
+    target = world["session"]
+    target.participants_max = 2
+    target.save()
+    persons = [add_person(f"person{i}") for i in range(3)]
+
+    with pytest.raises(ReassignError):
+        reassign([person.pk for person in persons], target)
+    assert not target.assigned.exists()
+
+
+def test_reassign_action(world, outbox, admin_client):
+    persons = [add_person(f"person{i}") for i in range(2)]
+    data = {
+        "action": "move_to_session",
+        "_selected_action": [person.pk for person in persons],
+    }
+    response = admin_client.post("/admin/registration/person/", data)
+    assert response.status_code == 200
+    assert b"Currently assigned to" in response.content
+
+    response = admin_client.post(
+        "/admin/registration/person/",
+        {**data, "apply": "Move", "session": world["session"].pk},
+    )
+    assert response.status_code == 302
+    assert set(world["session"].assigned.all()) == set(persons)
+
+
+def test_reassign_action_inactive(world, admin_client):
+    world["exchange"].active = False
+    world["exchange"].save()
+    person = add_person("person0")
+
+    response = admin_client.post(
+        "/admin/registration/person/",
+        {"action": "move_to_session", "_selected_action": [person.pk]},
+        follow=True,
+    )
+
+    assert response.status_code == 200
+    assert "There is no active exchange." in [
+        str(message) for message in response.context["messages"]
+    ]
+    response = admin_client.get(
+        "/admin/registration/exchangesession/capacity/", follow=True
+    )
+    assert response.redirect_chain[-1][0] == "/admin/registration/exchangesession/"
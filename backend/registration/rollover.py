@@ -0,0 +1,195 @@
+"""Rolls an exchange over to the next year by cloning its sessions.
+
+The sessions, their descriptions and organizers are copied using a few
+bulk queries within one transaction, regardless of the number of
+sessions.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple
+import datetime
+import re
+
+from django.db import transaction
+from django.db.models import Model, Q
+from django.db.models.query import QuerySet
+
+from registration.models import (
+    Exchange,
+    ExchangeDescription,
+    ExchangeSession,
+    ExchangeSessionDescription,
+)
+
+YEAR = re.compile(r"\b\d{4}\b")
+
+# the texts which can mention the years of the exchange
+DATE_FIELDS = {
+    ExchangeDescription: ["text"],
+    ExchangeSessionDescription: ["title", "subtitle", "intro", "program", "date"],
+}
+
+
+class RolloverError(ValueError):
+    pass
+
+
+@dataclass
+class CloneResult:
+    sessions: int = 0
+    descriptions: int = 0
+    organizers: int = 0
+
+
+def clone(obj: Model, **changes: Any) -> Model:
+    """An unsaved copy of an object, with the given fields changed"""
+    values = {
+        field.attname: getattr(obj, field.attname)
+        for field in obj._meta.concrete_fields
+        if not field.primary_key
+    }
+    values.update(changes)
+    return type(obj)(**values)
+
+
+def shift_years(obj: Model, source: Exchange, years: int) -> None:
+    """Moves the years of the source exchange mentioned in the texts of
+    the object, e.g. "15 maart 2024" becomes "15 maart 2025".
+    """
+
+    def shift(match: re.Match) -> str:
+        year = int(match.group(0))
+        if source.begin <= year <= source.end:
+            return str(year + years)
+        return match.group(0)
+
+    for name in DATE_FIELDS[type(obj)]:
+        setattr(obj, name, YEAR.sub(shift, getattr(obj, name)))
+
+
+def shift_date(date: datetime.date, years: int) -> datetime.date:
+    try:
+        return date.replace(year=date.year + years)
+    except ValueError:
+        # February 29th
+        return date.replace(year=date.year + years, day=28)
+
+
+def scale_capacity(session: ExchangeSession, capacity_factor: float) -> int:
+    return max(
+        session.participants_min, round(session.participants_max * capacity_factor)
+    )
+
+
+def clone_sessions(
+    sessions: QuerySet,
+    exchange: Exchange,
+    shift_dates: bool = False,
+    capacity_factor: float = 1.0,
+) -> CloneResult:
+    """Copies the sessions, their descriptions and organizers to an
+    exchange. The participants aren't copied.
+
+    Args:
+        sessions (QuerySet): the sessions to copy
+        exchange (Exchange): exchange to add the copies to
+        shift_dates (bool): move the years mentioned in the descriptions
+        capacity_factor (float): multiplies the maximum number of participants
+
+    Returns:
+        CloneResult: the number of copied objects
+    """
+    sessions = list(sessions.select_related("exchange").prefetch_related("description"))
+    organizers = ExchangeSession.organizers.through.objects.filter(
+        exchangesession__in=sessions
+    ).values_list("exchangesession_id", "person_id")
+
+    with transaction.atomic():
+        copies = ExchangeSession.objects.bulk_create(
+            [
+                clone(
+                    session,
+                    exchange_id=exchange.pk,
+                    participants_max=scale_capacity(session, capacity_factor),
+                )
+                for session in sessions
+            ]
+        )
+        copy_pks = {session.pk: copy.pk for session, copy in zip(sessions, copies)}
+
+        descriptions = []
+        for session in sessions:
+            for description in session.description.all():
+                copy = clone(description, exchange_id=copy_pks[session.pk])
+                if shift_dates:
+                    shift_years(
+                        copy, session.exchange, exchange.begin - session.exchange.begin
+                    )
+                descriptions.append(copy)
+        ExchangeSessionDescription.objects.bulk_create(descriptions)
+
+        through = ExchangeSession.organizers.through
+        organizer_copies = through.objects.bulk_create(
+            [
+                through(exchangesession_id=copy_pks[session_pk], person_id=person_pk)
+                for session_pk, person_pk in organizers
+            ]
+        )
+
+    return CloneResult(len(copies), len(descriptions), len(organizer_copies))
+
+
+def rollover(
+    source: Exchange,
+    years: int = 1,
+    enrollment_deadline: Optional[datetime.date] = None,
+    shift_dates: bool = False,
+    capacity_factor: float = 1.0,
+    activate: bool = False,
+) -> Tuple[Exchange, CloneResult]:
+    """Creates a new exchange with a copy of everything offered in the
+    source exchange.
+
+    Args:
+        source (Exchange): exchange to copy
+        years (int): number of years after the source exchange
+        enrollment_deadline (date, optional): defaults to the deadline of
+            the source exchange, moved by the same number of years
+        shift_dates (bool): move the years mentioned in the descriptions
+        capacity_factor (float): multiplies the maximum number of participants
+        activate (bool): make the new exchange the active one
+
+    Returns:
+        Tuple[Exchange, CloneResult]: the new exchange and the number of
+            copied objects
+    """
+    begin = source.begin + years
+    end = source.end + years
+    if Exchange.objects.filter(Q(begin=begin) | Q(end=end)).exists():
+        raise RolloverError(f"Exchange {begin}-{end} already exists")
+
+    with transaction.atomic():
+        exchange = Exchange.objects.create(
+            begin=begin,
+            end=end,
+            enrollment_deadline=enrollment_deadline
+            or shift_date(source.enrollment_deadline, years),
+            active=activate,
+        )
+
+        descriptions = []
+        for description in ExchangeDescription.objects.filter(exchange=source):
+            copy = clone(description, exchange_id=exchange.pk)
+            if shift_dates:
+                shift_years(copy, source, years)
+            descriptions.append(copy)
+        ExchangeDescription.objects.bulk_create(descriptions)
+
+        result = clone_sessions(
+            ExchangeSession.objects.filter(exchange=source).order_by("pk"),
+            exchange,
+            shift_dates=shift_dates,
+            capacity_factor=capacity_factor,
+        )
+
+    return exchange, result
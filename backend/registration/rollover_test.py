@@ -0,0 +1,57 @@
+import datetime
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from registration.factories import add_department, add_person, add_session
+from registration.models import Exchange, ExchangeDescription, ExchangeSession
+from registration.rollover import rollover
+
+
+def add_sessions(exchange: Exchange, count: int) -> None:
+    organizer = add_person(f"organizer{exchange.begin}{count}")
+    for i in range(count):
+        department = add_department(f"department{exchange.begin}{count}{i}")
+        session = add_session(exchange, department)
+        session.organizers.add(organizer)
+        session.description.update(date=f"1 maart {exchange.end}")
+
+
+def count_rollover(exchange: Exchange) -> int:
+    with CaptureQueriesContext(connection) as context:
+        rollover(exchange, shift_dates=True, capacity_factor=1.5)
+    return len(context.captured_queries)
+
+
+def test_rollover(db):
+    small = Exchange.objects.create(
+        begin=2020,
+        end=2021,
+        enrollment_deadline=datetime.date(2020, 2, 29),
+        active=False,
+    )
+    ExchangeDescription.objects.create(exchange=small, text="2020-2021", language="nl")
+    add_sessions(small, 2)
+    large = Exchange.objects.create(
+        begin=2030,
+        end=2031,
+        enrollment_deadline=datetime.date(2030, 1, 1),
+        active=False,
+    )
+    ExchangeDescription.objects.create(exchange=large, text="2030-2031", language="nl")
+    add_sessions(large, 6)
+
+    assert count_rollover(small) == count_rollover(large)
+
+    copy = Exchange.objects.get(begin=2021)
+    assert copy.enrollment_deadline == datetime.date(2021, 2, 28)
+    assert ExchangeDescription.objects.get(exchange=copy).text == "2021-2022"
+
+    sessions = ExchangeSession.objects.filter(exchange=copy).prefetch_related(
+        "description", "organizers"
+    )
+    assert len(sessions) == 2
+    for session in sessions:
+        assert session.participants_max == 15
+        assert len(session.organizers.all()) == 1
+        assert [d.date for d in session.description.all()] == ["1 maart 2022"] * 2
@@ -0,0 +1,387 @@
+"""Statistics about the participation in the exchanges over the years."""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
+
+from django.core.cache import cache
+from django.db.models import Count, Exists, F, OuterRef, Q, Window
+from django.db.models.functions import RowNumber
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from registration.models import (
+    Department,
+    DepartmentDescription,
+    Exchange,
+    ExchangeSession,
+    ExchangeSessionDescription,
+    Participation,
+    Person,
+    StatisticsVersion,
+)
+
+HISTORY_YEARS = "jaren"
+HISTORY_HOW_MANY = "hoeveelste_keer"
+ENROLLMENT_DEPT = "afdeling"
+ASSIGNED_CHOICE = "toegewezen"
+
+# the home department of participants without any affiliation
+UNKNOWN_AFFILIATION = "UNKNOWN AFFILIATION"
+
+# seconds; the cached statistics are replaced when the version changes
+STATISTICS_CACHE_TIMEOUT = 24 * 60 * 60
+
+STATISTICS = [
+    "enrollments",
+    "new_participants",
+    "retention",
+    "histogram",
+    "depts_histogram",
+    "department_flow",
+]
+
+ENROLLMENT_FIELDS = [
+    "id",
+    "count",
+    HISTORY_HOW_MANY,
+    HISTORY_YEARS,
+    ENROLLMENT_DEPT,
+    ASSIGNED_CHOICE,
+]
+
+
+def enrollments() -> Iterator[Dict[str, str]]:
+    """All the assignments over the years, read from the precomputed
+    participations using a single query.
+
+    Yields:
+        Dict[str, str]: a row per assignment, see ENROLLMENT_FIELDS
+    """
+    rows = (
+        Participation.objects.annotate(
+            how_many=Window(
+                RowNumber(),
+                partition_by=[F("person_id")],
+                order_by=[F("exchange__begin").asc(), F("session_id").asc()],
+            )
+        )
+        .order_by("exchange__begin", "session_id", "person_id")
+        .values_list(
+            "person_id",
+            "how_many",
+            "exchange__begin",
+            "exchange__end",
+            "affiliation",
+            "choice",
+        )
+    )
+    for person_id, how_many, begin, end, affiliation, choice in rows.iterator():
+        yield {
+            "id": person_id,
+            "count": 1,  # makes pivot tables easier to create
+            HISTORY_HOW_MANY: how_many,
+            HISTORY_YEARS: f"{begin}-{end}",
+            ENROLLMENT_DEPT: affiliation,
+            ASSIGNED_CHOICE: choice,
+        }
+
+
+def refresh_participations(rebuild: bool = False) -> None:
+    """Refreshes the participations of the active exchange and of any
+    exchange which hasn't been computed yet. The affiliations and names
+    of past exchanges are a snapshot of when they were computed, unless
+    everything is rebuilt.
+
+    Args:
+        rebuild (bool, optional): recompute all the exchanges
+    """
+    if rebuild:
+        Participation.objects.refresh()
+        return
+
+    assigned = ExchangeSession.assigned.through.objects.filter(
+        exchangesession__exchange=OuterRef("pk")
+    )
+    computed = Participation.objects.filter(exchange=OuterRef("pk"))
+    missing = Exists(assigned) & ~Exists(computed)
+    exchanges = set(
+        Exchange.objects.filter(Q(active=True) | missing).values_list(
+            "pk", flat=True
+        )
+    )
+    if exchanges:
+        Participation.objects.refresh(exchanges=exchanges)
+
+
+@receiver(m2m_changed, sender=ExchangeSession.assigned.through)
+def assigned_changed(sender, instance, action: str, reverse: bool, **kwargs):
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+
+    if reverse:
+        # instance is a person
+        Participation.objects.refresh(persons=[instance.pk])
+    else:
+        Participation.objects.refresh(sessions=[instance.pk])
+
+
+def refresh_active_exchange() -> None:
+    exchanges = set(Exchange.objects.filter(active=True).values_list("pk", flat=True))
+    if exchanges:
+        Participation.objects.refresh(exchanges=exchanges)
+
+
+@receiver(m2m_changed, sender=Person.departments.through)
+def departments_changed(sender, action: str, **kwargs):
+    # the affiliations of the active exchange follow the departments, those
+    # of past exchanges are what they were at that time
+    if action in ["post_add", "post_remove", "post_clear"]:
+        refresh_active_exchange()
+
+
+@receiver(post_save, sender=DepartmentDescription)
+@receiver(post_delete, sender=DepartmentDescription)
+def department_renamed(sender, **kwargs):
+    refresh_active_exchange()
+    # the names of the host departments are read when computing
+    StatisticsVersion.bump()
+
+
+@receiver(post_save, sender=Exchange)
+@receiver(post_delete, sender=Exchange)
+@receiver(post_delete, sender=ExchangeSession)
+@receiver(post_delete, sender=Person)
+def statistics_changed(sender, **kwargs):
+    # changes the years, or deletes participations without a refresh
+    StatisticsVersion.bump()
+
+
+@receiver(post_save, sender=ExchangeSessionDescription)
+@receiver(post_delete, sender=ExchangeSessionDescription)
+def session_renamed(sender, instance: ExchangeSessionDescription, **kwargs):
+    Participation.objects.refresh(sessions=[instance.exchange_id])
+
+
+@receiver(post_save, sender=Person)
+def affiliation_changed(sender, instance: Person, created: bool, **kwargs):
+    if created or instance.other_affiliation == getattr(
+        instance, "_loaded_affiliation", None
+    ):
+        return
+    instance._loaded_affiliation = instance.other_affiliation
+    Participation.objects.refresh(persons=[instance.pk])
+
+
+def get_statistics(name: str) -> Dict[str, List[Any]]:
+    """A statistic, derived from the participations. Cached until the
+    participations change, see StatisticsVersion.
+
+    Args:
+        name (str): one of STATISTICS
+
+    Raises:
+        KeyError: for an unknown statistic
+
+    Returns:
+        Dict[str, List[Any]]: fieldnames and rows
+    """
+    if name not in STATISTICS:
+        raise KeyError(name)
+
+    key = f"statistics:{name}:{StatisticsVersion.current()}"
+    statistic = cache.get(key)
+    if statistic is not None:
+        return statistic
+
+    if name == "department_flow":
+        fieldnames, rows = department_flow()
+    else:
+        # the others are derived from a single pass over the enrollments
+        history = EnrollmentHistory()
+        fieldnames, rows = ENROLLMENT_FIELDS, list(history.collect(enrollments()))
+        if name != "enrollments":
+            fieldnames, rows = {
+                "new_participants": history.new_participants_each_year,
+                "retention": history.retention,
+                "histogram": history.histogram,
+                "depts_histogram": history.depts_histogram,
+            }[name]()
+    statistic = {"fields": fieldnames, "rows": rows}
+    cache.set(key, statistic, STATISTICS_CACHE_TIMEOUT)
+    return statistic
+
+
+def department_flow() -> Tuple[List[str], List[Dict[str, str]]]:
+    """How many participants from each home department visited each host
+    department, per year. The home department is the affiliation the
+    participant had during that exchange. Counted by the database in one
+    grouped query.
+    """
+    names = {
+        department.pk: department.name
+        for department in Department.objects.for_display()
+    }
+
+    rows = [
+        {
+            HISTORY_YEARS: f"{begin}-{end}",
+            "from_dept": affiliation or UNKNOWN_AFFILIATION,
+            "to_dept": names[to_dept],
+            "count": count,
+        }
+        for begin, end, affiliation, to_dept, count in (
+            Participation.objects.values(
+                "exchange__begin",
+                "exchange__end",
+                "affiliation",
+                "session__department",
+            )
+            .annotate(count=Count("id"))
+            .values_list(
+                "exchange__begin",
+                "exchange__end",
+                "affiliation",
+                "session__department",
+                "count",
+            )
+        )
+    ]
+    rows.sort(key=lambda row: (row[HISTORY_YEARS], row["from_dept"], row["to_dept"]))
+    return [HISTORY_YEARS, "from_dept", "to_dept", "count"], rows
+
+
+@dataclass
+class Enrollment:
+    assigned_dept: str
+    from_dept: str
+
+
+@dataclass
+class EnrollmentHistory:
+    """Collects everything needed for the other statistics while
+    passing through the enrollments once.
+    """
+
+    per_year: Dict[str, Set[int]] = field(default_factory=dict)
+    per_year_enrollment: Dict[str, List[Enrollment]] = field(default_factory=dict)
+    participant_count: Dict[int, int] = field(default_factory=dict)
+
+    def collect(self, rows: Iterable[Dict[str, str]]) -> Iterator[Dict[str, str]]:
+        """Passes through the rows, while recording them"""
+        for row in rows:
+            self.add(row)
+            yield row
+
+    def add(self, row: Dict[str, str]) -> None:
+        years = row[HISTORY_YEARS]
+        participant_id = row["id"]
+        self.per_year.setdefault(years, set()).add(participant_id)
+        self.per_year_enrollment.setdefault(years, []).append(
+            Enrollment(row[ASSIGNED_CHOICE], row[ENROLLMENT_DEPT])
+        )
+        self.participant_count[participant_id] = row[HISTORY_HOW_MANY]
+
+    def new_participants_each_year(self) -> Tuple[List[str], List[Dict[str, str]]]:
+        return Retention(self.per_year).came_back()
+
+    def retention(self) -> Tuple[List[str], List[Dict[str, str]]]:
+        return Retention(self.per_year).cohorts()
+
+    def histogram(self) -> Tuple[List[str], List[Dict[str, str]]]:
+        # how many times do people participate over the years?
+        histogram: Dict[int, int] = {}
+        for count in self.participant_count.values():
+            histogram[count] = histogram.get(count, 0) + 1
+
+        rows = [
+            {"times": times, "count": count}
+            for times, count in sorted(histogram.items())
+        ]
+        return ["times", "count"], rows
+
+    def depts_histogram(self) -> Tuple[List[str], List[Dict[str, str]]]:
+        # how many different departments participated?
+        rows: List[Dict[str, str]] = []
+
+        for years, enrollments in self.per_year_enrollment.items():
+            assigned_depts: Set[str] = set()
+            from_depts: Set[str] = set()
+            for e in enrollments:
+                assigned_depts.add(e.assigned_dept)
+                from_depts.add(e.from_dept)
+
+            rows.append(
+                {
+                    HISTORY_YEARS: years,
+                    "assigned_depts": len(assigned_depts),
+                    "from_depts": len(from_depts),
+                }
+            )
+
+        return [HISTORY_YEARS, "assigned_depts", "from_depts"], rows
+
+
+class Retention:
+    """Records the years each participant took part in as a bitmask: bit i
+    is set when they participated in the i-th year. This way each
+    participant is only visited once, whatever the number of years.
+    """
+
+    def __init__(self, per_year: Dict[str, Iterable[int]]):
+        self.years = list(sorted(per_year.keys()))
+        self.masks: Dict[int, int] = {}
+        for i, years in enumerate(self.years):
+            bit = 1 << i
+            for participant_id in per_year[years]:
+                self.masks[participant_id] = self.masks.get(participant_id, 0) | bit
+
+    def came_back(self) -> Tuple[List[str], List[Dict[str, str]]]:
+        """Counts for each year how many participants are completely new
+        and for the others the first year they participated in.
+        """
+        all_previous_years = self.years[:-1]
+        counts = [[0] * len(self.years) for _ in self.years]
+        new_counts = [0] * len(self.years)
+
+        for mask in self.masks.values():
+            first = lowest_bit(mask)
+            new_counts[first] += 1
+            mask &= mask - 1
+            while mask:
+                counts[lowest_bit(mask)][first] += 1
+                mask &= mask - 1
+
+        fieldnames = [HISTORY_YEARS] + all_previous_years + ["completely_new"]
+        rows: List[Dict[str, str]] = []
+        for i, years in enumerate(self.years):
+            rows.append(
+                {
+                    HISTORY_YEARS: years,
+                    **dict(zip(all_previous_years, counts[i])),
+                    "completely_new": new_counts[i],
+                }
+            )
+
+        return fieldnames, rows
+
+    def cohorts(self) -> Tuple[List[str], List[Dict[str, str]]]:
+        """Retention matrix: for the participants who first took part in
+        a year (the cohort), how many of them participated in each year.
+        """
+        matrix = [[0] * len(self.years) for _ in self.years]
+
+        for mask in self.masks.values():
+            row = matrix[lowest_bit(mask)]
+            while mask:
+                row[lowest_bit(mask)] += 1
+                mask &= mask - 1
+
+        rows: List[Dict[str, str]] = []
+        for i, years in enumerate(self.years):
+            rows.append({"cohort": years, **dict(zip(self.years, matrix[i]))})
+
+        return ["cohort"] + self.years, rows
+
+
+def lowest_bit(mask: int) -> int:
+    return (mask & -mask).bit_length() - 1
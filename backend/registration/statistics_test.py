@@ -0,0 +1,237 @@
+import datetime
+import random
+
+import pytest
+
+from registration.factories import add_department, add_person, add_session
+from registration.models import (
+    Exchange,
+    ExchangeSessionDescription,
+    Participation,
+)
+from registration.statistics import (
+    HISTORY_YEARS,
+    UNKNOWN_AFFILIATION,
+    Retention,
+    department_flow,
+)
+from registration.reassign import reassign
+
+
+def test_participation_names(world):
+    sessions = [world["session"]]
+    for slug in ["music", "sports", "physics"]:
+        sessions.append(add_session(world["exchange"], add_department(slug)))
+    music, sports, physics = sessions[1:]
+    # falls back to the name of the session
+    music.description.filter(language="nl").delete()
+    # sorted by code point, like sorted()
+    music.description.filter(language="en").update(title="Zoo", subtitle="")
+    ExchangeSessionDescription.objects.create(
+        exchange=music,
+        title="Ábc",
+        subtitle="ünder",
+        intro="",
+        program="",
+        language="en",
+        date="",
+        location="",
+    )
+    sports.description.filter(language="nl").delete()
+    physics.description.all().delete()
+    for session in sessions:
+        session.assigned.add(world["person"])
+
+    choices = dict(Participation.objects.values_list("session", "choice"))
+
+    for session in sessions:
+        session.refresh_from_db()
+        assert choices[session.pk] == session.get_name_by_lang("nl")
+    assert choices[music.pk] == "2023-2024 Zoo / Ábc ( / ünder)"
+    assert choices[sports.pk] == "2023-2024 sports en (en)"
+
+
+def test_participation_affiliations(world):
+    past = Exchange.objects.create(
+        begin=2022,
+        end=2023,
+        enrollment_deadline=datetime.date(2022, 1, 1),
+        active=False,
+    )
+    past_session = add_session(past, world["department"])
+    person = add_person("participant")
+    person.departments.add(world["department"])
+    past_session.assigned.add(person)
+    world["session"].assigned.add(person)
+
+    other = add_department("music")
+    person.departments.set([other])
+    other.description.filter(language="nl").update(name="muziek")
+    other.description.get(language="en").save()
+
+    affiliations = dict(
+        Participation.objects.filter(person=person).values_list(
+            "exchange", "affiliation"
+        )
+    )
+    # only the active exchange follows the changes
+    assert affiliations == {
+        past.pk: "history en / history nl",
+        world["exchange"].pk: "music en / muziek",
+    }
+
+
+def test_department_flow(world):
+    music = add_department("music")
+    moved = add_person("moved")
+    moved.departments.add(music)
+    world["session"].assigned.add(moved, add_person("unaffiliated"))
+    # after the exchange
+    world["exchange"].active = False
+    world["exchange"].save()
+    moved.departments.set([world["department"]])
+
+    _, rows = department_flow()
+
+    assert rows == [
+        {
+            HISTORY_YEARS: "2023-2024",
+            "from_dept": UNKNOWN_AFFILIATION,
+            "to_dept": "history en / history nl",
+            "count": 1,
+        },
+        {
+            HISTORY_YEARS: "2023-2024",
+            "from_dept": "music en / music nl",
+            "to_dept": "history en / history nl",
+            "count": 1,
+        },
+    ]
+
+
+def test_statistics_view(world, admin_client, django_assert_num_queries):
+    url = "/api/statistics/enrollments/"
+    world["session"].assigned.add(world["person"])
+    response = admin_client.get(url)
+    assert response.status_code == 200
+    assert [row["id"] for row in response.json()["rows"]] == [world["person"].pk]
+
+    # cached: only reads the version, after the session and user
+    with django_assert_num_queries(3):
+        assert admin_client.get(url).json() == response.json()
+
+    # invalidated by the assignments
+    person = add_person("other")
+    world["session"].assigned.add(person)
+    assert [row["id"] for row in admin_client.get(url).json()["rows"]] == sorted(
+        [world["person"].pk, person.pk]
+    )
+    assert admin_client.get("/api/statistics/unknown/").status_code == 404
+
+
+def came_back_by_sets(per_year):
+    """The set-based calculation the bitmasks replaced"""
+    all_previous_years = list(sorted(per_year.keys()))[:-1]
+    rows = []
+    for i, years in enumerate(sorted(per_year.keys())):
+        new_count = 0
+        prev_years_counts = dict.fromkeys(all_previous_years, 0)
+        for p in per_year[years]:
+            for prev_years in all_previous_years[0:i]:
+                if p in per_year[prev_years]:
+                    prev_years_counts[prev_years] += 1
+                    break
+            else:
+                new_count += 1
+        rows.append(
+            {HISTORY_YEARS: years, **prev_years_counts, "completely_new": new_count}
+        )
+    return [HISTORY_YEARS] + all_previous_years + ["completely_new"], rows
+
+
+def cohorts_by_sets(per_year):
+    years = sorted(per_year.keys())
+    first = {}
+    for year in years:
+        for p in per_year[year]:
+            first.setdefault(p, year)
+    rows = [
+        {
+            "cohort": cohort,
+            **{
+                year: sum(1 for p in per_year[year] if first[p] == cohort)
+                for year in years
+            },
+        }
+        for cohort in years
+    ]
+    return ["cohort"] + years, rows
+
+
+def test_retention():
+    rng = random.Random(2024)
+    per_year = {
+        f"{year}-{year + 1}": set(rng.sample(range(60), rng.randint(0, 30)))
+        for year in range(2010, 2024)
+    }
+
+    retention = Retention(per_year)
+
+    assert retention.came_back() == came_back_by_sets(per_year)
+    assert retention.cohorts() == cohorts_by_sets(per_year)
+
+
+def test_participation_snapshot(world, tmp_path, settings):
+    settings.OUTBOX_PATH = str(tmp_path / "outbox.mbox")
+    past = Exchange.objects.create(
+        begin=2022,
+        end=2023,
+        enrollment_deadline=datetime.date(2022, 1, 1),
+        active=False,
+    )
+    person = add_person("participant")
+    person.departments.add(world["department"])
+    add_session(past, world["department"]).assigned.add(person)
+    person.departments.set([add_department("music")])
+
+    reassign([person.pk], world["session"], queue_mails=False)
+    Participation.objects.refresh(persons=[person.pk])
+
+    affiliations = dict(
+        Participation.objects.filter(person=person).values_list(
+            "exchange", "affiliation"
+        )
+    )
+    assert affiliations == {
+        past.pk: "history en / history nl",
+        world["exchange"].pk: "music en / music nl",
+    }
+
+
+def test_participation_follows_changes(world):
+    session = world["session"]
+    person = world["person"]
+    session.assigned.add(person)
+
+    person.other_affiliation = "Elsewhere"
+    person.save()
+    description = session.description.get(language="nl")
+    description.title = "Geschiedenis"
+    description.save()
+
+    assert Participation.objects.filter(person=person).values_list(
+        "affiliation", "choice"
+    ).get() == ("Elsewhere", "Geschiedenis nl")
+
+
+def test_participation_deferred_error(world, django_capture_on_commit_callbacks):
+    person = add_person("deferred")
+
+    # the test runs in a transaction, the refresh follows its commit
+    with django_capture_on_commit_callbacks(execute=True):
+        with pytest.raises(RuntimeError):
+            with Participation.objects.deferred():
+                world["session"].assigned.add(person)
+                raise RuntimeError
+
+    assert Participation.objects.filter(person=person).exists()
@@ -0,0 +1,11 @@
+import re
+import unicodedata
+
+
+def normalize(value: str) -> str:
+    """Lowercase, strip accents and collapse everything which is
+    not a letter or digit to a single space.
+    """
+    value = unicodedata.normalize("NFKD", value or "")
+    value = "".join(char for char in value if not unicodedata.combining(char))
+    return re.sub(r"[\W_]+", " ", value.lower()).strip()
@@ -1,19 +1,21 @@
 from datetime import datetime, timezone
-from typing import Dict, List
+from typing import List
 from registration.models import (
     Department,
-    DepartmentDescription,
     Exchange,
     ExchangeDescription,
     ExchangeSession,
-    ExchangeSessionDescription,
     Person,
     Registration,
-    Mail,
-    get_team_str,
     unique_username,
 )
-from rest_framework.decorators import api_view
+from registration.mails import get_mail, get_team_str
+from registration.demand import DEMAND_FIELDS, demand_report
+from registration.export import EXPORT_FORMATS, streaming_export
+from registration.statistics import get_statistics
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.request import Request
 from django.core.mail import send_mail
@@ -45,9 +47,13 @@ def current_exchange(request):
 def available_sessions(request):
     exchange = Exchange.objects.get(active=True)
     response = []
-    for session in ExchangeSession.objects.filter(exchange=exchange):
+    for session in (
+        ExchangeSession.objects.for_display()
+        .filter(exchange=exchange)
+        .prefetch_related("organizers__user")
+    ):
         organizers: List[Person] = list(session.organizers.all())
-        descriptions = list(ExchangeSessionDescription.objects.filter(exchange=session))
+        descriptions = list(session.description.all())
         response.append(
             {
                 "pk": session.pk,
@@ -81,7 +87,7 @@ def available_sessions(request):
 
 @api_view()
 def departments(request):
-    departments = Department.objects.all()
+    departments = Department.objects.for_display()
     response = []
     for department in departments:
         response.append(
@@ -93,15 +99,51 @@ def departments(request):
                         "text": description.description,
                         "language": description.language,
                     }
-                    for description in DepartmentDescription.objects.filter(
-                        department=department
-                    )
+                    for description in department.description.all()
                 ],
             }
         )
     return Response(response)
 
 
+@api_view()
+@permission_classes([IsAdminUser])
+def statistics(request, name: str):
+    try:
+        return Response(get_statistics(name))
+    except KeyError:
+        raise NotFound(f"Unknown statistic {name}")
+
+
+@api_view()
+@permission_classes([IsAdminUser])
+def demand(request):
+    return Response({"fields": DEMAND_FIELDS, "rows": demand_report()})
+
+
+@api_view()
+@permission_classes([IsAdminUser])
+def export_registrations(request, file_format: str):
+    # not named format, which would be used for content negotiation
+    if file_format not in EXPORT_FORMATS:
+        raise NotFound(f"Unknown format {file_format}")
+
+    begin = request.query_params.get("exchange")
+    try:
+        if begin is None:
+            exchange = Exchange.objects.get(active=True)
+        else:
+            exchange = Exchange.objects.get(begin=begin)
+    except (Exchange.DoesNotExist, ValueError):
+        raise NotFound(f"Unknown exchange {begin}")
+
+    return streaming_export(
+        Registration.objects.filter(exchange=exchange),
+        file_format,
+        f"registrations-{exchange}",
+    )
+
+
 @api_view(["POST"])
 def register(request: Request):
     email = request.data["email"].lower()
@@ -171,6 +213,9 @@ def register(request: Request):
     # registering again? replace any existing registrations on this exchange
     Registration.objects.filter(requestor=person, exchange=exchange).delete()
 
+    sessions = ExchangeSession.objects.for_display().in_bulk(
+        [sp["session"]["pk"] for sp in request.data["sessionPriorities"]]
+    )
     registrations: List[Registration] = []
     for sp in request.data["sessionPriorities"]:
         registration = Registration()
@@ -180,8 +225,7 @@ def register(request: Request):
         registration.date_time = datetime.now(timezone.utc)
         pk = sp["session"]["pk"]
         if pk != 0:
-            session = ExchangeSession.objects.get(pk=pk)
-            registration.session = session
+            registration.session = sessions[pk]
         registration.notes = request.data["notes"]
         registration.reason = request.data["reason"]
         registration.save()
@@ -204,14 +248,13 @@ def send_data(data, registrations: List[Registration], person: Person):
 
 
 def send_confirmation(data, registrations: List[Registration], person: Person):
-    mail = Mail.objects.get(type="confirm_registration", language=data["language"])
+    mail = get_mail("confirm_registration", data["language"])
+    subject, text = mail.render(
+        {"given_names": person.given_names, "team": get_team_str()}
+    )
     send_mail(
-        mail.subject,
-        format_text(
-            mail.text, {"given_names": person.given_names, "team": get_team_str()}
-        )
-        + "\n"
-        + format_data(data, registrations, person),
+        subject,
+        text + "\n" + format_data(data, registrations, person),
         "wisselwerking.gw@uu.nl",
         [person.email],
     )
@@ -234,10 +277,3 @@ Keuzes: {'; '.join(choices)}
 Opmerkingen: {data['notes']}
 Reden van deelname: {data['reason']}
 """
-
-
-def format_text(text: str, data: Dict[str, str]) -> str:
-    for key, value in data.items():
-        text = text.replace(f"{{{{{key}}}}}", value)
-
-    return text
@@ -4,6 +4,7 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
+    'django.contrib.postgres',
     'livereload',
     'django.contrib.staticfiles',
     'rest_framework',
@@ -12,6 +13,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'wisselwerking.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -39,3 +41,34 @@ USE_I18N = True
 USE_TZ = True
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Query and time budgets per view (name) or command, see
+# wisselwerking/instrumentation.py
+# (two queries of each request are used by the session and user)
+QUERY_BUDGETS = {
+    'registration.views.current_exchange': {'queries': 4},
+    'registration.views.departments': {'queries': 4},
+    'registration.views.demand': {'queries': 10},
+    'command:rollover': {'queries': 20},
+    'command:import_catalogue': {'queries': 25},
+}
+# raise instead of logging a warning when over budget, e.g. in the tests
+QUERY_BUDGET_STRICT = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # only the requests and commands over budget; use DEBUG to log all
+        'wisselwerking.instrumentation': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
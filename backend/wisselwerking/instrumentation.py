@@ -0,0 +1,183 @@
+"""Measures the queries and time used by each request or command.
+
+The number of queries, the time spent in the database, the total time
+and the slowest query are logged as a JSON line, and added to the
+response headers in debug mode. The line is logged at DEBUG level,
+unless the budget is exceeded. A budget can be configured per view or
+command in QUERY_BUDGETS, e.g.
+
+    QUERY_BUDGETS = {
+        "registration.views.available_sessions": {"queries": 5},
+        "command:import_catalogue": {"queries": 20, "total_time": 10},
+    }
+
+using the view name of the URL (or the path of the view function) as
+key. Exceeding a budget logs the line as a warning; with
+QUERY_BUDGET_STRICT it raises BudgetExceeded instead, which makes the
+tests fail.
+"""
+
+from contextlib import ExitStack, contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# the slowest query is logged up to this length
+MAX_SQL_LENGTH = 1000
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+@dataclass
+class Budget:
+    queries: Optional[int] = None
+    # seconds
+    db_time: Optional[float] = None
+    total_time: Optional[float] = None
+
+
+@dataclass
+class Metrics:
+    name: str
+    queries: int = 0
+    # seconds
+    db_time: float = 0.0
+    total_time: float = 0.0
+    slowest_time: float = 0.0
+    slowest_sql: str = ""
+
+    def __call__(self, execute, sql, params, many, context):
+        """Wraps the execution of each query, see connection.execute_wrapper()"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += duration
+            if duration > self.slowest_time:
+                self.slowest_time = duration
+                # the parameters are left out, these could be personal data
+                self.slowest_sql = sql[:MAX_SQL_LENGTH]
+
+    def exceeds(self, budget: Budget) -> List[str]:
+        """The limits of the budget which have been exceeded"""
+        return [
+            f"{limit} {getattr(self, limit):g} > {getattr(budget, limit):g}"
+            for limit in ["queries", "db_time", "total_time"]
+            if getattr(budget, limit) is not None
+            and getattr(self, limit) > getattr(budget, limit)
+        ]
+
+
+def get_budget(name: str) -> Optional[Budget]:
+    budget = getattr(settings, "QUERY_BUDGETS", {}).get(name)
+    if budget is None:
+        return None
+    return Budget(**budget)
+
+
+def report(metrics: Metrics, budget: Optional[Budget] = None) -> None:
+    """Logs the metrics and checks them against the budget.
+
+    Args:
+        metrics (Metrics): what was measured
+        budget (Budget, optional): defaults to the configured budget
+
+    Raises:
+        BudgetExceeded: in strict mode, when over budget
+    """
+    data: Dict[str, Any] = asdict(metrics)
+    if budget is None:
+        budget = get_budget(metrics.name)
+    exceeded = [] if budget is None else metrics.exceeds(budget)
+    if not exceeded:
+        logger.debug(json.dumps(data), extra={"metrics": data})
+        return
+
+    message = f"{metrics.name} exceeded its budget: {', '.join(exceeded)}"
+    if getattr(settings, "QUERY_BUDGET_STRICT", False):
+        raise BudgetExceeded(message)
+    logger.warning(f"{message} {json.dumps(data)}", extra={"metrics": data})
+
+
+@contextmanager
+def instrument(name: str, budget: Optional[Budget] = None) -> Iterator[Metrics]:
+    """Measures the queries on all the databases within the block, e.g.
+
+        with instrument("command:assign"):
+            ...
+
+    or within a function, such as the handle() of a command:
+
+        @instrument("command:history")
+        def handle(self, *args, **options):
+            ...
+
+    The name can still be changed within the block; it is used to look up
+    the budget afterwards.
+
+    Args:
+        name (str): what is measured
+        budget (Budget, optional): defaults to the configured budget
+
+    Yields:
+        Metrics: the metrics, complete after the block
+    """
+    metrics = Metrics(name)
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(metrics))
+        yield metrics
+    metrics.total_time = time.perf_counter() - start
+
+    report(metrics, budget)
+
+
+class InstrumentationMiddleware:
+    """Measures each request. The headers are only added in debug mode.
+    A streaming response is measured until all its content has been sent,
+    so it doesn't get any headers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        measuring = ExitStack()
+        metrics = measuring.enter_context(instrument(request.path))
+        with measuring:
+            response = self.get_response(request)
+            if request.resolver_match is not None:
+                metrics.name = request.resolver_match.view_name
+            if response.streaming:
+                # moves the end of the measurement to the end of the content
+                response.streaming_content = measure_content(
+                    response.streaming_content, measuring.pop_all()
+                )
+                return response
+
+        if settings.DEBUG:
+            response["X-Query-Count"] = str(metrics.queries)
+            response["X-DB-Time"] = f"{metrics.db_time * 1000:.1f}ms"
+            response["X-Total-Time"] = f"{metrics.total_time * 1000:.1f}ms"
+            response["Server-Timing"] = (
+                f"db;dur={metrics.db_time * 1000:.1f}, "
+                f"total;dur={metrics.total_time * 1000:.1f}"
+            )
+        return response
+
+
+def measure_content(content: Iterable[bytes], measuring: ExitStack) -> Iterator[bytes]:
+    with measuring:
+        yield from content
@@ -0,0 +1,76 @@
+import datetime
+import logging
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+
+from registration.models import Exchange
+from wisselwerking.instrumentation import Budget, BudgetExceeded, instrument
+
+
+def test_instrument(db):
+    with instrument("test") as metrics:
+        User.objects.count()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_sleep(0.01)")
+
+    assert metrics.queries == 2
+    assert metrics.db_time >= 0.01
+    assert metrics.total_time >= metrics.db_time
+    assert "pg_sleep" in metrics.slowest_sql
+
+
+def test_budget(db, settings, caplog):
+    settings.QUERY_BUDGETS = {"test": {"queries": 1}}
+    with pytest.raises(BudgetExceeded):
+        with instrument("test"):
+            User.objects.count()
+            User.objects.count()
+
+    settings.QUERY_BUDGET_STRICT = False
+    caplog.clear()
+    with caplog.at_level(logging.DEBUG, logger="wisselwerking.instrumentation"):
+        with instrument("test", Budget(queries=2)):
+            User.objects.count()
+            User.objects.count()
+        with instrument("test", Budget(queries=1)):
+            User.objects.count()
+            User.objects.count()
+
+    assert [record.levelname for record in caplog.records] == ["DEBUG", "WARNING"]
+    assert [record.metrics["queries"] for record in caplog.records] == [2, 2]
+    assert "queries 2 > 1" in caplog.records[1].message
+
+
+def test_instrument_command(db, settings):
+    settings.QUERY_BUDGETS = {"command:duplicates": {"queries": 0}}
+
+    with pytest.raises(BudgetExceeded):
+        call_command("duplicates", stdout=StringIO())
+
+
+def test_middleware(db, client, settings):
+    settings.DEBUG = True
+    response = client.get("/api/departments/")
+    assert response["X-Query-Count"] == "1"
+    assert response["Server-Timing"].startswith("db;dur=")
+
+    settings.QUERY_BUDGETS = {"registration.views.departments": {"queries": 0}}
+    with pytest.raises(BudgetExceeded):
+        client.get("/api/departments/")
+
+
+def test_middleware_streaming(admin_client, settings):
+    Exchange.objects.create(
+        begin=2023, end=2024, enrollment_deadline=datetime.date(2023, 1, 1), active=True
+    )
+    # the session, user and exchange
+    settings.QUERY_BUDGETS = {"registration.views.export_registrations": {"queries": 3}}
+    response = admin_client.get("/api/export/registrations.csv")
+    assert response.status_code == 200
+    # only the content reads the registrations
+    with pytest.raises(BudgetExceeded):
+        b"".join(response.streaming_content)
@@ -91,3 +91,7 @@ STATIC_URL = '/static/'
 
 STATICFILES_DIRS = []
 PROXY_FRONTEND = None
+
+# mbox file to which the mails queued from the admin are appended,
+# see the send_outbox command
+OUTBOX_PATH = os.path.join(BASE_DIR, 'outbox.mbox')
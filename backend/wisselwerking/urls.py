@@ -20,7 +20,15 @@ from django.contrib import admin
 from django.views.generic import RedirectView
 
 from rest_framework import routers
-from registration.views import available_sessions, current_exchange, departments, register
+from registration.views import (
+    available_sessions,
+    current_exchange,
+    demand,
+    departments,
+    export_registrations,
+    register,
+    statistics,
+)
 
 from .index import index
 from .proxy_frontend import proxy_frontend
@@ -40,8 +48,11 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/available_sessions/", available_sessions),
     path("api/current_exchange/", current_exchange),
+    path("api/demand/", demand),
     path("api/departments/", departments),
+    path("api/export/registrations.<str:file_format>", export_registrations),
     path("api/register/", register),
+    path("api/statistics/<str:name>/", statistics),
     path("api/", include(api_router.urls)),
     path(
         "api-auth/",